@@ -0,0 +1,166 @@
+"""
+长截图捕获流程基准测试（无界面）
+
+使用合成滚动文档代替真实屏幕和鼠标滚轮，在当前线程中运行完整的
+滚动 → 捕获 → 到底检测 → 拼接流程，报告捕获帧率和与真实结果的拼接误差。
+
+用法:
+    python benchmarks/bench_capture.py [--height 4000] [--viewport 600] [--step 150] [--fixed-step]
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+# 添加项目根目录到 Python 路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.core.capture_backend import (
+    SyntheticDocument, SyntheticFrameSource, SyntheticScrollDriver, generate_reference_document
+)
+from src.core.capture_profiles import CaptureProfileStore
+from src.core.long_screenshot import LongScreenshotCapture
+
+
+def stitch_accuracy(result, truth, frame_offsets, grab_positions, ignore_right=0):
+    """
+    计算拼接结果与真实结果的差异
+
+    Args:
+        ignore_right: 计算像素误差时忽略最右侧的列数（合成的滚动条不在真实结果中）
+
+    Returns:
+        包含高度误差、偏移误差和像素误差的字典
+    """
+    rows = min(len(result), len(truth))
+    if ignore_right:
+        result, truth = result[:, :-ignore_right], truth[:, :-ignore_right]
+    pixel_error = float(np.mean(np.abs(result[:rows].astype(np.int16) - truth[:rows]))) if rows else 0.0
+
+    offset_errors = []
+    if len(frame_offsets) == len(grab_positions):
+        offset_errors = [abs(a - b) for a, b in zip(frame_offsets, grab_positions)]
+
+    return {
+        'height_error': len(result) - len(truth),
+        'max_offset_error': max(offset_errors) if offset_errors else None,
+        'mean_pixel_error': pixel_error,
+    }
+
+
+def make_bar(height, width, label, background, color):
+    """生成带文字的固定工具栏图像，用于模拟页眉/页脚"""
+    bar = np.full((height, width, 3), background, dtype=np.uint8)
+    cv2.putText(bar, label, (10, height * 2 // 3), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 1, cv2.LINE_AA)
+    cv2.line(bar, (0, height - 1), (width, height - 1), color, 1)
+    return bar
+
+
+def main():
+    parser = argparse.ArgumentParser(description="长截图捕获流程基准测试（合成后端）")
+    parser.add_argument('--height', type=int, default=4000, help="参考文档高度")
+    parser.add_argument('--width', type=int, default=800, help="参考文档宽度")
+    parser.add_argument('--viewport', type=int, default=600, help="视口高度")
+    parser.add_argument('--step', type=int, default=150, help="每格滚轮滚动的像素数")
+    parser.add_argument('--latency', type=float, default=0.0, help="滚动后的渲染延迟（秒）")
+    parser.add_argument('--noise', type=float, default=0.0, help="画面噪声标准差")
+    parser.add_argument('--lazy-block', type=int, default=0, help="延迟加载的内容块高度")
+    parser.add_argument('--lazy-delay', type=float, default=0.0, help="延迟加载时间（秒）")
+    parser.add_argument('--remote', action='store_true', help="模拟远程桌面窗口")
+    parser.add_argument('--fixed-step', action='store_true', help="每次固定滚动一格（与自适应步长对比）")
+    parser.add_argument('--smooth', type=float, default=0.0, help="平滑滚动动画时长（秒）")
+    parser.add_argument('--fixed-wait', action='store_true', help="使用固定等待时间代替画面稳定性探测（对比用）")
+    parser.add_argument('--store', choices=['incremental', 'strips', 'strips-png', 'full'], default='incremental',
+                        help="帧的保存方式：增量拼接、只保存新条带（可PNG压缩）或保存全部完整帧")
+    parser.add_argument('--trace-alloc', action='store_true', help="用 tracemalloc 统计每帧分配的字节数")
+    parser.add_argument('--header', type=int, default=0, help="固定页眉高度")
+    parser.add_argument('--footer', type=int, default=0, help="固定页脚高度")
+    parser.add_argument('--no-sticky', action='store_true', help="不检测固定的页眉/页脚（对比用）")
+    parser.add_argument('--record', help="把捕获的帧录制到会话文件（.npz），可用 replay_session.py 回放")
+    parser.add_argument('--telemetry', help="把各阶段耗时保存为 JSON")
+    parser.add_argument('--trace', help="把各阶段耗时保存为 Chrome 跟踪事件文件（chrome://tracing 或 Perfetto）")
+    parser.add_argument('--verbose', action='store_true', help="打印每帧的详细日志和异常堆栈")
+    parser.add_argument('--scrollbar', type=int, default=0, help="在内容右侧显示该宽度的滚动条")
+    parser.add_argument('--no-scrollbar-detect', action='store_true', help="不识别滚动条（对比用）")
+    parser.add_argument('--profiles', help="按程序学习的捕获参数文件（JSON），重复运行时使用上次学到的参数")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO, format='%(message)s')
+
+    reference = generate_reference_document(args.height, args.width)
+    document = SyntheticDocument(
+        reference, args.viewport,
+        pixels_per_notch=args.step,
+        render_latency=args.latency,
+        noise=args.noise,
+        lazy_load_block=args.lazy_block,
+        lazy_load_delay=args.lazy_delay,
+        scroll_duration=args.smooth,
+        scrollbar_width=args.scrollbar,
+        header=make_bar(args.header, args.width, "Toolbar", (60, 60, 60), (230, 230, 230)) if args.header else None,
+        footer=make_bar(args.footer, args.width, "Status bar", (225, 225, 225), (40, 40, 40)) if args.footer else None,
+    )
+    capture = LongScreenshotCapture(
+        SyntheticFrameSource(document),
+        SyntheticScrollDriver(document, remote_desktop=args.remote,
+                              application=('SyntheticDocument', 'bench_capture.exe'))
+    )
+    if args.fixed_step:
+        capture.scroll_controller.max_notches = 1
+    if args.fixed_wait:
+        capture.stabilize_frames = False
+    if args.no_sticky:
+        capture.detect_sticky = False
+    if args.no_scrollbar_detect:
+        capture.detect_scrollbar = False
+    capture.record_session_path = args.record
+    if args.profiles:
+        capture.profile_store = CaptureProfileStore(args.profiles)
+    if args.store != 'incremental':
+        capture.incremental_stitching = False
+        capture.compact_frames = args.store != 'full'
+        capture.compress_frames = args.store == 'strips-png'
+
+    if args.trace_alloc:
+        tracemalloc.start()
+    start = time.perf_counter()
+    result = capture.run_headless()
+    elapsed = time.perf_counter() - start
+    tracemalloc.stop()
+
+    frames = len(document.grab_positions)
+    accuracy = stitch_accuracy(result, document.ground_truth(),
+                               capture.frame_offsets, document.grab_positions, args.scrollbar)
+
+    print("=" * 60)
+    print(f"帧数: {frames}, 总耗时: {elapsed:.2f} 秒, 帧率: {frames / elapsed:.2f} 帧/秒")
+    print(f"结果尺寸: {result.shape}, 真实尺寸: {document.ground_truth().shape}")
+    print(f"高度误差: {accuracy['height_error']} 像素, 最大偏移误差: {accuracy['max_offset_error']} 像素")
+    print(f"平均像素误差: {accuracy['mean_pixel_error']:.3f}")
+    stats = capture.capture_stats()
+    print(f"每输出像素帧数: {stats['frames_per_output_pixel']:.5f}, 估计每格像素: {stats['pixels_per_notch']}, "
+          f"低置信度匹配: {stats['low_confidence_matches']}")
+    print(f"帧存储峰值: {stats['frame_store_peak_bytes'] / 1024 / 1024:.1f} MB, "
+          f"每帧抓取到可用: {stats['mean_grab_to_ready_ms']:.1f} 毫秒")
+    if stats['mean_bytes_allocated'] is not None:
+        print(f"每帧分配: {stats['mean_bytes_allocated'] / 1024 / 1024:.2f} MB")
+    if stats['mean_settle_time'] is not None:
+        print(f"平均画面稳定时间: {stats['mean_settle_time'] * 1000:.0f} 毫秒")
+    if stats['estimated_document_height'] is not None:
+        print(f"滚动条估计的文档高度: {stats['estimated_document_height']} 像素, 真实高度: {len(reference)} 像素")
+    print("-" * 60)
+    print(f"{'阶段':<12}{'次数':>8}{'总计(ms)':>12}{'平均(ms)':>12}{'P95(ms)':>12}{'最大(ms)':>12}")
+    for name, phase in sorted(stats['phases'].items(), key=lambda item: -item[1]['total_ms']):
+        print(f"{name:<12}{phase['count']:>8}{phase['total_ms']:>12.1f}{phase['mean_ms']:>12.2f}"
+              f"{phase['p95_ms']:>12.2f}{phase['max_ms']:>12.2f}")
+    if args.telemetry:
+        print(f"阶段耗时已保存到: {capture.telemetry.export_json(args.telemetry)}")
+    if args.trace:
+        print(f"跟踪文件已保存到: {capture.telemetry.export_chrome_trace(args.trace)}")
+
+
+if __name__ == "__main__":
+    main()
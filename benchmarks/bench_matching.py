@@ -0,0 +1,85 @@
+"""
+帧间重叠匹配基准测试
+
+在合成滚动文档上生成一组连续帧，比较原来的全彩色整帧模板匹配、
+灰度金字塔由粗到细匹配和行签名对齐的每帧耗时和偏移误差。
+
+用法:
+    python benchmarks/bench_matching.py [--height 8000] [--width 1200] [--viewport 900] [--step 150]
+"""
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+# 添加项目根目录到 Python 路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.core.capture_backend import SyntheticDocument, generate_reference_document
+from src.core.stitching import PyramidMatcher, RowSignatureMatcher
+
+
+def legacy_find_best_match(prev_frame, curr_frame, search_height):
+    """原来的 find_best_match：上一帧底部条带在当前整帧上做全彩色模板匹配"""
+    h = prev_frame.shape[0]
+    prev_bottom = prev_frame[-search_height:, :]
+    result = cv2.matchTemplate(curr_frame, prev_bottom, cv2.TM_CCOEFF_NORMED)
+    _, _, _, max_loc = cv2.minMaxLoc(result)
+    offset = max(0, min(max_loc[1], h - search_height))
+    return h - search_height - offset
+
+
+def capture_frames(args):
+    """滚动合成文档并抓取每一帧，返回帧列表和每帧的真实位置"""
+    reference = generate_reference_document(args.height, args.width)
+    document = SyntheticDocument(reference, args.viewport, pixels_per_notch=args.step, noise=args.noise)
+    frames = [document.render()]
+    while document.displayed_position < document.max_position:
+        document.scroll(-120)
+        frames.append(document.render())
+    return frames, document.grab_positions
+
+
+def run(name, match, frames, positions):
+    """对相邻帧逐对匹配，返回每帧耗时（毫秒）和最大偏移误差"""
+    errors = []
+    start = time.perf_counter()
+    for i in range(1, len(frames)):
+        distance = match(frames[i - 1], frames[i])
+        errors.append(abs(distance - (positions[i] - positions[i - 1])))
+    elapsed = (time.perf_counter() - start) * 1000 / (len(frames) - 1)
+    print(f"{name:<24} {elapsed:8.2f} ms/帧   最大偏移误差: {max(errors):.2f} 像素")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="帧间重叠匹配基准测试")
+    parser.add_argument('--height', type=int, default=8000, help="参考文档高度")
+    parser.add_argument('--width', type=int, default=1200, help="参考文档宽度")
+    parser.add_argument('--viewport', type=int, default=900, help="视口高度")
+    parser.add_argument('--step', type=int, default=150, help="每格滚轮滚动的像素数")
+    parser.add_argument('--noise', type=float, default=0.0, help="画面噪声标准差")
+    args = parser.parse_args()
+
+    frames, positions = capture_frames(args)
+    search_height = min(args.viewport // 3, 200)
+    print(f"帧数: {len(frames)}, 帧尺寸: {frames[0].shape}, 匹配条带高度: {search_height}")
+    print("-" * 60)
+
+    legacy = run("原实现（全彩色整帧）", lambda a, b: legacy_find_best_match(a, b, search_height),
+                 frames, positions)
+    matcher = PyramidMatcher()
+    pyramid = run("灰度金字塔（由粗到细）", lambda a, b: matcher.match(a, b, search_height)[0],
+                  frames, positions)
+    print(f"匹配加速: {legacy / pyramid:.1f}x")
+    if args.noise == 0:
+        # 有噪声时行签名无法对齐，实际捕获中会回退到模板匹配
+        row_matcher = RowSignatureMatcher()
+        rows = run("行签名", lambda a, b: row_matcher.match(a, b)[0], frames, positions)
+        print(f"匹配加速: {legacy / rows:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+选区遮罩绘制基准测试
+
+在离屏的全屏大小窗口中模拟拖动选区和捕获进度更新，比较两种绘制方式每帧的耗时：
+    full: 原来的做法，每次重绘整个窗口，文字每次按四个方向描边绘制
+    damage: 只重绘新旧选区之间变化的区域和标签，描边文字使用缓存的图像
+耗时包括 paintEvent 和写入窗口后备缓冲区，不包括系统合成到屏幕的时间。
+
+用法:
+    QT_QPA_PLATFORM=offscreen python benchmarks/bench_overlay.py [--width 3840] [--height 2160] [--moves 200]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from PyQt6.QtCore import Qt, QRect
+from PyQt6.QtGui import QPainter, QColor, QPen
+from PyQt6.QtWidgets import QApplication, QWidget
+
+# 添加项目根目录到 Python 路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.core.telemetry import CaptureTelemetry, PHASE_OVERLAY_PAINT
+from src.ui.selection_overlay import SelectionOverlayPainter, selection_damage, label_rect
+
+
+def paint_full(painter, widget_rect, select_rect, capturing, progress_text):
+    """原来的 TransparentWindow.paintEvent：填充整个窗口，文字描边每次重新绘制"""
+    painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+    if capturing:
+        painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_Clear)
+        painter.fillRect(widget_rect, Qt.GlobalColor.transparent)
+        painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_SourceOver)
+    else:
+        painter.fillRect(widget_rect, QColor(0, 0, 0, 100))
+        painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_Clear)
+        painter.fillRect(select_rect, Qt.GlobalColor.transparent)
+        painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_SourceOver)
+    pen = QPen()
+    pen.setColor(QColor(0, 255, 0))
+    pen.setWidth(2)
+    pen.setStyle(Qt.PenStyle.DashLine)
+    painter.setPen(pen)
+    painter.drawRect(select_rect)
+    text = progress_text if capturing else f"{select_rect.width()} × {select_rect.height()}"
+    font = painter.font()
+    font.setPointSize(10)
+    painter.setFont(font)
+    text_rect = QRect(select_rect.x(), select_rect.y() - 25, 240, 20)
+    painter.setPen(QColor(0, 0, 0))
+    for dx in [-1, 1]:
+        for dy in [-1, 1]:
+            painter.drawText(text_rect.adjusted(dx, dy, dx, dy), Qt.AlignmentFlag.AlignLeft, text)
+    painter.setPen(QColor(255, 255, 255))
+    painter.drawText(text_rect, Qt.AlignmentFlag.AlignLeft, text)
+
+
+class OverlayWidget(QWidget):
+    """与 TransparentWindow 相同的绘制，不依赖 Win32"""
+
+    def __init__(self, width, height, mode):
+        super().__init__()
+        self.setAttribute(Qt.WidgetAttribute.WA_TranslucentBackground)
+        self.setGeometry(0, 0, width, height)
+        self.mode = mode
+        self.overlay = SelectionOverlayPainter()
+        self.telemetry = CaptureTelemetry()
+        self.select_rect = None
+        self.capturing = False
+        self.progress_text = None
+
+    def paintEvent(self, event):
+        with self.telemetry.phase(PHASE_OVERLAY_PAINT):
+            painter = QPainter(self)
+            if self.mode == 'full':
+                if self.select_rect is not None:
+                    paint_full(painter, self.rect(), self.select_rect, self.capturing, self.progress_text)
+                else:
+                    painter.fillRect(self.rect(), QColor(0, 0, 0, 100))
+            elif self.capturing:
+                self.overlay.paint_capturing(painter, event.region(), self.select_rect, self.progress_text)
+            else:
+                self.overlay.paint_selecting(painter, event.region(), self.select_rect)
+            painter.end()
+
+    def move_selection(self, rect):
+        previous = self.select_rect
+        self.select_rect = rect
+        if self.mode == 'full':
+            self.repaint()
+        else:
+            self.repaint(selection_damage(previous, rect))
+
+    def set_progress(self, text):
+        self.progress_text = text
+        if self.mode == 'full':
+            self.repaint()
+        else:
+            self.repaint(label_rect(self.select_rect))
+
+
+def drag_path(width, height, moves, seed=0):
+    """从屏幕左上部拖到右下部的鼠标轨迹，每步移动几到几十像素"""
+    rng = np.random.default_rng(seed)
+    start = (width // 10, height // 10)
+    steps = rng.integers(2, 40, size=(moves, 2))
+    points = np.minimum(np.cumsum(steps, axis=0) + start, (width - 1, height - 1))
+    return start, [(int(x), int(y)) for x, y in points]
+
+
+def run(mode, width, height, moves):
+    widget = OverlayWidget(width, height, mode)
+    widget.show()
+    QApplication.processEvents()
+    widget.repaint()
+
+    # 拖动选区
+    start, path = drag_path(width, height, moves)
+    widget.telemetry.reset()
+    wall = []
+    for x, y in path:
+        rect = QRect(min(start[0], x), min(start[1], y), abs(x - start[0]), abs(y - start[1]))
+        begin = time.perf_counter()
+        widget.move_selection(rect)
+        wall.append((time.perf_counter() - begin) * 1000)
+    drag = widget.telemetry.summary()[PHASE_OVERLAY_PAINT]
+
+    # 捕获时的进度更新
+    widget.capturing = True
+    widget.repaint()
+    widget.telemetry.reset()
+    for i in range(moves):
+        widget.set_progress(f"截图进度: {i}/{moves}")
+    progress = widget.telemetry.summary()[PHASE_OVERLAY_PAINT]
+    widget.close()
+    return drag, np.array(wall), progress
+
+
+def main():
+    parser = argparse.ArgumentParser(description="选区遮罩绘制基准测试")
+    parser.add_argument('--width', type=int, default=3840)
+    parser.add_argument('--height', type=int, default=2160)
+    parser.add_argument('--moves', type=int, default=200, help="拖动时的鼠标移动次数")
+    parser.add_argument('--refresh', type=float, default=60.0, help="屏幕刷新率（Hz）")
+    args = parser.parse_args()
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    refresh_ms = 1000 / args.refresh
+    print(f"窗口 {args.width}x{args.height}，拖动 {args.moves} 步，刷新间隔 {refresh_ms:.1f} ms")
+    print(f"{'方式':<8}{'阶段':<8}{'中位数ms':>10}{'95分位ms':>10}{'最长ms':>10}{'含刷新p95':>11}")
+    failed = False
+    for mode in ('full', 'damage'):
+        drag, wall, progress = run(mode, args.width, args.height, args.moves)
+        print(f"{mode:<8}{'拖动':<8}{drag['p50_ms']:>10.2f}{drag['p95_ms']:>10.2f}{drag['max_ms']:>10.2f}"
+              f"{np.percentile(wall, 95):>11.2f}")
+        print(f"{mode:<8}{'进度':<8}{progress['p50_ms']:>10.2f}{progress['p95_ms']:>10.2f}{progress['max_ms']:>10.2f}")
+        if mode == 'damage' and np.percentile(wall, 95) > refresh_ms:
+            failed = True
+    if failed:
+        print("局部重绘的95分位耗时超过刷新间隔")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
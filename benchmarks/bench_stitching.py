@@ -0,0 +1,333 @@
+"""
+拼接基准测试套件（已知真实偏移）
+
+从高参考图像按已知的每帧位置生成帧序列，包括若干困难情况：重复的代码行、大段空白、
+固定的页眉/页脚、远程桌面的 JPEG 压缩失真、平滑滚动的亚像素偏移和运动模糊。
+每个序列通过回放帧来源交给完整的捕获流程（到底检测 → find_best_match → stitch_images），报告：
+偏移误差、接缝附近与参考图像的像素误差、每次匹配耗时、捕获后拼接的总耗时和峰值内存，
+以及到底检测是否在序列末尾结束。
+
+任何用例的到底检测提前结束或输出高度与参考图像不同时返回非0退出码，这时也不保存基线。
+结果可以保存为 JSON 基线，之后与基线比较：准确性变差时返回非0退出码，耗时变化只作提示
+（耗时与机器有关，基线应在同一台机器上生成）。
+
+用法:
+    python benchmarks/bench_stitching.py [--cases plain,jpeg] [--save-baseline benchmarks/stitching_baseline.json]
+    python benchmarks/bench_stitching.py --baseline benchmarks/stitching_baseline.json
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+# 添加项目根目录到 Python 路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.core.capture_backend import generate_reference_document
+from src.core.long_screenshot import LongScreenshotCapture
+from src.core.session_recording import FRAME_INITIAL, FRAME_SCROLL, replay_session
+
+# 接缝上下各比较多少行
+SEAM_RADIUS = 4
+
+
+def make_bar(height, width, label, background, color):
+    """生成带文字的固定工具栏图像，用于模拟页眉/页脚"""
+    bar = np.full((height, width, 3), background, dtype=np.uint8)
+    cv2.putText(bar, label, (10, height * 2 // 3), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 1, cv2.LINE_AA)
+    cv2.line(bar, (0, height - 1), (width, height - 1), color, 1)
+    return bar
+
+
+class FrameSequence:
+    """按已知位置生成的帧序列，接口与回放使用的 CaptureSession 相同"""
+
+    def __init__(self, frames, positions, truth, footer_height=0, remote_desktop=False):
+        self.frames = frames
+        self.positions = positions
+        self.truth = truth
+        self.footer_height = footer_height
+        self.metadata = {'remote_desktop': remote_desktop}
+
+    def __len__(self):
+        return len(self.frames)
+
+    def frame(self, index):
+        # 与真实截屏一样每次返回新的数组
+        return self.frames[index].copy()
+
+    def kind(self, index):
+        return FRAME_INITIAL if index == 0 else FRAME_SCROLL
+
+
+def render_sequence(reference, viewport, step, header=None, footer=None, blur=0, jpeg_quality=None,
+                    remote_desktop=False):
+    """
+    按固定步长（可以是小数）生成帧序列
+
+    Args:
+        reference: 可滚动内容的参考图像（BGR）
+        viewport: 视口高度（包括页眉和页脚）
+        step: 每帧滚动的像素数，小数时按亚像素插值渲染
+        header: 固定页眉
+        footer: 固定页脚
+        blur: 纵向运动模糊的长度（像素）
+        jpeg_quality: 每帧经过 JPEG 压缩的质量，None 表示不压缩
+        remote_desktop: 是否按远程桌面窗口处理
+    """
+    width = reference.shape[1]
+    header = header if header is not None else reference[:0]
+    footer = footer if footer is not None else reference[:0]
+    content_height = viewport - len(header) - len(footer)
+    if blur:
+        reference = cv2.blur(reference, (1, blur))
+    max_position = len(reference) - content_height
+
+    positions = list(np.arange(0, max_position, step)) + [max_position]
+    frames = []
+    for position in positions:
+        top = int(np.floor(position))
+        fraction = position - top
+        content = reference[top:top + content_height + 1]
+        if fraction:
+            # 亚像素位置：把内容向上平移 fraction 行（线性插值）
+            matrix = np.float32([[1, 0, 0], [0, 1, -fraction]])
+            content = cv2.warpAffine(content, matrix, (width, len(content)), flags=cv2.INTER_LINEAR,
+                                     borderMode=cv2.BORDER_REPLICATE)
+        frame = np.vstack([header, content[:content_height], footer])
+        if jpeg_quality is not None:
+            _, encoded = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
+            frame = cv2.imdecode(encoded, cv2.IMREAD_COLOR)
+        frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2BGRA))
+
+    truth = np.vstack([header, reference, footer])
+    return FrameSequence(frames, [float(p) for p in positions], truth, len(footer), remote_desktop)
+
+
+def build_cases(height, width, viewport, step):
+    """生成各个测试用例的帧序列"""
+    reference = generate_reference_document(height, width)
+
+    # 重复的代码行：一段 3 行（60 像素）的代码整行重复出现多次，视口内只有周围的内容能确定位置
+    repeated = reference.copy()
+    block = reference[1000:1060]
+    for y in range(1060, 1480, 60):
+        repeated[y:y + 60] = block
+
+    # 大段空白：比视口更高的空白区域，期间的帧无法匹配
+    blank = reference.copy()
+    blank[1500:1500 + viewport + step] = 250
+
+    header = make_bar(50, width, "Toolbar", (60, 60, 60), (230, 230, 230))
+    footer = make_bar(30, width, "Status bar", (225, 225, 225), (40, 40, 40))
+
+    return {
+        'plain': lambda: render_sequence(reference, viewport, step),
+        'repeated': lambda: render_sequence(repeated, viewport, step),
+        'blank': lambda: render_sequence(blank, viewport, step),
+        'sticky': lambda: render_sequence(reference, viewport, step, header=header, footer=footer),
+        'jpeg': lambda: render_sequence(reference, viewport, step, jpeg_quality=60, remote_desktop=True),
+        'blur': lambda: render_sequence(reference, viewport, step - 0.4, blur=3),
+    }
+
+
+def run_case(sequence, store, workers=None):
+    """回放一个帧序列，返回测量结果"""
+    capture = LongScreenshotCapture()
+    if workers:
+        capture.stitch_workers = workers
+    if store != 'incremental':
+        capture.incremental_stitching = False
+        capture.compact_frames = store != 'full'
+
+    # 计时匹配
+    match_times = []
+    find_best_match = capture.find_best_match
+
+    def timed_find_best_match(prev_frame, curr_frame):
+        start = time.perf_counter()
+        offset = find_best_match(prev_frame, curr_frame)
+        match_times.append(time.perf_counter() - start)
+        return offset
+    capture.find_best_match = timed_find_best_match
+
+    stitch = {'time': 0.0, 'peak': 0}
+    stitch_images = capture.stitch_images
+
+    def measured_stitch_images():
+        tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            return stitch_images()
+        finally:
+            stitch['time'] = time.perf_counter() - start
+            stitch['peak'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    capture.stitch_images = measured_stitch_images
+
+    start = time.perf_counter()
+    result = replay_session(capture, sequence)
+    elapsed = time.perf_counter() - start
+
+    # 每次抓取的是哪一帧，得到每个捕获帧的真实位置
+    grabbed = capture.frame_source.grab_history
+    return summarize(result, sequence.truth, capture, sequence, grabbed, match_times, stitch, elapsed)
+
+
+def summarize(result, truth, capture, sequence, grabbed, match_times, stitch, elapsed):
+    """计算一个用例的各项指标"""
+    positions = [sequence.positions[index] for index in grabbed]
+    offsets = capture.frame_offsets
+    offset_errors = [abs(offset - position) for offset, position in zip(offsets, positions)]
+    if len(offsets) != len(positions):
+        offset_errors = None
+
+    rows = min(len(result), len(truth)) if result is not None else 0
+    pixel_error = float(np.mean(cv2.absdiff(result[:rows], truth[:rows]))) if rows else None
+
+    # 接缝：每帧新内容开始的行（按真实位置），比较接缝上下 SEAM_RADIUS 行
+    frame_height = len(sequence.frames[0]) - sequence.footer_height
+    seam_errors = []
+    for index in range(1, len(sequence)):
+        seam = int(round(sequence.positions[index - 1])) + frame_height
+        top, bottom = max(seam - SEAM_RADIUS, 0), min(seam + SEAM_RADIUS, rows)
+        if bottom > top:
+            seam_errors.append(float(np.mean(cv2.absdiff(result[top:bottom], truth[top:bottom]))))
+
+    consumed = max(grabbed) + 1 if grabbed else 0
+    return {
+        'frames': len(sequence),
+        'captured_frames': len(grabbed),
+        'ended_early': consumed < len(sequence),
+        'height_error': (len(result) - len(truth)) if result is not None else None,
+        'max_offset_error': round(max(offset_errors), 2) if offset_errors else None,
+        'mean_offset_error': round(float(np.mean(offset_errors)), 3) if offset_errors else None,
+        'mean_pixel_error': round(pixel_error, 3) if pixel_error is not None else None,
+        'max_seam_error': round(max(seam_errors), 3) if seam_errors else None,
+        'match_ms': round(float(np.mean(match_times)) * 1000, 3) if match_times else None,
+        'matches': len(match_times),
+        'stitch_ms': round(stitch['time'] * 1000, 2),
+        'stitch_peak_mb': round(stitch['peak'] / 1024 / 1024, 2),
+        'total_s': round(elapsed, 3),
+    }
+
+
+# 与基线比较的准确性指标及允许的增量
+ACCURACY_TOLERANCES = {
+    'max_offset_error': 1.0,
+    'mean_pixel_error': 0.5,
+    'max_seam_error': 1.0,
+    'height_error': 0,
+}
+# 耗时超过基线的该倍数时提示
+TIME_TOLERANCE = 1.5
+
+
+def check_results(results):
+    """
+    不依赖基线的检查：每个用例都应捕获到序列末尾，输出高度与参考图像相同
+
+    Returns:
+        失败的描述列表
+    """
+    failures = []
+    for case, metrics in results.items():
+        if metrics['ended_early']:
+            failures.append(f"{case}: 到底检测提前结束（捕获 {metrics['captured_frames']}/{metrics['frames']} 帧）")
+        if metrics['height_error'] != 0:
+            failures.append(f"{case}: 高度误差 {metrics['height_error']}")
+    return failures
+
+
+def compare_with_baseline(results, baseline):
+    """
+    与基线比较
+
+    Returns:
+        准确性变差的描述列表
+    """
+    regressions = []
+    for case, metrics in results.items():
+        base = baseline.get(case)
+        if base is None:
+            continue
+        if metrics['ended_early'] and not base['ended_early']:
+            regressions.append(f"{case}: 到底检测提前结束")
+        for name, tolerance in ACCURACY_TOLERANCES.items():
+            value, expected = metrics[name], base[name]
+            if expected is None:
+                continue
+            if value is None or abs(value) > abs(expected) + tolerance:
+                regressions.append(f"{case}: {name} {expected} -> {value}")
+        for name in ('match_ms', 'stitch_ms'):
+            value, expected = metrics[name], base[name]
+            if value and expected and value > expected * TIME_TOLERANCE:
+                print(f"提示: {case} 的 {name} 从 {expected} 增加到 {value}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="拼接基准测试套件（已知真实偏移）")
+    parser.add_argument('--height', type=int, default=5000, help="参考文档高度")
+    parser.add_argument('--width', type=int, default=800, help="参考文档宽度")
+    parser.add_argument('--viewport', type=int, default=600, help="视口高度")
+    parser.add_argument('--step', type=int, default=150, help="每帧滚动的像素数")
+    parser.add_argument('--cases', help="只运行这些用例（逗号分隔）")
+    parser.add_argument('--store', choices=['incremental', 'strips', 'full'], default='full',
+                        help="帧的保存方式，默认保存完整帧并在捕获后拼接")
+    parser.add_argument('--workers', type=int, help="捕获后拼接时并行匹配的线程数，默认为CPU核数")
+    parser.add_argument('--baseline', help="与该 JSON 基线比较")
+    parser.add_argument('--save-baseline', help="把结果保存为 JSON 基线")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, format='%(message)s')  # 只输出结果表格
+
+    cases = build_cases(args.height, args.width, args.viewport, args.step)
+    names = args.cases.split(',') if args.cases else list(cases)
+
+    results = {}
+    for name in names:
+        sequence = cases[name]()
+        results[name] = run_case(sequence, args.store, args.workers)
+
+    columns = [('frames', '帧数'), ('captured_frames', '捕获'), ('ended_early', '提前结束'),
+               ('height_error', '高度误差'), ('max_offset_error', '最大偏移误差'),
+               ('mean_pixel_error', '像素误差'), ('max_seam_error', '接缝误差'),
+               ('match_ms', '匹配ms'), ('stitch_ms', '拼接ms'), ('stitch_peak_mb', '峰值MB')]
+    print("=" * 100)
+    print(f"{'用例':<10}" + "".join(f"{title:>10}" for _, title in columns))
+    for name, metrics in results.items():
+        print(f"{name:<10}" + "".join(f"{str(metrics[key]):>12}" for key, _ in columns))
+
+    failures = check_results(results)
+    if failures:
+        print("结果不正确:")
+        for failure in failures:
+            print(f"  {failure}")
+        if args.save_baseline:
+            print("结果不正确，不保存基线")
+        sys.exit(1)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"基线已保存到: {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(results, baseline)
+        if regressions:
+            print("准确性变差:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("与基线相比没有准确性变差")
+
+
+if __name__ == "__main__":
+    main()
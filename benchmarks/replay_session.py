@@ -0,0 +1,78 @@
+"""
+回放录制的长截图会话（无界面）
+
+用录制的原始帧重新运行匹配、拼接和到底检测，报告耗时，并与录制时的拼接结果比较。
+可以修改匹配和存储方式，比较不同实现在真实截图上的速度和结果。
+
+用法:
+    python benchmarks/replay_session.py session.npz [--no-row-signatures] [--store strips] [--output result.png]
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+# 添加项目根目录到 Python 路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.core.long_screenshot import LongScreenshotCapture
+from src.core.session_recording import CaptureSession, replay_session
+from src.utils.image_export import export_image
+
+
+def main():
+    parser = argparse.ArgumentParser(description="回放录制的长截图会话")
+    parser.add_argument('session', help="会话文件（.npz）")
+    parser.add_argument('--no-row-signatures', action='store_true', help="不使用行签名匹配，只用金字塔模板匹配")
+    parser.add_argument('--no-sticky', action='store_true', help="不检测固定的页眉/页脚")
+    parser.add_argument('--store', choices=['incremental', 'strips', 'strips-png', 'full'],
+                        help="帧的保存方式，默认与录制时相同")
+    parser.add_argument('--output', help="保存回放的拼接结果")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    session = CaptureSession(args.session)
+    metadata = session.metadata
+    kinds = [info['kind'] for info in session.frame_info]
+    print(f"会话: {args.session}, {len(session)} 帧 "
+          f"(滚动 {kinds.count('scroll')}, 重新抓取 {kinds.count('refresh') + kinds.count('confirm')}), "
+          f"录制结果尺寸: {metadata.get('result_shape')}")
+    if metadata.get('error'):
+        print(f"录制时出错: {metadata['error']}")
+
+    capture = LongScreenshotCapture()
+    session.apply_settings(capture)
+    if args.no_row_signatures:
+        capture.use_row_signatures = False
+    if args.no_sticky:
+        capture.detect_sticky = False
+    if args.store:
+        capture.incremental_stitching = args.store == 'incremental'
+        capture.compact_frames = args.store != 'full'
+        capture.compress_frames = args.store == 'strips-png'
+
+    start = time.perf_counter()
+    result = replay_session(capture, session)
+    elapsed = time.perf_counter() - start
+    session.close()
+
+    print("=" * 60)
+    frames = capture.frame_count
+    print(f"回放帧数: {frames}, 总耗时: {elapsed:.2f} 秒, 每帧: {elapsed * 1000 / max(frames, 1):.1f} 毫秒")
+    print(f"结果尺寸: {None if result is None else result.shape}, 录制结果尺寸: {metadata.get('result_shape')}")
+    recorded = metadata.get('frame_offsets') or []
+    if len(recorded) == len(capture.frame_offsets):
+        differences = [abs(a - b) for a, b in zip(capture.frame_offsets, recorded)]
+        print(f"与录制时的最大偏移差异: {max(differences, default=0)} 像素")
+    else:
+        print(f"帧偏移数量不同: 回放 {len(capture.frame_offsets)}, 录制 {len(recorded)}")
+    stats = capture.capture_stats()
+    print(f"低置信度匹配: {stats['low_confidence_matches']}, 每帧抓取到可用: {stats['mean_grab_to_ready_ms']:.1f} 毫秒")
+
+    if args.output and result is not None:
+        export_image(result, args.output)
+        print(f"拼接结果已保存到: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,494 @@
+"""
+长截图的帧来源与滚动驱动
+
+LongScreenshotCapture 只通过 FrameSource 获取画面、通过 ScrollDriver 滚动目标窗口，
+因此同一套捕获、拼接和到底检测逻辑既可以驱动真实屏幕（Qt截屏 + Windows鼠标滚轮），
+也可以在没有显示器和 Windows API 的Linux构建机上驱动合成的滚动文档。
+"""
+import ctypes
+import logging
+import time
+import threading
+import numpy as np
+import cv2
+from PyQt6.QtCore import Qt, QObject, QRect, pyqtSignal
+from PyQt6.QtGui import QCursor
+from PyQt6.QtWidgets import QApplication
+
+try:
+    import win32gui
+    import win32con
+    import win32api
+    import win32process
+except ImportError:
+    # 非Windows平台只能使用合成后端
+    win32gui = win32con = win32api = win32process = None
+
+logger = logging.getLogger(__name__)
+
+# 远程桌面/虚拟机窗口的类名特征
+REMOTE_DESKTOP_CLASS_NAMES = ["MKSEmbedded", "VMware", "Citrix", "Remote"]
+
+# 鼠标滚轮一格对应的 delta 值
+WHEEL_DELTA = 120
+
+# 稳定性探测图相对原帧的缩小倍数
+PROBE_SCALE = 8
+
+
+def make_probe(frame, scale=PROBE_SCALE):
+    """把帧（BGR或BGRA）缩小为灰度探测图，用于判断画面是否已经稳定"""
+    height, width = frame.shape[:2]
+    small = cv2.resize(frame, (max(1, width // scale), max(1, height // scale)),
+                       interpolation=cv2.INTER_AREA)
+    if small.ndim == 3:
+        small = cv2.cvtColor(small, cv2.COLOR_BGRA2GRAY if small.shape[2] == 4 else cv2.COLOR_BGR2GRAY)
+    return small
+
+
+class GuiThreadInvoker(QObject):
+    """
+    把必须在GUI线程执行的调用（Qt截屏、QCursor）从捕获线程转发到GUI线程
+
+    必须在GUI线程中创建。在GUI线程中调用时直接执行；在其他线程中调用时
+    通过 BlockingQueuedConnection 交给GUI线程执行，并等待返回结果。
+    """
+    _request = pyqtSignal(object)
+
+    def __init__(self):
+        super().__init__()
+        self._gui_thread_id = threading.get_ident()
+        self._request.connect(self._execute, Qt.ConnectionType.BlockingQueuedConnection)
+
+    def _execute(self, task):
+        """在GUI线程中执行任务"""
+        try:
+            task['result'] = task['func'](*task['args'])
+        except Exception as e:
+            task['error'] = e
+
+    def call(self, func, *args):
+        """在GUI线程中执行 func(*args) 并返回结果"""
+        if threading.get_ident() == self._gui_thread_id:
+            return func(*args)
+
+        task = {'func': func, 'args': args, 'result': None, 'error': None}
+        self._request.emit(task)
+        if task['error'] is not None:
+            raise task['error']
+        return task['result']
+
+
+def qimage_to_array(image):
+    """
+    不复制地把32位QImage包装为 (高, 宽, 4) 的BGRA数组
+
+    数组直接引用QImage的像素内存。内存由一个同时保存QImage的 ctypes 缓冲区对象提供，
+    它位于 numpy 的 base 链中，因此这个数组的任何视图（包括 np.asarray、.view(np.ndarray)
+    得到的普通数组）都会让QImage保持有效，直到最后一个视图被释放。
+    """
+    size = image.sizeInBytes()
+    bits = image.bits()
+    bits.setsize(size)
+    buffer = (ctypes.c_ubyte * size).from_address(int(bits))
+    buffer.image = image
+    return np.frombuffer(buffer, np.uint8).reshape(
+        image.height(), image.bytesPerLine() // 4, 4
+    )[:, :image.width()]
+
+
+class FrameSource:
+    """帧来源接口：抓取捕获区域的当前画面"""
+
+    def prepare(self, window_handle, select_rect):
+        """开始捕获前调用，记录目标窗口和选区"""
+        self.window_handle = window_handle
+        self.select_rect = select_rect
+
+    def grab(self):
+        """
+        抓取当前帧
+
+        Returns:
+            BGR或BGRA格式的numpy数组（BGRA时只有新出现的行会被转换为BGR）。
+            调用方会直接保留该数组，每次都应返回新的数组
+        """
+        raise NotImplementedError
+
+    def grab_probe(self):
+        """
+        抓取当前画面的灰度小探测图
+
+        滚动后反复调用，用于判断画面是否已经停止变化；子类可以避免完整的格式转换。
+        """
+        return make_probe(self.grab())
+
+
+class ScrollDriver:
+    """滚动驱动接口：激活目标窗口、移动鼠标并发送滚轮事件"""
+
+    def prepare(self, window_handle, select_rect):
+        """开始捕获前调用，记录目标窗口和选区"""
+        self.window_handle = window_handle
+        self.select_rect = select_rect
+
+    def is_remote_desktop(self):
+        """目标窗口是否为远程桌面/虚拟机窗口"""
+        return False
+
+    def target_application(self):
+        """
+        目标窗口所属的程序，用于按程序保存学到的捕获参数
+
+        Returns:
+            (窗口类名, 可执行文件路径)，无法确定时返回 None
+        """
+        return None
+
+    def activate(self):
+        """将目标窗口置于前台"""
+
+    def move_pointer(self):
+        """
+        将鼠标移动到滚动目标的中心
+
+        Returns:
+            用于 restore_pointer 恢复鼠标位置的对象
+        """
+        return None
+
+    def restore_pointer(self, saved):
+        """恢复 move_pointer 之前的鼠标位置"""
+
+    def wheel(self, delta):
+        """发送一次滚轮事件，delta 为负表示向下滚动"""
+        raise NotImplementedError
+
+
+class ScreenFrameSource(FrameSource):
+    """通过 Qt 抓取主屏幕上的选区或窗口区域"""
+
+    def __init__(self):
+        # Qt截屏只能在GUI线程中进行
+        self.invoker = GuiThreadInvoker()
+
+    def get_capture_rect(self):
+        """获取捕获区域（全局坐标）"""
+        if self.select_rect:
+            return self.select_rect
+        # 没有选区时使用窗口区域
+        x, y, right, bottom = win32gui.GetWindowRect(self.window_handle)
+        return QRect(x, y, right - x, bottom - y)
+
+    def grab(self):
+        # 只把截屏本身交给GUI线程；直接返回QImage内存上的BGRA视图，不做整帧的格式转换和复制，
+        # 灰度图、缩略图和新出现行的BGR数据都由捕获线程从这份数据按需生成
+        return qimage_to_array(self.invoker.call(self._grab_image, self.get_capture_rect()))
+
+    def grab_probe(self):
+        # 直接缩小BGRA数据
+        return make_probe(self.grab())
+
+    @staticmethod
+    def _grab_image(capture_rect):
+        """在GUI线程中抓取指定区域，返回QImage"""
+        screen = QApplication.primaryScreen()
+
+        # 捕获指定区域的截图
+        screenshot = screen.grabWindow(
+            0,  # 使用0表示整个屏幕
+            capture_rect.x(),
+            capture_rect.y(),
+            capture_rect.width(),
+            capture_rect.height()
+        )
+
+        # 提高图像质量 - 使用高质量的图像格式
+        screenshot = screenshot.toImage()
+        screenshot.setDevicePixelRatio(1.0)  # 确保使用原始像素比
+        return screenshot
+
+
+class Win32ScrollDriver(ScrollDriver):
+    """通过 Windows API 激活窗口并模拟鼠标滚轮"""
+
+    def __init__(self):
+        # QCursor 使用Qt的逻辑坐标（与选区一致），只能在GUI线程中调用
+        self.invoker = GuiThreadInvoker()
+
+    def is_remote_desktop(self):
+        class_name = win32gui.GetClassName(self.window_handle)
+        is_remote = any(name in class_name for name in REMOTE_DESKTOP_CLASS_NAMES)
+        if is_remote:
+            logger.info(f"检测到远程桌面窗口: {class_name}，将使用增强捕获模式")
+        return is_remote
+
+    def target_application(self):
+        if not self.window_handle:
+            return None
+        class_name = win32gui.GetClassName(self.window_handle)
+        executable = ''
+        try:
+            _, process_id = win32process.GetWindowThreadProcessId(self.window_handle)
+            process = win32api.OpenProcess(win32con.PROCESS_QUERY_INFORMATION | win32con.PROCESS_VM_READ,
+                                           False, process_id)
+            try:
+                executable = win32process.GetModuleFileNameEx(process, 0)
+            finally:
+                win32api.CloseHandle(process)
+        except Exception as e:
+            # 以管理员权限运行的程序等无法打开，只按窗口类名区分
+            logger.warning(f"获取窗口所属程序失败: {str(e)}")
+        return class_name, executable
+
+    def activate(self):
+        win32gui.SetForegroundWindow(self.window_handle)
+
+    def move_pointer(self):
+        # 获取窗口中心点或选区中心点
+        if self.select_rect:
+            center_x = self.select_rect.x() + self.select_rect.width() // 2
+            center_y = self.select_rect.y() + self.select_rect.height() // 2
+        else:
+            rect = win32gui.GetWindowRect(self.window_handle)
+            center_x = (rect[0] + rect[2]) // 2
+            center_y = (rect[1] + rect[3]) // 2
+
+        # 保存当前鼠标位置后移动到中心点
+        return self.invoker.call(self._swap_pointer, center_x, center_y)
+
+    @staticmethod
+    def _swap_pointer(x, y):
+        """在GUI线程中移动鼠标，返回原来的位置"""
+        original_pos = QCursor.pos()
+        QCursor.setPos(x, y)
+        return original_pos
+
+    def restore_pointer(self, saved):
+        if saved is not None:
+            self.invoker.call(QCursor.setPos, saved)
+
+    def wheel(self, delta):
+        win32api.mouse_event(win32con.MOUSEEVENTF_WHEEL, 0, 0, int(delta), 0)
+
+
+def generate_reference_document(height=6000, width=800, line_height=20, seed=0):
+    """
+    生成一张类似代码编辑器内容的高图像，作为合成滚动文档的参考图像
+
+    Args:
+        height: 图像高度
+        width: 图像宽度
+        line_height: 行高
+        seed: 随机种子，相同的种子生成相同的图像
+
+    Returns:
+        BGR格式的参考图像
+    """
+    rng = np.random.default_rng(seed)
+    image = np.full((height, width, 3), 250, dtype=np.uint8)
+    words = ['def', 'class', 'return', 'self', 'import', 'for', 'in', 'if', 'else',
+             'value', 'items', 'result', 'print', 'data', 'index', 'None', 'True']
+    colors = [(20, 20, 20), (140, 40, 10), (10, 100, 30), (130, 20, 130)]
+
+    for line_no, y in enumerate(range(line_height, height, line_height)):
+        # 行号
+        cv2.putText(image, str(line_no + 1), (4, y - 6), cv2.FONT_HERSHEY_SIMPLEX,
+                    0.4, (150, 150, 150), 1, cv2.LINE_AA)
+        # 随机留出空行
+        if rng.random() < 0.1:
+            continue
+        indent = int(rng.integers(0, 4)) * 24
+        text = ' '.join(rng.choice(words, size=int(rng.integers(2, 8))))
+        color = colors[int(rng.integers(0, len(colors)))]
+        cv2.putText(image, text, (48 + indent, y - 6), cv2.FONT_HERSHEY_SIMPLEX,
+                    0.6, color, 1, cv2.LINE_AA)
+
+    return image
+
+
+class SyntheticDocument:
+    """
+    合成的滚动文档：通过一个视口显示一张很高的参考图像
+
+    用于在没有显示器的环境中运行、测量和回归测试整个长截图流程，可以模拟：
+    每格滚轮的滚动像素、滚动后的渲染延迟、平滑滚动动画（动画过程中的画面带有运动模糊）、
+    固定的页眉/页脚、画面噪声、内容区域右侧的滚动条，
+    以及新内容滚入视口后延迟加载（先显示空白，一段时间后才出现内容）。
+    """
+
+    def __init__(self, reference, viewport_height, pixels_per_notch=60,
+                 render_latency=0.0, header=None, footer=None, noise=0.0,
+                 lazy_load_block=0, lazy_load_delay=0.0, scroll_duration=0.0, scrollbar_width=0, seed=0):
+        """
+        Args:
+            reference: 可滚动内容的参考图像（BGR）
+            viewport_height: 视口高度（包括页眉和页脚）
+            pixels_per_notch: 每格滚轮（delta=120）滚动的像素数
+            render_latency: 滚动后新位置需要多久（秒）才显示出来
+            header: 固定在视口顶部的页眉图像，宽度需与参考图像一致
+            footer: 固定在视口底部的页脚图像，宽度需与参考图像一致
+            noise: 每帧叠加的高斯噪声标准差
+            lazy_load_block: 延迟加载的内容块高度，0 表示不模拟延迟加载
+            lazy_load_delay: 内容块首次进入视口后多久（秒）才加载完成
+            scroll_duration: 平滑滚动动画的时长（秒），0 表示立即跳到新位置
+            scrollbar_width: 内容区域右侧滚动条的宽度，0 表示不显示（滚动条覆盖在内容的最右侧几列上）
+            seed: 噪声随机种子
+        """
+        self.reference = reference
+        self.width = reference.shape[1]
+        self.header = header if header is not None else reference[:0]
+        self.footer = footer if footer is not None else reference[:0]
+        self.viewport_height = viewport_height
+        self.content_height = viewport_height - len(self.header) - len(self.footer)
+        if self.content_height <= 0:
+            raise ValueError("视口高度必须大于页眉和页脚高度之和")
+        self.max_position = max(0, len(reference) - self.content_height)
+        self.pixels_per_notch = pixels_per_notch
+        self.render_latency = render_latency
+        self.noise = noise
+        self.lazy_load_block = lazy_load_block
+        self.lazy_load_delay = lazy_load_delay
+        self.scroll_duration = scroll_duration
+        self.scrollbar_width = scrollbar_width
+        # 滑块长度与可见比例成正比，不小于20像素
+        self.thumb_length = max(20, min(self.content_height,
+                                        round(self.content_height * self.content_height / len(reference))))
+        self.rng = np.random.default_rng(seed)
+
+        self.position = 0  # 滚动目标位置
+        self.displayed_position = 0  # 当前显示的位置
+        self.pending_scrolls = []  # (生效时间, 目标位置)
+        self.animation = None  # 正在进行的平滑滚动：(开始时间, 起始位置, 目标位置)
+        self.block_reveal_times = {}  # 内容块首次进入视口的时间
+        self.grab_positions = []  # 每次抓取时显示的位置，作为拼接的真实偏移
+
+    def ground_truth(self):
+        """理想的拼接结果：页眉 + 完整内容 + 页脚"""
+        return np.vstack([self.header, self.reference, self.footer])
+
+    def scroll(self, delta):
+        """按滚轮 delta 滚动（delta 为负表示向下滚动）"""
+        pixels = int(round(-delta / WHEEL_DELTA * self.pixels_per_notch))
+        self.position = min(max(self.position + pixels, 0), self.max_position)
+        self.pending_scrolls.append((time.monotonic() + self.render_latency, self.position))
+
+    def _update_display(self, now):
+        """应用已经到达生效时间的滚动"""
+        while self.pending_scrolls and self.pending_scrolls[0][0] <= now:
+            start, target = self.pending_scrolls.pop(0)
+            if self.scroll_duration > 0:
+                # 新的滚动从动画当前所在的位置开始
+                self._advance_animation(start)
+                self.animation = (start, self.displayed_position, target)
+            else:
+                self.displayed_position = target
+        self._advance_animation(now)
+
+    def _advance_animation(self, now):
+        """把平滑滚动动画推进到指定时间"""
+        if self.animation is None:
+            return
+        start, origin, target = self.animation
+        progress = (now - start) / self.scroll_duration
+        if progress >= 1:
+            self.displayed_position = target
+            self.animation = None
+        else:
+            self.displayed_position = int(round(origin + (target - origin) * progress))
+
+    def render(self, record=True):
+        """
+        渲染当前视口画面
+
+        Args:
+            record: 是否把显示位置记录到 grab_positions（稳定性探测不记录）
+        """
+        now = time.monotonic()
+        self._update_display(now)
+        top = self.displayed_position
+        content = self.reference[top:top + self.content_height].copy()
+
+        # 模拟延迟加载：尚未加载完成的内容块显示为背景色
+        if self.lazy_load_block > 0:
+            first_block = top // self.lazy_load_block
+            last_block = (top + self.content_height - 1) // self.lazy_load_block
+            for block in range(first_block, last_block + 1):
+                reveal_time = self.block_reveal_times.setdefault(block, now)
+                if block > 0 and now - reveal_time < self.lazy_load_delay:
+                    y_start = max(block * self.lazy_load_block - top, 0)
+                    y_end = min((block + 1) * self.lazy_load_block - top, self.content_height)
+                    content[y_start:y_end] = 250
+
+        # 模拟平滑滚动时的运动模糊：模糊长度为一个60Hz显示帧内移动的像素数
+        if self.animation is not None:
+            _, origin, target = self.animation
+            blur = int(abs(target - origin) / self.scroll_duration / 60)
+            if blur >= 2:
+                content = cv2.blur(content, (1, blur))
+
+        if self.scrollbar_width > 0:
+            self._draw_scrollbar(content, top)
+
+        frame = np.vstack([self.header, content, self.footer])
+        if self.noise > 0:
+            noise = self.rng.normal(0, self.noise, frame.shape)
+            frame = np.clip(frame + noise, 0, 255).astype(np.uint8)
+
+        if record:
+            self.grab_positions.append(top)
+        return frame
+
+    def _draw_scrollbar(self, content, top):
+        """在内容区域右侧画出轨道和滑块"""
+        free = self.content_height - self.thumb_length
+        thumb_top = int(round(top / self.max_position * free)) if self.max_position else 0
+        bar = content[:, -self.scrollbar_width:]
+        bar[:] = 238
+        bar[thumb_top:thumb_top + self.thumb_length, 2:-2] = 150
+
+
+class SyntheticFrameSource(FrameSource):
+    """从合成滚动文档抓取画面"""
+
+    def __init__(self, document, bgra=True):
+        """
+        Args:
+            document: 合成滚动文档
+            bgra: 是否像Qt截屏一样返回BGRA帧
+        """
+        self.document = document
+        self.bgra = bgra
+
+    def grab(self):
+        frame = self.document.render()
+        if self.bgra:
+            return cv2.cvtColor(frame, cv2.COLOR_BGR2BGRA)
+        return frame
+
+    def grab_probe(self):
+        return make_probe(self.document.render(record=False))
+
+
+class SyntheticScrollDriver(ScrollDriver):
+    """滚动合成文档，不涉及真实的窗口和鼠标"""
+
+    def __init__(self, document, remote_desktop=False, application=None):
+        """
+        Args:
+            document: SyntheticDocument
+            remote_desktop: 是否模拟远程桌面窗口
+            application: 模拟的 (窗口类名, 可执行文件)，用于测试按程序学习的捕获参数
+        """
+        self.document = document
+        self.remote_desktop = remote_desktop
+        self.application = application
+
+    def is_remote_desktop(self):
+        return self.remote_desktop
+
+    def target_application(self):
+        return self.application
+
+    def wheel(self, delta):
+        self.document.scroll(delta)
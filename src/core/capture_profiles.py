@@ -0,0 +1,175 @@
+"""
+按应用程序学习的捕获参数
+
+不同程序的滚轮步长、渲染速度和画面特点差别很大，默认参数只能按最保守的情况设置：
+第一次滚动只滚一格来测量每格的像素数，等待画面稳定的超时也按慢速程序设定。
+每次捕获结束后，把测得的每格滚动像素数、画面稳定时间和匹配置信度按目标窗口的类名和可执行文件
+保存下来；下次捕获同一个程序时用它们作为初始值，一开始就按合适的步长和等待时间滚动。
+捕获过程中的测量结果仍然优先，学到的参数只是起点。
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 配置文件格式版本
+PROFILE_VERSION = 1
+
+# 直接使用最新测量值的字段：每格像素数在一次捕获中已经测得很准，
+# 程序的缩放比例改变后平均值对新旧两种情况都不对
+LATEST_FIELDS = ('pixels_per_notch',)
+
+# 学到的稳定时间乘以该系数作为等待画面稳定的超时
+SETTLE_TIMEOUT_MARGIN = 3.0
+
+
+def default_profile_path():
+    """默认的配置文件位置：Windows 上在 %APPDATA%\\SnapCode，其他平台在用户主目录"""
+    base = os.environ.get('APPDATA') or os.path.expanduser("~")
+    folder = 'SnapCode' if os.environ.get('APPDATA') else '.snapcode'
+    return os.path.join(base, folder, 'capture_profiles.json')
+
+
+def profile_key(class_name, executable):
+    """配置的键：窗口类名和可执行文件名（不含路径，不区分大小写）"""
+    executable = os.path.basename(executable or '').lower()
+    return f"{class_name or ''}|{executable}"
+
+
+class CaptureProfileStore:
+    """
+    保存在JSON文件中的各应用程序捕获参数
+
+    每个配置包含：
+        pixels_per_notch: 每格滚轮滚动的像素数
+        settle_time: 滚动后画面稳定所需的时间（秒，取每次捕获的90分位）
+        match_confidence: 可信匹配的平均置信度
+        low_confidence_rate: 匹配不可信的滚动所占比例
+        remote_desktop: 是否为远程桌面窗口
+        sessions: 已经学习的捕获次数
+    """
+
+    def __init__(self, path=None, smoothing=0.5):
+        """
+        Args:
+            path: 配置文件路径，默认为 default_profile_path()
+            smoothing: 新测量值的权重，其余为已有的值（指数滑动平均）
+        """
+        self.path = path or default_profile_path()
+        self.smoothing = smoothing
+        self.lock = threading.Lock()
+        self.profiles = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version', 0) > PROFILE_VERSION:
+                logger.warning(f"不支持的捕获配置文件版本: {data.get('version')}，忽略已有配置")
+                return {}
+            return data.get('profiles', {})
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.error(f"读取捕获配置失败: {str(e)}")
+            return {}
+
+    def get(self, key):
+        """返回键对应的配置（副本），没有时返回 None"""
+        with self.lock:
+            profile = self.profiles.get(key)
+            return dict(profile) if profile is not None else None
+
+    def update(self, key, observation):
+        """
+        用一次捕获的测量结果更新配置并保存
+
+        Args:
+            key: profile_key 的结果
+            observation: 与配置相同字段的测量值，值为 None 的字段不更新
+        """
+        with self.lock:
+            profile = self.profiles.setdefault(key, {'sessions': 0})
+            for name, value in observation.items():
+                if value is None:
+                    continue
+                previous = profile.get(name)
+                numeric = isinstance(value, (int, float)) and not isinstance(value, bool)
+                if numeric and previous is not None and name not in LATEST_FIELDS:
+                    value = previous + (value - previous) * self.smoothing
+                profile[name] = round(value, 4) if isinstance(value, float) else value
+            profile['sessions'] += 1
+            profile['updated'] = int(time.time())
+            self._save()
+
+    def _save(self):
+        """写入临时文件后替换，写入中途出错不会损坏已有配置"""
+        folder = os.path.dirname(self.path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': PROFILE_VERSION, 'profiles': self.profiles}, f, ensure_ascii=False, indent=1)
+        os.replace(temp_path, self.path)
+
+
+def observe_capture(capture):
+    """
+    从一次完成的捕获中提取测量值
+
+    Returns:
+        测量值字典；没有足够的可信滚动（无法得到每格像素数）时返回 None
+    """
+    controller = capture.scroll_controller
+    pixels_per_notch = controller.measured_pixels_per_notch
+    if pixels_per_notch is None:
+        return None
+    confidences = [confidence for confidence, reliable in capture.match_history if reliable]
+    scrolls = controller.record_count
+    return {
+        'pixels_per_notch': pixels_per_notch,
+        'settle_time': (float(np.percentile(capture.settle_times, 90))
+                        if capture.stabilize_frames and capture.settle_times else None),
+        'match_confidence': float(np.mean(confidences)) if confidences else None,
+        'low_confidence_rate': controller.low_confidence_count / scrolls if scrolls else None,
+        'remote_desktop': capture.is_remote_desktop,
+    }
+
+
+def apply_profile(capture, profile):
+    """
+    用学到的参数设置下一次捕获的初始值
+
+    只会缩短等待、不会超过默认值；匹配经常不可信的程序增大目标重叠。
+    每格像素数在测量第一帧后交给滚动步长控制器（见 LongScreenshotCapture.prepare_capture）。
+
+    Returns:
+        [(对象, 属性, 原来的值)]，捕获结束后用 restore_defaults 恢复
+    """
+    previous = []
+
+    def set_value(target, name, value):
+        previous.append((target, name, getattr(target, name)))
+        setattr(target, name, value)
+
+    settle_time = profile.get('settle_time')
+    if settle_time is not None:
+        set_value(capture, 'settle_timeout',
+                  min(capture.settle_timeout, max(0.2, settle_time * SETTLE_TIMEOUT_MARGIN)))
+        # 不使用稳定性探测时的固定滚动间隔（毫秒）
+        set_value(capture, 'scroll_delay', int(min(capture.scroll_delay, max(100, settle_time * 1000 * 1.5))))
+    controller = capture.scroll_controller
+    if profile.get('low_confidence_rate', 0) > 0.2:
+        set_value(controller, 'target_overlap', max(controller.target_overlap, 0.3))
+    return previous
+
+
+def restore_defaults(previous):
+    """恢复 apply_profile 修改的属性"""
+    for target, name, value in reversed(previous):
+        setattr(target, name, value)
@@ -1,478 +1,817 @@
-from PyQt6.QtCore import Qt, QTimer, QPoint, QRect
+from PyQt6.QtCore import Qt, QTimer, QPoint, QRect, QObject, QThread, pyqtSignal
 from PyQt6.QtGui import QPixmap, QPainter, QColor, QScreen, QCursor
 from PyQt6.QtWidgets import QWidget, QApplication
 import numpy as np
 import cv2
-import win32gui
-import win32con
-import win32api
 import time
 import copy
+import logging
+import math
+import os
+import threading
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from .capture_backend import ScreenFrameSource, Win32ScrollDriver, WHEEL_DELTA
+from .stitching import (
+    FrameStore, IncrementalStitcher, PyramidMatcher, RowSignatureMatcher, allocate_canvas,
+    detect_sticky_rows, new_rows, row_signatures, to_bgr, to_gray
+)
+from .preview import ThumbnailPyramid
+from .telemetry import (
+    CaptureTelemetry, PHASE_FOREGROUND, PHASE_CURSOR, PHASE_WHEEL,
+    PHASE_RENDER_WAIT, PHASE_GRAB, PHASE_CONVERT, PHASE_STITCH, PHASE_MATCH, PHASE_END_CHECK
+)
+from .scroll_control import ScrollStepController
+from .scrollbar import ScrollbarTracker
+from .capture_profiles import apply_profile, observe_capture, profile_key, restore_defaults
+from .session_recording import (
+    SessionRecorder, SESSION_SETTINGS, FRAME_INITIAL, FRAME_SCROLL, FRAME_REFRESH, FRAME_CONFIRM
+)
 
-class LongScreenshotCapture:
-    def __init__(self):
-        self.screenshots = []
+class CaptureThread(QThread):
+    """在工作线程中运行长截图的滚动和捕获循环，GUI线程只负责显示"""
+    
+    def __init__(self, capture, window_handle, select_rect):
+        super().__init__()
+        self.capture = capture
+        self.window_handle = window_handle
+        self.select_rect = select_rect
+    
+    def run(self):
+        self.capture.run_capture_loop(self.window_handle, self.select_rect)
+
+
+class LongScreenshotCapture(QObject):
+    # 捕获线程通过信号通知界面：进度（已滚动次数, 最大滚动次数）、完成（结果图像）、错误（错误信息）
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal(object)
+    error = pyqtSignal(str)
+    
+    def __init__(self, frame_source=None, scroll_driver=None):
+        super().__init__()
+        # 帧来源和滚动驱动，默认使用真实屏幕和Windows鼠标滚轮
+        self.frame_source = frame_source or ScreenFrameSource()
+        self.scroll_driver = scroll_driver or Win32ScrollDriver()
+        self.worker_thread = None  # 运行捕获循环的工作线程
+        self.stop_event = threading.Event()  # 停止请求，用于立即唤醒所有等待
+        self.incremental_stitching = True  # 边捕获边拼接，不保留全部帧
+        self.recent_frame_count = 3  # 保留完整画面的最近帧数，用于匹配和到底检测
+        self.compact_frames = True  # 不增量拼接时只保存每帧新出现的条带，而不是完整帧
+        self.compress_frames = False  # 是否在内存中以PNG压缩保存条带
+        self.screenshots = FrameStore(history=None)  # 捕获的帧，增量拼接时只保留最近几帧
+        self.frame_count = 0  # 已捕获的帧数
+        self.matcher = PyramidMatcher()  # 灰度金字塔匹配器，拼接和到底检测共用
+        self.use_row_signatures = True  # 优先使用行签名匹配，远程桌面仍使用模板匹配
+        self.scrollbar_width = 20  # 计算行签名时忽略的右侧滚动条列宽
+        self.row_matcher = RowSignatureMatcher(self.scrollbar_width)
+        self.last_match_confidence = 0.0  # 最近一次帧间匹配的置信度
+        self.last_match = None  # 最近一次帧间匹配：(上一帧, 当前帧, 滚动距离, 是否可信)
+        self.last_match_method = None  # 最近一次可信匹配使用的方法：'rows' 或 'pyramid'
+        self.match_remainder = None  # 最近一次匹配取整后剩下的亚像素距离：(当前帧, 余数)
+        self.thumbnail_size = (64, 64)  # 到底检测使用的缩略图尺寸
+        self.last_thumbnail = None  # 最近一帧的缩略图：(帧, 缩略图)
+        self.canvas_memory_budget = 1024 * 1024 * 1024  # 输出画布超过该字节数时改用磁盘映射文件
+        self.stitch_workers = os.cpu_count() or 1  # 捕获后拼接时并行匹配相邻帧的线程数
+        self.stitcher = IncrementalStitcher(self.find_best_match)
+        self.preview = ThumbnailPyramid()  # 实时预览，随写入画布（或保存条带）的行增量更新
         self.is_capturing = False
         self.window_handle = None
         self.select_rect = None
         self.scroll_delay = 400  # 进一步减少滚动延迟（毫秒）
+        self.scroll_controller = ScrollStepController(target_overlap=0.15)  # 按测得的偏移选择每次滚动的格数
+        self.last_scroll_notches = 0  # 最近一次滚动的格数
+        self.stabilize_frames = True  # 滚动后轮询小探测图，画面稳定后立即捕获，代替固定的等待时间
+        self.probe_interval = 0.03  # 探测间隔（秒）
+        self.probe_tolerance = 1.0  # 两张探测图的平均灰度差低于该值时认为一致
+        self.settle_timeout = 1.0  # 等待画面稳定的最长时间（秒），远程桌面加倍
+        self.no_change_probes = 5  # 画面一直没有变化时，学到稳定时间后至少等待的探测次数
+        self.pre_scroll_probe = None  # 滚动前的探测图，用于判断画面是否已经开始变化
+        self.settle_times = []  # 每次滚动后画面稳定所用的时间（秒）
+        self.frame_timings = []  # 每帧从抓取到可用于匹配的时间（秒）和分配的字节数（启用 tracemalloc 时）
+        self.detect_sticky = True  # 检测固定的页眉/页脚，匹配和到底检测只使用中间的内容区域
+        self.sticky_detect_frames = 3  # 最多用前几帧检测固定区域（前几次滚动可能还没有生效）
+        self.sticky_regions = None  # (页眉行数, 页脚行数)，None 表示还没有确定
+        self.first_frame = None  # 确定固定区域前保留的第一帧
         self.max_scroll_count = 500  # 增加最大滚动次数到500，支持更长的页面
         self.current_scroll_count = 0
         self.result_image = None
         self.auto_scroll = True
         self.same_frame_count = 0  # 连续相同帧计数
-        self.max_same_frames = 3   # 减少最大连续相同帧数，加快判断结束
+        self.max_same_frames = 2   # 没有可信偏移时，连续多少帧画面不变才认为到底
+        self.end_confirm_delay = 0.3  # 确认到底前重新抓取的等待时间（秒）
         self.is_remote_desktop = False  # 是否为远程桌面
         self.empty_frame_count = 0  # 连续空白帧计数
         self.max_empty_frames = 3  # 减少最大连续空白帧数，加快判断结束
-        self.forced_scroll_count = 0  # 强制滚动计数
-        self.max_forced_scroll = 2  # 减少最大强制滚动次数
         self.last_scroll_time = 0  # 上次滚动时间
         self.was_stopped_manually = False  # 是否被用户手动停止
         self.start_time = 0  # 开始时间
         self.timeout = 120  # 超时时间（秒）
-        self.active_timers = []  # 跟踪所有活动的QTimer
+        self.frame_offsets = []  # 拼接时每帧在结果图像中的纵向位置
+        self.record_session_path = None  # 设置后把抓取的原始帧录制到该会话文件（.npz），用于离线复现拼接问题
+        self.session_recorder = None
+        self.logger = logging.getLogger(__name__)  # DEBUG 级别时输出每帧的详细信息和异常堆栈
+        self.telemetry = CaptureTelemetry()  # 各阶段耗时，可导出为 JSON 或 Chrome 跟踪
+        self.profile_store = None  # CaptureProfileStore：设置后按目标程序学习并使用滚动和等待参数
+        self.application = None  # 目标程序的 (窗口类名, 可执行文件)
+        self.capture_profile = None  # 本次捕获使用的已学习参数
+        self.profile_overrides = []  # 按学习的参数修改的属性和原来的值
+        self.match_history = []  # 每次帧间匹配的 (置信度, 是否可信)
+        self.detect_scrollbar = True  # 识别画面右侧的滚动条，估计进度并在滑块到达末端时结束
+        self.scrollbar = ScrollbarTracker()
+        self.scrolled_distance = 0  # 第一帧之后累计滚动的像素数
+        self.progress_estimate = None  # 根据滚动条估计的进度：完成百分比、文档高度和剩余帧数
         
     def start_capture(self, window_handle, select_rect=None):
-        """开始捕获长截图"""
-        print(f"开始捕获长截图，窗口句柄: {window_handle}")
+        """在工作线程中开始捕获长截图，结果通过 finished 信号返回"""
+        if self.worker_thread is not None and self.worker_thread.isRunning():
+            self.force_stop()
+        
+        # 先标记为正在捕获，界面在线程启动前就能看到正确的状态
+        self.is_capturing = True
+        self.stop_event.clear()
+        self.worker_thread = CaptureThread(self, window_handle, select_rect)
+        self.worker_thread.start()
+    
+    def run_headless(self, window_handle=None, select_rect=None):
+        """
+        在当前线程中同步运行完整的捕获流程，不依赖Qt事件循环
+        
+        与合成后端配合，可以在没有显示器的Linux构建机上运行、测量和回归测试
+        捕获、拼接和到底检测逻辑。
+        
+        Returns:
+            拼接后的图像
+        """
+        self.is_capturing = True
+        self.stop_event.clear()
+        self.run_capture_loop(window_handle, select_rect)
+        return self.result_image
+    
+    def run_capture_loop(self, window_handle, select_rect=None):
+        """捕获循环：在工作线程（或 run_headless 的当前线程）中运行，直到到达底部或被停止"""
+        try:
+            self.prepare_capture(window_handle, select_rect)
+            
+            # 如果启用自动滚动，开始滚动过程
+            delay = self.scroll_delay if self.auto_scroll else None
+            while delay is not None and self.wait(delay / 1000):
+                delay = self.scroll_and_capture()
+            
+            self.finished.emit(self.finish_capture())
+        except Exception as e:
+            self.logger.error(f"截图过程出错: {str(e)}", exc_info=self.logger.isEnabledFor(logging.DEBUG))
+            self.is_capturing = False
+            self.finish_capture_profile(learn=False)
+            self.finish_session_recording(error=str(e))
+            self.error.emit(str(e))
+    
+    def prepare_capture(self, window_handle, select_rect=None):
+        """初始化捕获状态并捕获第一帧"""
+        self.logger.info(f"开始捕获长截图，窗口句柄: {window_handle}")
         self.window_handle = window_handle
         self.select_rect = select_rect
-        self.screenshots = []
-        self.is_capturing = True
+        if self.incremental_stitching:
+            history = None  # 帧已经写入画布
+        else:
+            history = 'strips' if self.compact_frames else 'full'
+        self.screenshots = FrameStore(self.find_best_match, history, self.recent_frame_count, self.compress_frames)
+        # 保存全部完整帧时捕获后才拼接，没有实时预览
+        self.preview.reset()
+        self.screenshots.preview = self.preview
+        self.stitcher.preview = self.preview
+        self.frame_count = 0
+        self.frame_offsets = []
+        self.stitcher.reset()
+        self.stitcher.memory_budget = self.canvas_memory_budget
+        self.matcher.reset()
+        self.row_matcher.reset()
+        self.row_matcher.scrollbar_width = self.scrollbar_width
         self.current_scroll_count = 0
         self.same_frame_count = 0
+        self.empty_frame_count = 0
+        self.last_match = None
+        self.last_match_method = None
+        self.match_remainder = None
+        self.match_history = []
+        self.scrollbar.reset()
+        self.scrolled_distance = 0
+        self.progress_estimate = None
+        self.last_scroll_notches = 0
+        self.pre_scroll_probe = None
+        self.settle_times = []
+        self.frame_timings = []
+        self.telemetry.reset()
+        self.sticky_regions = None if self.detect_sticky else (0, 0)
+        self.first_frame = None
+        self.last_thumbnail = None
         self.result_image = None
         self.was_stopped_manually = False
         self.start_time = time.time()  # 记录开始时间
-        self.active_timers = []  # 清空定时器列表
+        self.frame_source.prepare(window_handle, select_rect)
+        self.scroll_driver.prepare(window_handle, select_rect)
+        if self.record_session_path:
+            self.session_recorder = SessionRecorder(self.record_session_path)
         
         # 检查是否为远程桌面窗口
         try:
-            class_name = win32gui.GetClassName(window_handle)
-            self.is_remote_desktop = any(name in class_name for name in ["MKSEmbedded", "VMware", "Citrix", "Remote"])
-            if self.is_remote_desktop:
-                print(f"检测到远程桌面窗口: {class_name}，将使用增强捕获模式")
+            self.is_remote_desktop = self.scroll_driver.is_remote_desktop()
         except Exception as e:
-            print(f"获取窗口类名失败: {str(e)}")
+            self.logger.warning(f"获取窗口类名失败: {str(e)}")
+        self.load_capture_profile()
         
         # 确保窗口处于活动状态
         try:
-            win32gui.SetForegroundWindow(window_handle)
-            time.sleep(0.5)  # 减少等待时间
+            with self.telemetry.phase(PHASE_FOREGROUND):
+                self.scroll_driver.activate()
+            with self.telemetry.phase(PHASE_RENDER_WAIT):
+                if self.stabilize_frames:
+                    self.wait_for_stable_frame()
+                else:
+                    self.wait(0.5)  # 减少等待时间
         except Exception as e:
-            print(f"激活窗口失败: {str(e)}")
+            self.logger.warning(f"激活窗口失败: {str(e)}")
         
         # 捕获第一帧
-        self.capture_frame()
-        
-        # 如果启用自动滚动，开始滚动过程
-        if self.auto_scroll:
-            timer = QTimer()
-            timer.timeout.connect(self.scroll_and_capture)
-            timer.setSingleShot(True)
-            timer.start(self.scroll_delay)
-            self.active_timers.append(timer)  # 跟踪定时器
-        
-    def capture_frame(self):
-        """捕获当前帧，使用更高的清晰度设置"""
+        if self.capture_frame(FRAME_INITIAL):
+            # 先滚动一格测量每格的像素数，之后按目标重叠调整（确定固定区域后改为内容区域高度）；
+            # 已经学过这个程序时直接按学到的每格像素数滚动
+            prior = self.capture_profile.get('pixels_per_notch') if self.capture_profile else None
+            self.scroll_controller.reset(len(self.screenshots[-1]), prior_pixels_per_notch=prior)
+            self.progress.emit(self.current_scroll_count, self.max_scroll_count)
+    
+    def content_view(self, frame):
+        """
+        返回帧中间的内容区域（不复制），固定的页眉/页脚只从第一帧取一次
+        
+        还没有确定固定区域时，用新帧与第一帧比较进行检测。
+        """
+        if self.sticky_regions is None:
+            return self.update_sticky_regions(frame)
+        top, bottom = self.sticky_regions
+        if bottom:
+            self.update_footer(frame)
+        if top or bottom:
+            return frame[top:len(frame) - bottom]
+        return frame
+    
+    def update_footer(self, frame):
+        """页脚取自最近一帧：滚动到底时页脚位置显示的内容也不会丢失"""
+        bottom = self.sticky_regions[1]
+        footer = np.array(to_bgr(frame[len(frame) - bottom:]))
+        self.screenshots.footer = footer
+        self.stitcher.footer = footer
+    
+    def update_sticky_regions(self, frame):
+        """
+        检测固定的页眉/页脚
+        
+        第一帧先保留下来；之后第一次出现滚动的帧中，与第一帧逐行相同的顶部和底部行就是固定区域。
+        检测到固定区域后，已经保存的帧（都与第一帧相同）改为只引用内容区域，
+        页眉取自第一帧，页脚取自最近一帧，在结果中各出现一次。
+        
+        Returns:
+            新帧的内容区域
+        """
+        if self.frame_count == 0:
+            self.first_frame = frame
+            return frame
+        
+        first = self.first_frame
+        regions = detect_sticky_rows(self.matcher.pyramid(first)[0], to_gray(frame), self.scrollbar_width)
+        if regions is None:
+            # 还没有滚动，继续等待
+            if self.frame_count < self.sticky_detect_frames:
+                return frame
+            regions = (0, 0)
+        
+        self.sticky_regions = regions
+        self.first_frame = None
+        top, bottom = regions
+        if not (top or bottom):
+            return frame
+        
+        self.logger.info(f"检测到固定区域：顶部 {top} 行，底部 {bottom} 行")
+        header = np.array(to_bgr(first[:top])) if top else None
+        footer = np.array(to_bgr(frame[len(frame) - bottom:])) if bottom else None
+        self.screenshots.set_sticky(top, bottom, header, footer)
+        if self.incremental_stitching:
+            self.stitcher.set_sticky(top, bottom, footer, self.screenshots[-1])
+        self.scroll_controller.viewport_height = len(first) - top - bottom
+        self.last_match = None
+        self.match_remainder = None
+        self.last_thumbnail = None
+        return frame[top:len(frame) - bottom]
+    
+    def wait(self, seconds):
+        """
+        等待指定时间，收到停止请求时立即返回
+        
+        Returns:
+            是否应该继续捕获
+        """
+        if seconds > 0:
+            self.stop_event.wait(seconds)
+        return self.is_capturing
+        
+    def capture_frame(self, kind=FRAME_SCROLL):
+        """
+        捕获当前帧，使用更高的清晰度设置
+        
+        Args:
+            kind: 帧的类型（录制会话时使用）：第一帧、滚动后的帧或确认到底时重新抓取的帧
+        """
         try:
-            # 获取屏幕截图
-            screen = QApplication.primaryScreen()
+            start = time.perf_counter()
+            # 运行在 tracemalloc 下时（如基准测试），同时统计这一帧分配的字节数
+            trace_alloc = tracemalloc.is_tracing() and hasattr(tracemalloc, 'reset_peak')
+            if trace_alloc:
+                traced_before = tracemalloc.get_traced_memory()[0]
+                tracemalloc.reset_peak()
             
-            # 如果有选择区域，使用选择区域
-            if self.select_rect:
-                # 使用全局坐标
-                capture_rect = self.select_rect
-            else:
-                # 使用窗口区域
-                try:
-                    window_rect = win32gui.GetWindowRect(self.window_handle)
-                    x, y, right, bottom = window_rect
-                    capture_rect = QRect(x, y, right - x, bottom - y)
-                except Exception as e:
-                    print(f"获取窗口位置失败: {str(e)}")
-                    self.finish_capture()
-                    return False
-            
-            # 捕获指定区域的截图 - 使用更高质量的设置
-            screenshot = screen.grabWindow(
-                0,  # 使用0表示整个屏幕
-                capture_rect.x(),
-                capture_rect.y(),
-                capture_rect.width(),
-                capture_rect.height()
-            )
-            
-            # 提高图像质量 - 使用高质量的图像格式
-            screenshot = screenshot.toImage()
-            screenshot.setDevicePixelRatio(1.0)  # 确保使用原始像素比
-            
-            # 转换为numpy数组 - 使用更高的位深度
-            bits = screenshot.bits()
-            bits.setsize(screenshot.sizeInBytes())
-            arr = np.frombuffer(bits, np.uint8).reshape(
-                screenshot.height(), screenshot.width(), 4
-            )
+            # 从帧来源抓取当前画面（真实屏幕为QImage内存上的BGRA视图，不复制）
+            self.telemetry.frame = self.frame_count
+            with self.telemetry.phase(PHASE_GRAB):
+                raw_frame = self.frame_source.grab()
+            with self.telemetry.phase(PHASE_CONVERT):
+                self.record_frame(raw_frame, kind)
+                if self.detect_scrollbar:
+                    self.scrollbar.update(raw_frame)
+                frame = self.content_view(raw_frame)
+                
+                # 一次生成灰度金字塔，匹配、空白检测和到底检测的缩略图都从它得到
+                self.matcher.pyramid(frame)
             
-            # 转换为BGR格式，保持完整的色彩信息
-            frame = cv2.cvtColor(arr, cv2.COLOR_BGRA2BGR)
+            # 立即拼接到画布中，只把新出现的行转换为BGR；只保留最近几帧
+            with self.telemetry.phase(PHASE_STITCH):
+                if self.incremental_stitching:
+                    self.stitcher.add(frame)
+                self.screenshots.append(frame)
+            self.frame_count += 1
             
-            # 保存截图
-            self.screenshots.append(frame.copy())
-            print(f"已捕获第 {len(self.screenshots)} 帧，大小: {frame.shape}")
+            allocated = tracemalloc.get_traced_memory()[1] - traced_before if trace_alloc else None
+            self.frame_timings.append((time.perf_counter() - start, allocated))
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug(f"已捕获第 {self.frame_count} 帧，大小: {frame.shape}")
             
             return True
         except Exception as e:
-            print(f"捕获帧错误: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            self.logger.error(f"捕获帧错误: {str(e)}", exc_info=self.logger.isEnabledFor(logging.DEBUG))
             return False
     
     def scroll_and_capture(self):
-        """滚动并捕获下一帧"""
+        """
+        滚动并捕获下一帧
+        
+        Returns:
+            下一次滚动前的等待时间（毫秒），None 表示捕获结束
+        """
         # 立即检查是否应该停止
         if not self.is_capturing:
-            print("截图已被终止，停止滚动")
-            return
+            self.logger.info("截图已被终止，停止滚动")
+            return None
         
         # 检查是否超时
         if time.time() - self.start_time > self.timeout:
-            print(f"截图超时（{self.timeout}秒），自动停止")
+            self.logger.info(f"截图超时（{self.timeout}秒），自动停止")
             self.is_capturing = False
-            self.finish_capture()
-            return
+            return None
         
         # 检查是否达到最大滚动次数
         if self.current_scroll_count >= self.max_scroll_count:
-            print(f"达到最大滚动次数 ({self.max_scroll_count})，完成截图")
+            self.logger.info(f"达到最大滚动次数 ({self.max_scroll_count})，完成截图")
             self.is_capturing = False
-            self.finish_capture()
-            return
+            return None
         
         # 执行滚动
-        if self.perform_scroll():
-            # 再次检查是否应该停止（滚动后）
-            if not self.is_capturing:
-                print("截图已被终止，停止捕获")
-                return
-            
-            # 等待页面渲染 - 减少等待时间
-            wait_time = 0.1 if self.is_remote_desktop else 0.05  # 进一步减少等待时间
-            
-            # 分段等待，每次检查是否应该停止
-            wait_start = time.time()
-            while time.time() - wait_start < wait_time:
-                if not self.is_capturing:
-                    print("等待渲染过程中检测到终止请求，停止捕获")
-                    return
-                time.sleep(0.01)  # 每10毫秒检查一次
-            
-            # 再次检查是否应该停止（等待后）
-            if not self.is_capturing:
-                print("截图已被终止，停止捕获")
-                return
-            
-            # 捕获当前帧
-            if self.capture_frame():
-                # 检查是否到达底部
-                if self.check_end_of_scroll():
-                    print("检测到已到达底部，完成截图")
-                    self.is_capturing = False
-                    self.finish_capture()
-                    return
-                
-                # 再次检查是否应该停止（捕获后）
-                if not self.is_capturing:
-                    print("截图已被终止，停止继续滚动")
-                    return
-                
-                # 继续滚动和捕获
-                self.current_scroll_count += 1
-                
-                # 使用更短的延迟
-                next_delay = self.scroll_delay
-                # 如果已经滚动了很多次，可以加快速度
-                if self.current_scroll_count > 10:
-                    next_delay = max(200, self.scroll_delay - 200)  # 最小200毫秒
-                    
-                # 使用QTimer而不是QTimer.singleShot，这样可以跟踪和停止它
-                timer = QTimer()
-                timer.timeout.connect(self.scroll_and_capture)
-                timer.setSingleShot(True)
-                timer.start(next_delay)
-                self.active_timers.append(timer)  # 跟踪定时器
-            else:
-                print("捕获帧失败，完成截图")
+        if not self.perform_scroll():
+            if self.is_capturing:
+                self.logger.info("滚动失败，完成截图")
                 self.is_capturing = False
-                self.finish_capture()
-        else:
-            print("滚动失败，完成截图")
+            return None
+        
+        # 等待页面渲染，期间收到终止请求立即返回
+        with self.telemetry.phase(PHASE_RENDER_WAIT):
+            if self.stabilize_frames:
+                rendered = self.wait_for_stable_frame(self.pre_scroll_probe)
+            else:
+                rendered = self.wait(0.1 if self.is_remote_desktop else 0.05)  # 进一步减少等待时间
+        if not rendered:
+            self.logger.info("等待渲染过程中检测到终止请求，停止捕获")
+            return None
+        
+        # 捕获当前帧
+        if not self.capture_frame():
+            self.logger.info("捕获帧失败，完成截图")
             self.is_capturing = False
-            self.finish_capture()
+            return None
+        
+        # 用这次滚动测得的偏移更新滚动步长（拼接时已经计算，不会重复匹配）
+        distance, reliable = self.frame_motion(self.screenshots[-2], self.screenshots[-1])
+        self.scroll_controller.record(self.last_scroll_notches, distance, reliable)
+        self.scrolled_distance += distance
+        self.update_progress_estimate()
+        
+        # 检查是否到达底部
+        with self.telemetry.phase(PHASE_END_CHECK):
+            reached_end = self.check_end_of_scroll()
+        if reached_end:
+            self.logger.info("检测到已到达底部，完成截图")
+            self.is_capturing = False
+            return None
+        
+        # 再次检查是否应该停止（捕获后）
+        if not self.is_capturing:
+            self.logger.info("截图已被终止，停止继续滚动")
+            return None
+        
+        # 继续滚动和捕获
+        self.current_scroll_count += 1
+        self.progress.emit(self.current_scroll_count, self.max_scroll_count)
+        
+        # 画面稳定后立即进行下一次滚动
+        if self.stabilize_frames:
+            return 0
+        
+        # 使用更短的延迟
+        next_delay = self.scroll_delay
+        # 如果已经滚动了很多次，可以加快速度
+        if self.current_scroll_count > 10:
+            next_delay = max(200, self.scroll_delay - 200)  # 最小200毫秒
+        return next_delay
     
     def perform_scroll(self):
         """执行滚动操作，增强滚动可靠性"""
+        # 稳定性探测模式下不需要固定等待，画面稳定后才会捕获
+        pause = 0 if self.stabilize_frames else 0.05
         try:
             # 检查是否应该停止
             if not self.is_capturing:
-                print("滚动前检测到终止请求，停止滚动")
+                self.logger.debug("滚动前检测到终止请求，停止滚动")
                 return False
             
             # 确保窗口处于活动状态
             try:
-                win32gui.SetForegroundWindow(self.window_handle)
-                # 分段等待，每次检查是否应该停止
-                wait_start = time.time()
-                while time.time() - wait_start < 0.05:  # 进一步减少等待时间到0.05秒
-                    if not self.is_capturing:
-                        print("激活窗口过程中检测到终止请求，停止滚动")
-                        return False
-                    time.sleep(0.01)  # 每10毫秒检查一次
+                with self.telemetry.phase(PHASE_FOREGROUND):
+                    self.scroll_driver.activate()
+                    # 等待期间收到终止请求立即返回
+                    activated = self.wait(pause)  # 进一步减少等待时间到0.05秒
+                if not activated:
+                    self.logger.debug("激活窗口过程中检测到终止请求，停止滚动")
+                    return False
             except Exception as e:
-                print(f"设置前台窗口失败: {str(e)}，尝试继续滚动")
+                self.logger.warning(f"设置前台窗口失败: {str(e)}，尝试继续滚动")
             
             # 检查是否应该停止
             if not self.is_capturing:
-                print("激活窗口后检测到终止请求，停止滚动")
+                self.logger.debug("激活窗口后检测到终止请求，停止滚动")
                 return False
             
-            # 获取窗口中心点或选区中心点
-            if self.select_rect:
-                center_x = self.select_rect.x() + self.select_rect.width() // 2
-                center_y = self.select_rect.y() + self.select_rect.height() // 2
-            else:
-                rect = win32gui.GetWindowRect(self.window_handle)
-                center_x = (rect[0] + rect[2]) // 2
-                center_y = (rect[1] + rect[3]) // 2
-            
-            # 保存当前鼠标位置
-            original_pos = QCursor.pos()
-            
-            # 移动鼠标到中心点
-            QCursor.setPos(center_x, center_y)
-            
-            # 分段等待，每次检查是否应该停止
-            wait_start = time.time()
-            while time.time() - wait_start < 0.05:  # 进一步减少等待时间到0.05秒
-                if not self.is_capturing:
-                    print("移动鼠标过程中检测到终止请求，停止滚动")
-                    # 恢复鼠标位置
-                    QCursor.setPos(original_pos)
-                    return False
-                time.sleep(0.01)  # 每10毫秒检查一次
+            # 保存当前鼠标位置并移动鼠标到窗口中心点或选区中心点
+            with self.telemetry.phase(PHASE_CURSOR):
+                original_pos = self.scroll_driver.move_pointer()
+                # 等待期间收到终止请求立即返回
+                moved = self.wait(pause)  # 进一步减少等待时间到0.05秒
+            if not moved:
+                self.logger.debug("移动鼠标过程中检测到终止请求，停止滚动")
+                # 恢复鼠标位置
+                self.scroll_driver.restore_pointer(original_pos)
+                return False
             
             # 检查是否应该停止
             if not self.is_capturing:
-                print("移动鼠标后检测到终止请求，停止滚动")
+                self.logger.debug("移动鼠标后检测到终止请求，停止滚动")
                 # 恢复鼠标位置
-                QCursor.setPos(original_pos)
+                self.scroll_driver.restore_pointer(original_pos)
                 return False
             
-            # 模拟滚动 - 根据是否为远程桌面调整滚动力度
-            if self.is_remote_desktop:
-                # 远程桌面使用更强的滚动
-                scroll_count = 2  # 进一步减少滚动次数
-                scroll_value = -240  # 更大滚动值
-                scroll_interval = 0.03  # 进一步减少滚动间隔
-            else:
-                # 普通窗口使用标准滚动
-                scroll_count = 1  # 进一步减少滚动次数
-                scroll_value = -120
-                scroll_interval = 0.02  # 进一步减少滚动间隔
-            
-            # 如果已经滚动了很多次但内容没有明显变化，增加滚动力度
-            if self.current_scroll_count > 15 and self.same_frame_count > 1:
-                print("检测到可能的滚动困难，增加滚动力度")
-                scroll_count += 1
-                scroll_value *= 1.5
-            
-            # 如果是强制滚动，使用更大的滚动值
-            if self.forced_scroll_count > 0:
-                scroll_count += 1
-                scroll_value *= 2
-                print(f"执行强制滚动 ({self.forced_scroll_count}/{self.max_forced_scroll})，增加滚动力度")
-                
+            # 滚动格数由步长控制器根据测得的每格像素数和目标重叠决定
+            notches = self.scroll_controller.next_notches()
+            # 远程桌面每个滚轮事件最多2格，普通窗口最多3格，分成若干次发送
+            notches_per_event = 2 if self.is_remote_desktop else 3
+            scroll_interval = 0.03 if self.is_remote_desktop else 0.02
+            wheel_events = [min(notches_per_event, notches - i) for i in range(0, notches, notches_per_event)]
+            scroll_count = len(wheel_events)
+            self.scroll_controller.min_overlap = self.required_overlap(self.scroll_controller.viewport_height)
+            
+            # 记录滚动前的画面，用于判断滚动是否已经开始渲染
+            if self.stabilize_frames:
+                self.pre_scroll_probe = self.frame_source.grab_probe()
+            
             # 执行滚动
             success = False
-            for i in range(scroll_count):
-                # 检查是否应该停止
-                if not self.is_capturing:
-                    print(f"滚动过程中检测到终止请求 (第{i+1}/{scroll_count}次)，停止滚动")
-                    # 恢复鼠标位置
-                    QCursor.setPos(original_pos)
-                    return False
-                
-                win32api.mouse_event(
-                    win32con.MOUSEEVENTF_WHEEL,
-                    0, 0,
-                    int(scroll_value),
-                    0
-                )
-                
-                # 分段等待，每次检查是否应该停止
-                wait_start = time.time()
-                while time.time() - wait_start < scroll_interval:
+            self.last_scroll_notches = 0
+            with self.telemetry.phase(PHASE_WHEEL):
+                for i, event_notches in enumerate(wheel_events):
+                    # 检查是否应该停止
                     if not self.is_capturing:
-                        print(f"滚动间隔中检测到终止请求 (第{i+1}/{scroll_count}次)，停止滚动")
+                        if self.logger.isEnabledFor(logging.DEBUG):
+                            self.logger.debug(f"滚动过程中检测到终止请求 (第{i+1}/{scroll_count}次)，停止滚动")
                         # 恢复鼠标位置
-                        QCursor.setPos(original_pos)
+                        self.scroll_driver.restore_pointer(original_pos)
                         return False
-                    time.sleep(0.01)  # 每10毫秒检查一次
-                
-                success = True
+                    
+                    self.scroll_driver.wheel(-WHEEL_DELTA * event_notches)
+                    self.last_scroll_notches += event_notches
+                    
+                    # 等待期间收到终止请求立即返回
+                    if not self.wait(scroll_interval):
+                        if self.logger.isEnabledFor(logging.DEBUG):
+                            self.logger.debug(f"滚动间隔中检测到终止请求 (第{i+1}/{scroll_count}次)，停止滚动")
+                        # 恢复鼠标位置
+                        self.scroll_driver.restore_pointer(original_pos)
+                        return False
+                    
+                    success = True
             
             # 恢复鼠标位置
-            QCursor.setPos(original_pos)
+            self.scroll_driver.restore_pointer(original_pos)
             
             # 如果滚动次数较多，增加额外的等待时间让页面完全加载
-            if self.current_scroll_count > 20:
-                # 分段等待，每次检查是否应该停止
-                wait_start = time.time()
-                while time.time() - wait_start < 0.05:  # 进一步减少等待时间到0.05秒
-                    if not self.is_capturing:
-                        print("额外等待过程中检测到终止请求，停止滚动")
-                        return False
-                    time.sleep(0.01)  # 每10毫秒检查一次
+            if self.current_scroll_count > 20 and not self.stabilize_frames:
+                # 等待期间收到终止请求立即返回
+                if not self.wait(0.05):  # 进一步减少等待时间到0.05秒
+                    self.logger.debug("额外等待过程中检测到终止请求，停止滚动")
+                    return False
                 
             # 记录滚动时间
             self.last_scroll_time = time.time()
             
             return success
         except Exception as e:
-            print(f"滚动错误: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            self.logger.error(f"滚动错误: {str(e)}", exc_info=self.logger.isEnabledFor(logging.DEBUG))
             # 即使出错也尝试继续
             return True
     
     def check_end_of_scroll(self):
-        """检查是否到达滚动底部，增强容错性"""
+        """
+        检查是否到达滚动底部
+        
+        复用拼接时已经计算的帧间偏移，并比较两帧的小缩略图：
+        偏移可信地为0且缩略图没有变化时，一帧即可确认已到达底部；
+        只有缩略图证据时，需要连续 max_same_frames 帧没有变化。
+        """
         # 至少需要两帧才能比较
         if len(self.screenshots) < 2:
             return False
         
         try:
+            # 滚动条已经表明到底时不需要再滚动和确认
+            if self.scrollbar_at_end():
+                self.logger.info("滚动条滑块已到达末端")
+                return True
+            
             # 获取最后两帧
             current_frame = self.screenshots[-1]
             previous_frame = self.screenshots[-2]
             
-            # 计算相似度
-            similarity = self.calculate_image_similarity(current_frame, previous_frame)
-            print(f"帧相似度: {similarity}")
-            
             # 检查当前帧是否为空白帧（几乎全白或全黑）
-            is_empty_frame = self.is_empty_frame(current_frame)
-            if is_empty_frame:
+            empty = self.is_empty_frame(current_frame)
+            if empty and self.stabilize_frames and self.refresh_frame():
+                # 内容在等待期间加载出来了，用重新抓取的帧继续判断
+                current_frame = self.screenshots[-1]
+                empty = self.is_empty_frame(current_frame)
+            
+            # 内容证据：拼接时计算的帧间偏移
+            distance, reliable = self.frame_motion(previous_frame, current_frame)
+            moving = reliable and distance > 0
+            # 画面证据：缩略图的平均差异
+            difference = self.thumbnail_difference(previous_frame, current_frame)
+            threshold = 3.0 if self.is_remote_desktop else 1.5
+            unchanged = difference < threshold
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug(f"帧间偏移: {distance}, 缩略图差异: {difference:.2f}")
+            
+            # 空白帧只在内容既没有可信地移动、画面也没有变化时计数：
+            # 文档中比视口更高的空白仍在滚动，新内容出现在底部时画面会变化，都不是到底
+            if empty and not moving and unchanged:
                 self.empty_frame_count += 1
-                print(f"检测到空白帧 ({self.empty_frame_count}/{self.max_empty_frames})")
+                if self.logger.isEnabledFor(logging.DEBUG):
+                    self.logger.debug(f"检测到空白帧 ({self.empty_frame_count}/{self.max_empty_frames})")
+                # 新内容可能还没加载出来，缩小步长让后续帧覆盖这段空白
+                self.scroll_controller.back_off()
                 # 如果连续空白帧数量达到阈值，认为已到达底部
                 if self.empty_frame_count >= self.max_empty_frames:
                     return True
             else:
                 self.empty_frame_count = 0  # 重置空白帧计数
             
-            # 远程桌面使用更低的相似度阈值
-            threshold = 0.85 if self.is_remote_desktop else 0.90  # 降低相似度阈值，更容易判断结束
-            
-            # 如果相似度超过阈值，可能已到达底部
-            if similarity > threshold:
+            if moving:
+                # 内容确实在滚动
+                self.same_frame_count = 0
+            elif unchanged and reliable:
+                # 目标窗口可能还没渲染出滚动结果，稍等后重新抓取一次确认
+                if self.confirm_no_movement(current_frame):
+                    self.logger.info("偏移为0且画面没有变化，确认已到达底部")
+                    return True
+                self.same_frame_count = 0
+            elif unchanged:
                 self.same_frame_count += 1
-                print(f"检测到相似帧 ({self.same_frame_count}/{self.max_same_frames})")
-                
+                if self.logger.isEnabledFor(logging.DEBUG):
+                    self.logger.debug(f"检测到相似帧 ({self.same_frame_count}/{self.max_same_frames})")
                 # 如果连续相似帧达到阈值，认为已到达底部
                 if self.same_frame_count >= self.max_same_frames:
-                    # 额外检查：确保不是因为滚动失败而误判为到达底部
-                    # 如果当前滚动次数太少，可能是滚动失败而不是真的到底了
-                    if self.current_scroll_count < 10:  # 减少滚动次数阈值
-                        # 尝试额外滚动几次
-                        print("滚动次数较少，尝试额外滚动以确认是否真的到底")
-                        self.forced_scroll_count += 1
-                        if self.forced_scroll_count <= self.max_forced_scroll:
-                            # 执行更强力的滚动
-                            for _ in range(3):  # 减少强制滚动次数
-                                win32api.mouse_event(
-                                    win32con.MOUSEEVENTF_WHEEL,
-                                    0, 0,
-                                    -300,  # 更大的滚动值
-                                    0
-                                )
-                                time.sleep(0.1)  # 减少等待时间
-                            return False
                     return True
             else:
                 self.same_frame_count = 0
-                self.forced_scroll_count = 0  # 重置强制滚动计数
-            
-            # 额外检查：如果已经滚动了很多次但内容变化很小，可能是卡住了
-            if self.current_scroll_count > 15:  # 减少滚动次数阈值
-                # 计算最后几帧的平均相似度
-                if len(self.screenshots) >= 3:  # 减少比较帧数
-                    recent_similarities = []
-                    for i in range(len(self.screenshots)-1, max(0, len(self.screenshots)-3), -1):
-                        if i > 0:
-                            sim = self.calculate_image_similarity(self.screenshots[i], self.screenshots[i-1])
-                            recent_similarities.append(sim)
-                    
-                    if recent_similarities and sum(recent_similarities)/len(recent_similarities) > 0.95:  # 降低相似度阈值
-                        print("最近几帧相似度很高，可能滚动卡住，尝试强制滚动")
-                        # 执行更强力的滚动
-                        for _ in range(3):  # 减少强制滚动次数
-                            win32api.mouse_event(
-                                win32con.MOUSEEVENTF_WHEEL,
-                                0, 0,
-                                -300,  # 更大的滚动值
-                                0
-                            )
-                            time.sleep(0.1)  # 减少等待时间
-            
-            # 检查滚动间隔，防止滚动过快
+            
+            # 检查滚动间隔，防止滚动过快（稳定性探测模式下已经等待画面稳定）
             current_time = time.time()
-            if current_time - self.last_scroll_time < 0.3:  # 减少滚动间隔
-                time.sleep(0.3 - (current_time - self.last_scroll_time))
+            if not self.stabilize_frames and current_time - self.last_scroll_time < 0.3:  # 减少滚动间隔
+                self.wait(0.3 - (current_time - self.last_scroll_time))
             self.last_scroll_time = time.time()
             
             return False
         except Exception as e:
-            print(f"检查滚动结束错误: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            self.logger.error(f"检查滚动结束错误: {str(e)}", exc_info=self.logger.isEnabledFor(logging.DEBUG))
             # 出错时不要立即结束，给予更多容错机会
             return False
     
-    def calculate_image_similarity(self, img1, img2):
-        """计算两个图像的相似度"""
-        try:
-            # 确保两个图像大小相同
-            if img1.shape != img2.shape:
-                # 调整大小以匹配
-                img2 = cv2.resize(img2, (img1.shape[1], img1.shape[0]))
-            
-            # 对于远程桌面，使用更简单的相似度计算方法
-            if self.is_remote_desktop:
-                # 转换为灰度图像
-                gray1 = cv2.cvtColor(img1, cv2.COLOR_BGR2GRAY)
-                gray2 = cv2.cvtColor(img2, cv2.COLOR_BGR2GRAY)
-                
-                # 计算绝对差异
-                diff = cv2.absdiff(gray1, gray2)
-                
-                # 计算相似度（1 - 归一化差异）
-                similarity = 1.0 - (np.sum(diff) / (255.0 * diff.size))
-                return similarity
-            else:
-                # 使用模板匹配
-                result = cv2.matchTemplate(img1, img2, cv2.TM_CCOEFF_NORMED)
-                return result.max()
-        except Exception as e:
-            print(f"计算图像相似度错误: {str(e)}")
-            return 0.0
+    def update_progress_estimate(self):
+        """
+        根据滚动条估计文档总高度、完成百分比和剩余帧数
+        
+        滑块较长时用可见比例（滑块长度/轨道长度）估计文档高度；已经滚动一段距离后改用
+        滚动位置与实际滚动像素数的比例，不受滑块最小长度的限制。
+        """
+        state = self.scrollbar.state if self.detect_scrollbar else None
+        if state is None:
+            self.progress_estimate = None
+            return
+        viewport = self.scroll_controller.viewport_height
+        scrolled = self.scrolled_distance
+        if state.position > 0.05 and scrolled > 0:
+            document_height = viewport + scrolled / state.position
+        else:
+            document_height = viewport / state.visible_fraction
+        document_height = max(document_height, scrolled + viewport)
+        remaining = document_height - scrolled - viewport
+        scrolls = self.scroll_controller.record_count
+        advance = scrolled / scrolls if scrolls and scrolled > 0 else None
+        self.progress_estimate = {
+            'percent': min(100.0, (scrolled + viewport) * 100.0 / document_height),
+            'document_height': int(round(document_height)),
+            'remaining_frames': math.ceil(remaining / advance) if advance else None,
+        }
+    
+    def scrollbar_at_end(self):
+        """
+        滚动条滑块是否已经到达轨道末端，并且内容确实已经滚动到底
+        
+        滑块的一个像素可能对应多行内容，滑块到达末端时还可能剩下几行。
+        以下情况可以确定已经到底：最近一次滚动没有移动，或移动的距离少于按格数预期的距离（被文档末尾截断），
+        或者滑块位置已经精确到行（文档高度不超过轨道长度）。
+        """
+        if not self.detect_scrollbar or not self.scrollbar.at_end:
+            return False
+        distance, reliable = self.frame_motion(self.screenshots[-2], self.screenshots[-1])
+        if not reliable:
+            return False
+        if distance == 0:
+            return True
+        pixels_per_notch = self.scroll_controller.measured_pixels_per_notch
+        if pixels_per_notch and self.last_scroll_notches:
+            expected = pixels_per_notch * self.last_scroll_notches
+            if distance < expected - max(2, expected * 0.05):
+                return True
+        estimate = self.progress_estimate
+        return estimate is not None and estimate['document_height'] <= self.scrollbar.state.track_length
+    
+    def wait_for_stable_frame(self, reference_probe=None):
+        """
+        轮询小探测图，直到画面稳定
+        
+        先等待画面相对滚动前开始变化（目标程序可能还没有响应滚动），再等待连续两张探测图一致，
+        平滑滚动的动画帧和渲染到一半的画面因此不会被捕获。超过 settle_timeout 时不再等待；
+        画面在 no_change_window 内一直没有变化时（通常已经到底）认为画面已经稳定。
+        只有画面变化后稳定下来的等待时间记入 settle_times，超时不计入，以免抬高学到的稳定时间。
+        
+        Args:
+            reference_probe: 滚动前的探测图，None 表示不需要等待画面变化
+        
+        Returns:
+            是否应该继续捕获
+        """
+        start = time.monotonic()
+        timeout = self.settle_timeout * (2 if self.is_remote_desktop else 1)
+        no_change_window = self.no_change_window(timeout)
+        changed = reference_probe is None
+        previous = None
+        while time.monotonic() - start < timeout:
+            if not self.wait(self.probe_interval):
+                return False
+            probe = self.frame_source.grab_probe()
+            if not changed:
+                changed = cv2.absdiff(probe, reference_probe).mean() > self.probe_tolerance
+                if not changed and time.monotonic() - start >= no_change_window:
+                    # 目标程序通常在学到的稳定时间内就开始响应，之后仍没有变化说明画面不会再变
+                    return True
+            elif previous is not None and cv2.absdiff(probe, previous).mean() <= self.probe_tolerance:
+                self.settle_times.append(time.monotonic() - start)
+                return True
+            previous = probe
+        
+        # 画面一直在变化（动画），按超时处理
+        return self.is_capturing
+    
+    def no_change_window(self, timeout):
+        """
+        画面没有变化时最多等待的时间
+        
+        取本次捕获已测得的稳定时间的90分位（还没有测量结果时用已学习参数中的稳定时间）的两倍，
+        至少 no_change_probes 次探测；两者都没有时等待到超时。
+        """
+        if self.settle_times:
+            settle_time = float(np.percentile(self.settle_times, 90))
+        elif self.capture_profile and self.capture_profile.get('settle_time') is not None:
+            settle_time = self.capture_profile['settle_time']
+        else:
+            return timeout
+        return min(timeout, max(settle_time * 2, self.no_change_probes * self.probe_interval))
+    
+    def refresh_frame(self):
+        """
+        最新一帧内容很少时（页面可能还在延迟加载），等待画面变化并稳定后在同一位置重新抓取
+        
+        画面稳定后立即捕获会比固定等待更早，延迟加载的占位空白更容易被捕获进来。
+        
+        Returns:
+            是否重新抓取了帧
+        """
+        reference = self.frame_source.grab_probe()
+        if not self.wait_for_stable_frame(reference):
+            return False
+        if cv2.absdiff(self.frame_source.grab_probe(), reference).mean() <= self.probe_tolerance:
+            return False
+        
+        self.telemetry.frame = self.frame_count
+        with self.telemetry.phase(PHASE_GRAB):
+            raw_frame = self.frame_source.grab()
+        with self.telemetry.phase(PHASE_CONVERT):
+            self.record_frame(raw_frame, FRAME_REFRESH)
+            if self.detect_scrollbar:
+                self.scrollbar.update(raw_frame)
+            frame = self.content_view(raw_frame)
+        with self.telemetry.phase(PHASE_STITCH):
+            if self.incremental_stitching:
+                self.stitcher.add_refreshed(frame)
+            self.screenshots.append(frame, distance=0)
+        self.frame_count += 1
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(f"内容加载后重新抓取第 {self.frame_count} 帧")
+        return True
+    
+    def confirm_no_movement(self, frame):
+        """
+        等待 end_confirm_delay 后重新抓取一帧，确认画面确实没有滚动
+        
+        新抓取的帧同样会被捕获并拼接；画面已经变化时捕获继续进行。
+        
+        Returns:
+            画面是否仍然没有变化
+        """
+        if not self.wait(self.end_confirm_delay):
+            return False
+        if not self.capture_frame(FRAME_CONFIRM):
+            return True
+        
+        # 与原帧相同的新帧拼接时偏移为0，不影响结果
+        distance, reliable = self.frame_motion(frame, self.screenshots[-1])
+        return reliable and distance == 0
+    
+    def frame_motion(self, previous_frame, current_frame):
+        """
+        返回两帧之间的滚动距离，优先复用拼接时已经计算的结果
+        
+        Returns:
+            (滚动距离, 结果是否可信)
+        """
+        last = self.last_match
+        if last is None or last[0] is not previous_frame or last[1] is not current_frame:
+            self.find_best_match(previous_frame, current_frame)
+            last = self.last_match
+        return last[2], last[3]
+    
+    def thumbnail(self, frame):
+        """返回帧的灰度小缩略图，最近一帧的结果会被缓存"""
+        if self.last_thumbnail is not None and self.last_thumbnail[0] is frame:
+            return self.last_thumbnail[1]
+        
+        # 从灰度金字塔的最小一层缩小，不再处理整帧
+        thumbnail = cv2.resize(self.matcher.pyramid(frame)[-1], self.thumbnail_size, interpolation=cv2.INTER_AREA)
+        self.last_thumbnail = (frame, thumbnail)
+        return thumbnail
+    
+    def thumbnail_difference(self, previous_frame, current_frame):
+        """两帧缩略图的平均灰度差异"""
+        previous = self.thumbnail(previous_frame)
+        current = self.thumbnail(current_frame)
+        return float(cv2.absdiff(previous, current).mean())
     
     def is_empty_frame(self, frame):
         """检查帧是否为空白（几乎全白或全黑）"""
         try:
-            # 转换为灰度图像
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            # 灰度图像（捕获时已经生成）
+            gray = self.matcher.pyramid(frame)[0]
             
             # 计算平均亮度和标准差
             mean, std = cv2.meanStdDev(gray)
@@ -490,207 +829,354 @@ class LongScreenshotCapture:
             
             return is_white or is_black or is_low_content
         except Exception as e:
-            print(f"检查空白帧错误: {str(e)}")
+            self.logger.error(f"检查空白帧错误: {str(e)}")
             return False
     
     def stop_capture(self):
         """立即停止截图过程"""
-        print("用户手动停止截图")
+        self.logger.info("用户手动停止截图")
+        return self._stop_and_collect()
+    
+    def _stop_and_collect(self):
+        """请求停止捕获，等待工作线程结束并返回已捕获内容的拼接结果"""
         self.was_stopped_manually = True
         self.is_capturing = False
+        self.stop_event.set()  # 唤醒工作线程中所有等待
         
-        # 停止所有活动的定时器
-        for timer in self.active_timers:
-            if timer.isActive():
-                timer.stop()
-                print(f"停止定时器: {timer}")
-        
-        # 清空定时器列表
-        self.active_timers = []
+        if self.worker_thread is not None and self.worker_thread.isRunning():
+            # 工作线程结束前会完成拼接；等待期间继续处理GUI事件，
+            # 让工作线程转发到GUI线程的截屏调用能够完成，避免互相等待
+            while not self.worker_thread.wait(20):
+                QApplication.processEvents()
+            return self.result_image
         
         # 如果已经有截图，则处理已有的截图
-        if len(self.screenshots) > 0:
+        if self.result_image is None and len(self.screenshots) > 0:
             return self.finish_capture()
-        return None
+        return self.result_image
     
     def finish_capture(self):
         """完成捕获并拼接图像"""
         if self.was_stopped_manually:
-            print(f"用户终止截图，处理已捕获的 {len(self.screenshots)} 帧")
+            self.logger.info(f"用户终止截图，处理已捕获的 {self.frame_count} 帧")
         else:
-            print(f"完成捕获，共 {len(self.screenshots)} 帧")
+            self.logger.info(f"完成捕获，共 {self.frame_count} 帧")
         
         self.is_capturing = False
         
         if not self.screenshots:
-            print("没有捕获到任何截图")
+            self.logger.info("没有捕获到任何截图")
             return None
         
-        # 拼接图像
-        self.result_image = self.stitch_images()
+        if self.incremental_stitching:
+            # 每帧捕获时已经拼接完成，直接取结果
+            self.result_image = self.stitcher.result()
+            self.frame_offsets = self.stitcher.offsets
+            self.logger.info(f"拼接完成，最终图像大小: {self.result_image.shape}")
+        else:
+            # 拼接图像
+            with self.telemetry.phase(PHASE_STITCH):
+                self.result_image = self.stitch_images()
+        
+        stats = self.capture_stats()
+        self.logger.info(f"捕获统计: {stats['frames']} 帧, 输出高度 {stats['output_height']} 像素, "
+                         f"每输出像素帧数 {stats['frames_per_output_pixel']:.5f}, "
+                         f"每格滚动 {stats['pixels_per_notch']} 像素")
+        self.finish_capture_profile()
+        self.finish_session_recording()
         return self.result_image
     
+    def load_capture_profile(self):
+        """查找目标程序已学习的参数，用作本次捕获的初始值"""
+        restore_defaults(self.profile_overrides)
+        self.profile_overrides = []
+        self.capture_profile = None
+        self.application = None
+        try:
+            self.application = self.scroll_driver.target_application()
+        except Exception as e:
+            self.logger.warning(f"获取目标程序失败: {str(e)}")
+        if self.profile_store is None or self.application is None:
+            return
+        
+        self.capture_profile = self.profile_store.get(profile_key(*self.application))
+        if self.capture_profile is None:
+            return
+        self.profile_overrides = apply_profile(self, self.capture_profile)
+        self.logger.info(f"使用已学习的捕获参数: 每格 {self.capture_profile.get('pixels_per_notch')} 像素, "
+                         f"稳定时间 {self.capture_profile.get('settle_time')} 秒, "
+                         f"已学习 {self.capture_profile.get('sessions')} 次")
+    
+    def finish_capture_profile(self, learn=True):
+        """把本次捕获测得的参数保存到目标程序的配置中，并恢复被修改的默认值"""
+        restore_defaults(self.profile_overrides)
+        self.profile_overrides = []
+        if not learn or self.profile_store is None or self.application is None:
+            return
+        try:
+            observation = observe_capture(self)
+            if observation is not None:
+                self.profile_store.update(profile_key(*self.application), observation)
+        except Exception as e:
+            self.logger.error(f"保存捕获参数失败: {str(e)}")
+    
+    def record_frame(self, frame, kind):
+        """开启录制时，把抓取到的原始帧连同时间和滚动信息写入会话文件"""
+        if self.session_recorder is None:
+            return
+        info = {'time': round(time.time() - self.start_time, 4)}
+        if kind == FRAME_SCROLL:
+            info['notches'] = self.last_scroll_notches
+            if self.stabilize_frames and self.settle_times:
+                info['settle_time'] = round(self.settle_times[-1], 4)
+        self.session_recorder.add_frame(frame, kind, **info)
+    
+    def finish_session_recording(self, error=None):
+        """写入会话的设置和拼接结果，生成会话文件"""
+        recorder, self.session_recorder = self.session_recorder, None
+        if recorder is None:
+            return
+        try:
+            path = recorder.close(
+                settings={name: getattr(self, name) for name in SESSION_SETTINGS},
+                remote_desktop=self.is_remote_desktop,
+                application=list(self.application) if self.application else None,
+                sticky_regions=self.sticky_regions,
+                frame_offsets=[int(offset) for offset in self.frame_offsets],
+                result_shape=list(self.result_image.shape) if self.result_image is not None else None,
+                stopped_manually=self.was_stopped_manually,
+                error=error,
+            )
+            self.logger.info(f"捕获会话已录制到: {path}")
+        except Exception as e:
+            self.logger.error(f"保存捕获会话失败: {str(e)}")
+    
     def stitch_images(self):
-        """拼接图像 - 使用 ShareX 的方法，支持更大的图像"""
+        """拼接图像 - 使用 ShareX 的方法，支持更大的图像（关闭增量拼接时在捕获结束后使用）"""
         if not self.screenshots:
             return None
         
         try:
-            print("开始拼接图像...")
+            self.logger.info("开始拼接图像...")
             
             # 如果只有一帧，直接返回
             if len(self.screenshots) == 1:
-                print("只有一帧，无需拼接")
-                return self.screenshots[0]
-            
-            # 获取所有图像的尺寸
-            frames = self.screenshots
-            height, width = frames[0].shape[:2]
-            
-            # 使用 ShareX 的拼接方法
-            # 1. 计算每帧的重叠区域
-            # 2. 找到最佳匹配点
-            # 3. 拼接图像
-            
-            # 初始化结果图像
-            total_height = height  # 初始高度为第一帧的高度
+                self.logger.info("只有一帧，无需拼接")
+                return to_bgr(self.screenshots[-1])
             
-            # 计算每帧的偏移量
-            offsets = [0]  # 第一帧的偏移量为0
+            if self.screenshots.history == 'strips':
+                # 捕获时已经计算了偏移并只保存了每帧新出现的条带，按位置写入即可
+                strips = self.screenshots.iter_strips()
+                offsets = self.screenshots.offsets
+                total_height = self.screenshots.result_height
+            else:
+                strips, offsets = self.match_frames(self.screenshots.frames)
+                total_height = max(top + len(rows) for top, rows in strips)
             
-            # 对每一对相邻帧计算最佳匹配点
-            for i in range(1, len(frames)):
-                prev_frame = frames[i-1]
-                curr_frame = frames[i]
-                
-                # 计算最佳匹配点
-                offset = self.find_best_match(prev_frame, curr_frame)
-                
-                # 累加偏移量
-                offsets.append(offsets[-1] + offset)
-                
-                # 更新总高度
-                total_height = max(total_height, offsets[-1] + height)
+            width = self.screenshots[-1].shape[1]
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug(f"计算的总高度: {total_height}")
+            self.frame_offsets = list(offsets)
             
-            print(f"计算的总高度: {total_height}")
+            # 创建结果图像：超过内存预算时使用磁盘映射文件，帧直接写入，不在内存中分段再合并
+            result, _ = allocate_canvas((total_height, width, 3), self.canvas_memory_budget)
             
-            # 如果图像太大，可能会导致内存问题，分段处理
-            max_height_per_segment = 10000  # 每段最大高度
+            # 按顺序写入各帧新出现的行
+            for y_offset, strip in strips:
+                y_end = min(y_offset + len(strip), total_height)
+                if y_end > y_offset:
+                    result[y_offset:y_end, 0:width] = to_bgr(strip[:y_end - y_offset])
             
-            if total_height > max_height_per_segment:
-                print(f"图像高度 ({total_height}) 超过阈值 ({max_height_per_segment})，将分段处理")
-                
-                # 计算需要多少段
-                num_segments = (total_height + max_height_per_segment - 1) // max_height_per_segment
-                segments = []
-                
-                for seg_idx in range(num_segments):
-                    start_y = seg_idx * max_height_per_segment
-                    end_y = min((seg_idx + 1) * max_height_per_segment, total_height)
-                    seg_height = end_y - start_y
-                    
-                    # 创建当前段的结果图像
-                    segment = np.zeros((seg_height, width, 3), dtype=np.uint8)
-                    
-                    # 找出属于当前段的帧
-                    for i, frame in enumerate(frames):
-                        y_offset = offsets[i] - start_y
-                        
-                        # 如果这一帧在当前段的范围内
-                        if -height < y_offset < seg_height:
-                            # 计算目标区域
-                            y_start = max(0, y_offset)
-                            y_end = min(y_offset + height, seg_height)
-                            h = y_end - y_start
-                            
-                            # 计算源区域
-                            src_start = 0 if y_offset >= 0 else -y_offset
-                            
-                            # 复制图像
-                            if h > 0:
-                                segment[y_start:y_end, 0:width] = frame[src_start:src_start+h, :]
-                    
-                    segments.append(segment)
-                
-                # 合并所有段
-                result = np.vstack(segments)
-                print(f"分段拼接完成，最终图像大小: {result.shape}")
-                return result
-            else:
-                # 创建结果图像
-                result = np.zeros((total_height, width, 3), dtype=np.uint8)
-                
-                # 拼接图像
-                for i, frame in enumerate(frames):
-                    y_offset = offsets[i]
-                    
-                    # 计算目标区域
-                    y_end = min(y_offset + height, total_height)
-                    h = y_end - y_offset
-                    
-                    # 复制图像
-                    if h > 0 and y_offset < total_height:
-                        result[y_offset:y_end, 0:width] = frame[:h, :]
-                
-                print(f"拼接完成，最终图像大小: {result.shape}")
-                return result
+            self.logger.info(f"拼接完成，最终图像大小: {result.shape}")
+            return result
         except Exception as e:
-            print(f"拼接图像错误: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            self.logger.error(f"拼接图像错误: {str(e)}", exc_info=self.logger.isEnabledFor(logging.DEBUG))
             
-            # 如果拼接失败，至少返回第一张图片
-            return self.screenshots[0]
+            # 如果拼接失败，至少返回最近一帧
+            return to_bgr(self.screenshots[-1])
+    
+    def match_frames(self, frames):
+        """
+        使用 ShareX 的方法计算完整帧序列中每帧的位置
+        
+        每对相邻帧的匹配互不依赖：在线程池中分批计算各帧的灰度金字塔和行签名，
+        再并行匹配每一对相邻帧（OpenCV 的转换和模板匹配期间释放 GIL），最后顺序累加偏移。
+        每批只保留当前几帧的特征，不会同时为全部帧生成金字塔。
+        
+        Returns:
+            ([(纵向位置, 帧中新出现的行)], [每帧的纵向位置])
+        """
+        workers = max(1, self.stitch_workers)
+        batch_size = workers * 4
+        distances, previous = [], None
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for start in range(0, len(frames), batch_size):
+                features = list(executor.map(self.frame_features, frames[start:start + batch_size]))
+                if previous is not None:
+                    features.insert(0, previous)
+                distances.extend(executor.map(self._match_pair, features[:-1], features[1:]))
+                previous = features[-1]
+        
+        # 第一帧的偏移量为0，之后累加每一对相邻帧的滚动距离（模板匹配的距离是小数，累加后再取整）
+        # 空白区域无法匹配的帧与捕获时一样，按上一次可信的滚动距离拼接
+        positions, predicted = [0], None
+        for distance, reliable in distances:
+            if distance is None:
+                distance = predicted if predicted is not None else self.default_distance(len(frames[0]))
+            elif reliable and distance > 0:
+                predicted = distance
+            positions.append(positions[-1] + distance)
+        offsets = [int(round(position)) for position in positions]
+        
+        # 重叠区域保留先出现的内容，每帧只写入新出现的行；固定的页眉和页脚各出现一次
+        store = self.screenshots
+        strips, height = [], 0
+        if store.header is not None:
+            strips.append((0, store.header))
+            height = store.top
+        for y_offset, frame in zip(offsets, frames):
+            strips.append(new_rows(frame, store.top + y_offset, height))
+            height = max(height, store.top + y_offset + len(frame))
+        if store.footer is not None:
+            strips.append((height, store.footer))
+        return strips, offsets
     
     def find_best_match(self, prev_frame, curr_frame):
         """找到两帧之间的最佳匹配点"""
         try:
-            # 获取图像尺寸
-            h, w = prev_frame.shape[:2]
-            
-            # 定义搜索区域
-            # 远程桌面使用更大的搜索区域
-            search_height = min(h // 2, 300) if self.is_remote_desktop else min(h // 3, 200)
-            
-            # 提取搜索区域
-            prev_bottom = prev_frame[-search_height:, :]
-            
-            # 使用模板匹配找到最佳匹配点
-            result = cv2.matchTemplate(curr_frame, prev_bottom, cv2.TM_CCOEFF_NORMED)
-            _, _, _, max_loc = cv2.minMaxLoc(result)
-            
-            # 计算偏移量
-            offset = max_loc[1]
-            
-            # 限制偏移量在合理范围内
-            offset = max(0, min(offset, h - search_height))
+            # 行签名和灰度金字塔按帧缓存，拼接和到底检测共用；优先搜索预测的滚动距离附近
+            rows = self.use_row_signatures and not self.is_remote_desktop
+            offset, confidence, reliable, method = self.match_features(
+                (prev_frame, self.row_matcher.signatures(prev_frame) if rows else None, self.matcher.pyramid(prev_frame)),
+                (curr_frame, self.row_matcher.signatures(curr_frame) if rows else None, self.matcher.pyramid(curr_frame)),
+                self.matcher.last_distance
+            )
+            if offset is None:
+                offset = self.default_distance(len(prev_frame))
+            # 拼接按整数行放置帧：接着上一对帧取整剩下的小数部分取整，
+            # 平滑滚动时每帧不足一像素的误差不会逐帧累积（没有滚动的重复帧不接余数，保持偏移为0）
+            if offset >= 1 and self.match_remainder is not None and self.match_remainder[0] is prev_frame:
+                offset += self.match_remainder[1]
+            exact, offset = offset, int(round(offset))
+            self.match_remainder = (curr_frame, exact - offset)
+            # 可信的非零偏移作为下一次的预测：空白区域无法匹配时按预测距离拼接
+            if reliable and offset > 0:
+                self.matcher.last_distance = offset
+            self.last_match_confidence = confidence
+            self.last_match = (prev_frame, curr_frame, offset, reliable)
+            self.match_history.append((confidence, reliable))
+            if reliable:
+                self.last_match_method = method
             
             # 返回偏移量
-            return h - search_height - offset
+            return offset
         except Exception as e:
-            print(f"查找最佳匹配点错误: {str(e)}")
+            self.logger.error(f"查找最佳匹配点错误: {str(e)}")
             
             # 如果匹配失败，使用默认偏移量
-            # 远程桌面使用更小的默认重叠
-            default_overlap = 30 if self.is_remote_desktop else 50
-            return h - default_overlap 
-
-    def force_stop(self):
-        """强制停止所有截图操作"""
-        print("强制停止长截图捕获")
-        self.is_capturing = False
-        self.was_stopped_manually = True
+            offset = self.default_distance(len(prev_frame))
+            self.last_match_confidence = 0.0
+            self.last_match = (prev_frame, curr_frame, offset, False)
+            return offset
+    
+    def frame_features(self, frame):
+        """
+        计算匹配使用的 (帧, 行签名, 灰度金字塔)，不使用缓存（可以在多个线程中同时调用）
         
-        # 停止所有活动的定时器
-        for timer in self.active_timers:
-            if timer.isActive():
-                timer.stop()
-                print(f"停止定时器: {timer}")
+        使用行签名时不预先计算金字塔，只有行签名无法对齐时才在匹配中生成。
+        """
+        if self.use_row_signatures and not self.is_remote_desktop:
+            return frame, row_signatures(frame, self.scrollbar_width), None
+        return frame, None, self.matcher.build_pyramid(frame)
+    
+    def match_features(self, prev_features, curr_features, predicted_distance=None):
+        """
+        用两帧的 (帧, 行签名, 灰度金字塔) 计算滚动距离，不修改匹配状态（可以在多个线程中同时调用）
         
-        # 清空定时器列表
-        self.active_timers = []
+        Args:
+            prev_features: 上一帧的特征，行签名为 None 时不使用行签名匹配，金字塔为 None 时按需计算
+            curr_features: 当前帧的特征
+            predicted_distance: 预测的滚动距离，模板匹配优先在其附近搜索
         
-        # 如果已经有截图，则处理已有的截图
-        if len(self.screenshots) > 0:
-            return self.finish_capture()
-        return None 
\ No newline at end of file
+        Returns:
+            (滚动距离, 置信度, 是否可信, 匹配方法 'rows' 或 'pyramid')，
+            上一帧底部是空白且没有预测距离时滚动距离为 None
+        """
+        prev_frame, prev_sig, prev_levels = prev_features
+        curr_frame, curr_sig, curr_levels = curr_features
+        
+        with self.telemetry.phase(PHASE_MATCH):
+            # 滚动的界面内容中重叠行是精确副本，优先用行签名对齐
+            # 远程桌面画面有损压缩，行签名无法精确相同，直接使用模板匹配
+            if prev_sig is not None:
+                offset, confidence = self.row_matcher.match_signatures(prev_sig, curr_sig)
+                if offset is not None and confidence >= self.row_matcher.min_confidence:
+                    return offset, confidence, True, 'rows'
+            
+            # 在灰度金字塔上由粗到细匹配上一帧的底部条带
+            prev_levels = prev_levels or self.matcher.build_pyramid(prev_frame)
+            curr_levels = curr_levels or self.matcher.build_pyramid(curr_frame)
+            search_height = self.search_height(len(prev_levels[0]))
+            offset, confidence = self.matcher.match_levels(prev_levels, curr_levels, search_height, predicted_distance)
+            return offset, confidence, confidence >= self.matcher.min_confidence, 'pyramid'
+    
+    def _match_pair(self, prev_features, curr_features):
+        """在线程池中匹配一对相邻帧，返回 (滚动距离, 是否可信)，出错时使用默认偏移量"""
+        try:
+            offset, _, reliable, _ = self.match_features(prev_features, curr_features)
+            return offset, reliable
+        except Exception as e:
+            self.logger.error(f"查找最佳匹配点错误: {str(e)}")
+            return self.default_distance(len(prev_features[0])), False
+    
+    def default_distance(self, frame_height):
+        """匹配失败时使用的滚动距离，远程桌面使用更小的默认重叠"""
+        default_overlap = 30 if self.is_remote_desktop else 50
+        return frame_height - default_overlap
+
+    def search_height(self, frame_height):
+        """模板匹配使用的上一帧底部条带高度，远程桌面使用更大的搜索区域"""
+        if self.is_remote_desktop:
+            return min(frame_height // 2, 300)
+        return min(frame_height // 3, 200)
+    
+    def required_overlap(self, frame_height):
+        """
+        当前匹配方法可靠匹配所需的最小重叠行数
+        
+        行签名只需要一段连续相同的行；模板匹配需要上一帧底部的整个条带出现在当前帧中。
+        """
+        if self.last_match_method == 'rows':
+            return self.row_matcher.min_run * 4
+        return self.search_height(frame_height) + 16
+    
+    def capture_stats(self):
+        """
+        本次捕获的统计信息
+        
+        frames_per_output_pixel 越小，每帧带来的新内容越多；
+        固定每次滚动一格时，它通常是按目标重叠滚动时的数倍。
+        """
+        output_height = len(self.result_image) if self.result_image is not None else 0
+        return {
+            'frames': self.frame_count,
+            'output_height': output_height,
+            'frames_per_output_pixel': self.frame_count / output_height if output_height else 0.0,
+            'pixels_per_notch': self.scroll_controller.pixels_per_notch,
+            'scroll_notches': self.scroll_controller.total_notches,
+            'low_confidence_matches': self.scroll_controller.low_confidence_count,
+            'mean_settle_time': float(np.mean(self.settle_times)) if self.settle_times else None,
+            'frame_store_peak_bytes': self.screenshots.peak_nbytes,
+            'mean_grab_to_ready_ms': (float(np.mean([t for t, _ in self.frame_timings])) * 1000
+                                      if self.frame_timings else None),
+            'mean_bytes_allocated': (float(np.mean([b for _, b in self.frame_timings]))
+                                     if self.frame_timings and self.frame_timings[0][1] is not None else None),
+            'phases': self.telemetry.summary(),
+            'estimated_document_height': (self.progress_estimate['document_height']
+                                          if self.progress_estimate else None),
+        }
+    
+    def force_stop(self):
+        """强制停止所有截图操作"""
+        self.logger.info("强制停止长截图捕获")
+        return self._stop_and_collect()
@@ -8,6 +8,10 @@ from typing import List, Optional, Dict, Tuple
 from pathlib import Path
 import time
 from datetime import datetime
+from src.utils.text_postprocess import OCR_PUNCTUATION_MAP, TextPostProcessor
+
+# OCR文本后处理引擎（中文标点替换、删除空行）
+_POSTPROCESSOR = TextPostProcessor(OCR_PUNCTUATION_MAP)
 
 class OCRProcessor:
     """OCR处理类 - 支持Tesseract OCR和Windows OCR"""
@@ -359,27 +363,9 @@ class OCRProcessor:
     
     def _postprocess_text(self, text: str) -> str:
         """文本后处理"""
-        # 修复常见的OCR错误
-        replacements = {
-            '；': ';',  # 中文分号替换
-            '：': ':',  # 中文冒号替换
-            '"': '"',   # 中文引号替换
-            '"': '"',   # 中文引号替换
-            ''': "'",   # 中文单引号替换
-            ''': "'",   # 中文单引号替换
-            '（': '(',  # 中文括号替换
-            '）': ')',  # 中文括号替换
-            '【': '[',  # 中文方括号替换
-            '】': ']',  # 中文方括号替换
-        }
-        
-        for old, new in replacements.items():
-            text = text.replace(old, new)
-        
-        # 删除多余的空行
-        text = '\n'.join(line for line in text.splitlines() if line.strip())
-        
-        return text
+        # 修复常见的OCR错误并删除多余的空行；规则已预先编译，每条替换规则各扫描一遍文本，
+        # 纯ASCII文本跳过替换，之后删除空行
+        return _POSTPROCESSOR.process(text)
 
 class OCRError(Exception):
     """OCR处理异常"""
@@ -0,0 +1,255 @@
+"""
+长截图的实时预览
+
+捕获过程中与画布并行维护一个缩略图金字塔：每写入一个条带，只把这几行缩小后更新到各层，
+代价与条带大小成正比，与已经拼接的总高度无关。界面显示时选择能放进显示区域的最精细一层，
+都放不下时把最小的一层缩小到显示区域内，代价只与显示区域的大小有关，因此很长的截图也不会越捕获越慢。
+
+捕获完成后查看结果时，TilePyramid 把拼接结果（数组或磁盘映射画布）按需切成分块的多分辨率金字塔，
+只生成当前缩放级别下可见的块，并用LRU缓存限制内存，几万像素高的截图也可以流畅地滚动和缩放。
+"""
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from .stitching import to_bgr
+
+
+class ThumbnailPyramid:
+    """
+    随条带写入增量更新的缩略图金字塔
+
+    第0层把原图按整数倍缩小到约 width 像素宽，之后每层宽高减半。
+    捕获线程调用 write，界面线程调用 snapshot，两者通过锁互斥。
+    """
+
+    def __init__(self, width=256, min_width=16):
+        """
+        Args:
+            width: 第0层的目标宽度
+            min_width: 最小一层的宽度，更窄时不再增加层
+        """
+        self.width = width
+        self.min_width = min_width
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """清空预览，开始新的捕获"""
+        with self.lock:
+            self.factor = None  # 第0层相对原图的缩小倍数
+            self.levels = []  # 每层的数组，容量按需翻倍
+            self.heights = []  # 每层已使用的行数
+            self.source_height = 0  # 原图已写入的行数
+            self.tail = None  # (原图起始行, 原图行)：第0层最后一行还没有凑齐时保留的原图行
+
+    @property
+    def height(self):
+        """原图已写入的高度"""
+        return self.source_height
+
+    def write(self, top, rows):
+        """
+        原图从 top 行开始写入了 rows，更新各层中对应的行
+
+        覆盖已有内容时（top 不在块边界上），第一个不完整的块保持原样。
+
+        Args:
+            top: 原图中的起始行
+            rows: BGR或BGRA格式的行
+        """
+        if len(rows) == 0:
+            return
+        rows = to_bgr(rows)
+        with self.lock:
+            if self.factor is None:
+                self.factor = max(1, -(-rows.shape[1] // self.width))
+            factor = self.factor
+
+            # 紧接在上次写入之后时，与上次剩下的不完整块拼接
+            if self.tail is not None and top == self.source_height:
+                top, rows = self.tail[0], np.vstack([self.tail[1], rows])
+            self.source_height = max(self.source_height, top + len(rows))
+
+            first = -(-top // factor)
+            rows = rows[first * factor - top:]
+            blocks = len(rows) // factor
+            if blocks:
+                width = max(1, rows.shape[1] // factor)
+                small = cv2.resize(rows[:blocks * factor], (width, blocks), interpolation=cv2.INTER_AREA)
+                self._store(0, first, small)
+                self._update_levels(first, first + blocks)
+
+            remainder = rows[blocks * factor:]
+            end = (first + blocks) * factor
+            if len(remainder) and end + len(remainder) == self.source_height:
+                self.tail = (end, remainder.copy())
+            else:
+                self.tail = None
+
+    def _store(self, level, row, data):
+        """把 data 写入第 level 层从 row 开始的行，容量不足时翻倍扩容"""
+        if level == len(self.levels):
+            self.levels.append(np.empty((max(len(data), 64),) + data.shape[1:], dtype=np.uint8))
+            self.heights.append(0)
+        needed = row + len(data)
+        array = self.levels[level]
+        if needed > len(array):
+            grown = np.empty((max(needed, len(array) * 2),) + array.shape[1:], dtype=np.uint8)
+            grown[:self.heights[level]] = array[:self.heights[level]]
+            self.levels[level] = array = grown
+        array[row:needed] = data
+        self.heights[level] = max(self.heights[level], needed)
+
+    def _update_levels(self, first, end):
+        """第0层的 [first, end) 行更新后，逐层更新上面各层对应的行"""
+        level = 1
+        while True:
+            parent = self.levels[level - 1]
+            parent_height = self.heights[level - 1]
+            width = parent.shape[1] // 2
+            if width < self.min_width:
+                return
+            if level == len(self.levels):
+                # 新增一层时从上一层的全部内容生成
+                first, end = 0, parent_height
+            first //= 2
+            end = min(-(-end // 2), -(-parent_height // 2))
+            if end <= first:
+                return
+            source = parent[first * 2:min(end * 2, parent_height)]
+            self._store(level, first, cv2.resize(source, (width, end - first), interpolation=cv2.INTER_AREA))
+            level += 1
+
+    def snapshot(self, max_width, max_height):
+        """
+        返回能放进 max_width × max_height 的最精细一层的副本
+
+        所有层都放不下时（截图很长），把最小的一层保持宽高比缩小到显示区域内再返回：
+        先按整数步长隔行取样，只读取与显示区域高度相当的行数，再用面积插值缩小到目标大小，
+        因此代价始终只与显示区域的大小有关。还没有内容时返回 None。
+        """
+        max_width, max_height = max(1, max_width), max(1, max_height)
+        with self.lock:
+            if not self.levels:
+                return None
+            for level, array in enumerate(self.levels):
+                if array.shape[1] <= max_width and self.heights[level] <= max_height:
+                    return array[:self.heights[level]].copy()
+
+            array = self.levels[-1][:self.heights[-1]]
+            height, width = array.shape[:2]
+            scale = min(max_width / width, max_height / height)
+            size = (max(1, int(width * scale)), max(1, int(height * scale)))
+            step = max(1, height // (size[1] * 2))
+            sampled = array[::step]
+            return cv2.resize(sampled, size, interpolation=cv2.INTER_AREA)
+
+
+class TilePyramid:
+    """
+    按需生成的分块多分辨率金字塔（deep zoom）
+
+    第 level 层是原图缩小 2**level 倍，每层切成 tile_size × tile_size 的块。
+    块在第一次被请求时才从原图生成：先按 2**(level-1) 的步长隔行隔列取样，
+    再用面积插值缩小一半，因此生成一块的代价与层级无关，只读取原图中对应区域的一部分行。
+    最近用过的块保存在LRU缓存中，缓存总字节数不超过 cache_bytes。
+    """
+
+    def __init__(self, image, tile_size=256, cache_bytes=64 * 1024 * 1024):
+        """
+        Args:
+            image: BGR或BGRA格式的图像，可以是 np.memmap
+            tile_size: 块的边长
+            cache_bytes: 块缓存的最大字节数
+        """
+        self.image = image
+        self.tile_size = tile_size
+        self.cache_bytes = cache_bytes
+        self.cache = OrderedDict()  # (level, column, row) -> 块
+        self.cached_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+        # 最粗的一层整张图放进一块
+        height, width = image.shape[:2]
+        self.max_level = 0
+        while max(height, width) > tile_size << self.max_level:
+            self.max_level += 1
+
+    @property
+    def width(self):
+        return self.image.shape[1]
+
+    @property
+    def height(self):
+        return self.image.shape[0]
+
+    def level_size(self, level):
+        """第 level 层的 (宽, 高)"""
+        scale = 1 << level
+        return max(1, -(-self.width // scale)), max(1, -(-self.height // scale))
+
+    def level_for_scale(self, scale):
+        """
+        显示比例为 scale（屏幕像素/原图像素）时使用的层：
+        不比显示更粗的最粗一层，缩小显示时只读取需要的分辨率
+        """
+        level = 0
+        while level < self.max_level and scale * (2 << level) <= 1:
+            level += 1
+        return level
+
+    def tile_range(self, level, x0, y0, x1, y1):
+        """
+        原图区域 [x0, x1) × [y0, y1) 在第 level 层覆盖的块
+
+        Returns:
+            (列范围, 行范围)
+        """
+        span = self.tile_size << level
+        columns = -(-self.width // span)
+        rows = -(-self.height // span)
+        return (range(max(0, int(x0) // span), min(columns, -(-int(x1) // span))),
+                range(max(0, int(y0) // span), min(rows, -(-int(y1) // span))))
+
+    def tile(self, level, column, row):
+        """
+        返回第 level 层第 row 行第 column 列的块（BGR，连续内存）
+
+        边缘的块可能小于 tile_size。返回的数组由缓存持有，调用方不应修改。
+        """
+        key = (level, column, row)
+        tile = self.cache.get(key)
+        if tile is not None:
+            self.cache.move_to_end(key)
+            self.hits += 1
+            return tile
+        self.misses += 1
+
+        tile = self._render(level, column, row)
+        self.cache[key] = tile
+        self.cached_bytes += tile.nbytes
+        while self.cached_bytes > self.cache_bytes and len(self.cache) > 1:
+            _, evicted = self.cache.popitem(last=False)
+            self.cached_bytes -= evicted.nbytes
+        return tile
+
+    def _render(self, level, column, row):
+        """从原图生成一块"""
+        span = self.tile_size << level
+        x0, y0 = column * span, row * span
+        x1, y1 = min(self.width, x0 + span), min(self.height, y0 + span)
+        if level == 0:
+            return np.ascontiguousarray(to_bgr(self.image[y0:y1, x0:x1]))
+        step = 1 << (level - 1)
+        sampled = to_bgr(np.ascontiguousarray(self.image[y0:y1:step, x0:x1:step]))
+        size = (max(1, -(-(x1 - x0) // (step * 2))), max(1, -(-(y1 - y0) // (step * 2))))
+        return cv2.resize(sampled, size, interpolation=cv2.INTER_AREA)
+
+    def clear(self):
+        """清空块缓存"""
+        self.cache.clear()
+        self.cached_bytes = 0
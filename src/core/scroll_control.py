@@ -0,0 +1,108 @@
+"""
+自适应滚动步长控制
+
+固定每次滚动一格时，相邻帧通常重叠大半个视口，捕获同样长的内容需要多抓取、多匹配几倍的帧。
+这里根据拼接时测得的帧间偏移估计每格滚轮实际滚动的像素数，再按目标重叠比例计算下一次
+滚动的格数，让每帧尽量多地带来新内容；匹配不可信时缩小步长，保证相邻帧仍有足够的重叠。
+已经捕获过同一个程序时，可以用上次学到的每格像素数作为初始估计，第一次滚动就使用合适的步长。
+"""
+from collections import deque
+
+import numpy as np
+
+
+class ScrollStepController:
+    """根据测得的帧间偏移选择每次滚动的滚轮格数"""
+
+    # 只有初始估计时的最小重叠比例
+    PRIOR_OVERLAP = 0.5
+
+    def __init__(self, target_overlap=0.15, min_overlap=32, max_notches=20, sample_count=5):
+        """
+        Args:
+            target_overlap: 相邻帧的目标重叠比例（占视口高度）
+            min_overlap: 匹配至少需要的重叠行数
+            max_notches: 单次滚动的最大格数
+            sample_count: 估计每格像素数时使用的最近样本数（取中位数）
+        """
+        self.target_overlap = target_overlap
+        self.min_overlap = min_overlap
+        self.max_notches = max_notches
+        self.samples = deque(maxlen=sample_count)
+        self.reset(0)
+
+    def reset(self, viewport_height, initial_notches=1, prior_pixels_per_notch=None):
+        """
+        开始新的捕获
+
+        Args:
+            viewport_height: 帧高度
+            initial_notches: 还没有测量结果时每次滚动的格数
+            prior_pixels_per_notch: 之前学到的每格像素数，有测量结果之前代替它使用
+        """
+        self.viewport_height = viewport_height
+        self.initial_notches = initial_notches
+        self.prior = prior_pixels_per_notch
+        self.samples.clear()
+        self.backoff = 1.0  # 匹配不可信时的步长缩小系数
+        self.low_confidence_count = 0  # 匹配不可信的次数
+        self.total_notches = 0  # 累计滚动的格数
+        self.record_count = 0  # 记录的滚动次数
+
+    @property
+    def pixels_per_notch(self):
+        """估计的每格滚轮滚动像素数，还没有测量结果时为初始估计（可能为 None）"""
+        if not self.samples:
+            return self.prior
+        return float(np.median(self.samples))
+
+    @property
+    def measured_pixels_per_notch(self):
+        """本次捕获测得的每格像素数，不含初始估计；还没有测量结果时为 None"""
+        if not self.samples:
+            return None
+        return float(np.median(self.samples))
+
+    def next_notches(self):
+        """下一次滚动的格数"""
+        pixels_per_notch = self.pixels_per_notch
+        if pixels_per_notch is None:
+            notches = self.initial_notches
+        else:
+            overlap = max(self.viewport_height * self.target_overlap, self.min_overlap)
+            if not self.samples:
+                # 初始估计来自之前的捕获，程序的缩放比例可能已经改变：
+                # 第一次滚动保留半个视口的重叠，估计偏小一倍以内仍能可靠匹配
+                overlap = max(overlap, self.viewport_height * self.PRIOR_OVERLAP)
+            # 向下取整，保证实际重叠不小于目标重叠
+            notches = int((self.viewport_height - overlap) // pixels_per_notch)
+        notches = int(notches * self.backoff)
+        return min(max(notches, 1), self.max_notches)
+
+    def record(self, notches, distance, reliable):
+        """
+        记录一次滚动的结果
+
+        Args:
+            notches: 本次滚动的格数
+            distance: 拼接时测得的帧间偏移
+            reliable: 偏移是否可信
+        """
+        self.total_notches += notches
+        self.record_count += 1
+        if not reliable:
+            # 重叠可能已经不足以可靠匹配，缩小步长；还没有测量结果时不再相信初始估计
+            self.low_confidence_count += 1
+            if not self.samples:
+                self.prior = None
+            self.back_off()
+            return
+
+        self.backoff = min(self.backoff * 2, 1.0)
+        # 偏移为0（尚未渲染或已到底）时无法估计每格像素数
+        if distance > 0 and notches > 0:
+            self.samples.append(distance / notches)
+
+    def back_off(self):
+        """缩小后续的滚动步长，连续调用时逐次减半"""
+        self.backoff = max(self.backoff * 0.5, 0.125)
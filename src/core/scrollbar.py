@@ -0,0 +1,174 @@
+"""
+从捕获的画面中识别滚动条
+
+捕获循环本身不知道文档有多长，只能滚动到画面不再变化为止。大多数程序在内容区域右侧显示滚动条：
+滑块在轨道中的位置和长度给出了已经滚动的比例和可见部分占整个文档的比例。
+这里在帧最右侧的若干列中逐列查找“轨道—滑块—轨道”的颜色段，连续两帧几何一致时锁定，
+之后按颜色在锁定的列中跟踪滑块，用于估计文档总长度、完成百分比和剩余帧数，
+并在滑块到达轨道末端时提前结束捕获。
+"""
+import cv2
+import numpy as np
+
+
+class ScrollbarState:
+    """一帧中滚动条的几何信息（帧内的行坐标，结束位置不含）"""
+    __slots__ = ('column', 'track_top', 'track_bottom', 'thumb_top', 'thumb_bottom')
+
+    def __init__(self, column, track_top, track_bottom, thumb_top, thumb_bottom):
+        self.column = column
+        self.track_top = track_top
+        self.track_bottom = track_bottom
+        self.thumb_top = thumb_top
+        self.thumb_bottom = thumb_bottom
+
+    @property
+    def track_length(self):
+        return self.track_bottom - self.track_top
+
+    @property
+    def thumb_length(self):
+        return self.thumb_bottom - self.thumb_top
+
+    @property
+    def visible_fraction(self):
+        """可见部分占整个文档的比例"""
+        return self.thumb_length / self.track_length
+
+    @property
+    def position(self):
+        """滚动位置（0为顶部，1为底部）"""
+        free = self.track_length - self.thumb_length
+        return (self.thumb_top - self.track_top) / free if free > 0 else 1.0
+
+    def matches(self, other, tolerance=2):
+        """轨道位置和滑块长度是否与另一帧一致（同一个滚动条）"""
+        return (abs(self.column - other.column) <= tolerance
+                and abs(self.track_top - other.track_top) <= tolerance
+                and abs(self.track_bottom - other.track_bottom) <= tolerance
+                and abs(self.thumb_length - other.thumb_length) <= tolerance)
+
+
+class ScrollbarTracker:
+    """在连续的帧中识别并跟踪滚动条滑块"""
+
+    def __init__(self, search_width=32, min_track_fraction=0.5, tolerance=8, min_segment=3):
+        """
+        Args:
+            search_width: 在帧最右侧多少列中查找
+            min_track_fraction: 轨道至少占帧高度的比例
+            tolerance: 同一颜色段内相邻像素允许的灰度差
+            min_segment: 颜色段的最小长度，更短的段视为抗锯齿边缘
+        """
+        self.search_width = search_width
+        self.min_track_fraction = min_track_fraction
+        self.tolerance = tolerance
+        self.min_segment = min_segment
+        self.reset()
+
+    def reset(self):
+        self.candidate = None  # 上一帧检测到、还没有确认的滚动条
+        self.locked = None  # 确认后的滚动条：(列, 轨道顶部, 轨道底部, 轨道灰度, 滑块灰度)
+        self.state = None  # 最近一帧的滚动条
+
+    @property
+    def at_end(self):
+        """滑块是否已经到达轨道末端"""
+        return self.state is not None and self.state.thumb_bottom >= self.state.track_bottom - 1
+
+    def update(self, frame):
+        """
+        分析一帧（BGR、BGRA或灰度，可以是只含最右侧若干列的视图）
+
+        Returns:
+            锁定后返回这一帧的 ScrollbarState，还没有锁定或跟丢时返回 None
+        """
+        strip = frame[:, -self.search_width:]
+        if strip.ndim == 3:
+            strip = cv2.cvtColor(np.ascontiguousarray(strip),
+                                 cv2.COLOR_BGRA2GRAY if strip.shape[2] == 4 else cv2.COLOR_BGR2GRAY)
+        # 纵向中值滤波去掉噪声和单个像素的抗锯齿
+        strip = cv2.medianBlur(np.ascontiguousarray(strip), 3).astype(np.int16)
+        offset = frame.shape[1] - strip.shape[1]
+
+        if self.locked is not None:
+            self.state = self._track(strip, offset)
+            if self.state is None:
+                # 跟丢（如滚动条自动隐藏），重新检测
+                self.locked = None
+            return self.state
+
+        detected = self._detect(strip, offset)
+        if detected is not None and self.candidate is not None and detected[0].matches(self.candidate[0]) \
+                and detected[0].thumb_top >= self.candidate[0].thumb_top:
+            state, track_level, thumb_level = detected
+            self.locked = (state.column, state.track_top, state.track_bottom, track_level, thumb_level)
+            self.state = state
+            self.candidate = None
+            return state
+        self.candidate = detected
+        self.state = None
+        return None
+
+    def _segments(self, column):
+        """把一列分成颜色一致的段：[(开始, 结束, 灰度)]，过短的段被丢弃"""
+        edges = np.flatnonzero(np.abs(np.diff(column)) > self.tolerance) + 1
+        bounds = np.concatenate([[0], edges, [len(column)]])
+        return [(int(start), int(end), float(np.median(column[start:end])))
+                for start, end in zip(bounds[:-1], bounds[1:]) if end - start >= self.min_segment]
+
+    def _detect(self, strip, offset):
+        """
+        在每一列中查找“轨道—滑块—轨道”：两端颜色相同、中间颜色不同的三个相邻长段
+
+        Returns:
+            (ScrollbarState, 轨道灰度, 滑块灰度)，没有找到时返回 None
+        """
+        height = len(strip)
+        min_track = height * self.min_track_fraction
+        gap = self.min_segment  # 相邻段之间允许的抗锯齿过渡行数
+        found = []
+        for x in range(strip.shape[1]):
+            segments = self._segments(strip[:, x])
+            for above, thumb, below in zip(segments, segments[1:], segments[2:]):
+                if thumb[0] - above[1] > gap or below[0] - thumb[1] > gap:
+                    continue
+                if abs(above[2] - below[2]) > self.tolerance or abs(thumb[2] - above[2]) <= self.tolerance * 2:
+                    continue
+                if below[1] - above[0] < min_track:
+                    continue
+                found.append((below[1] - above[0], x, above, thumb, below))
+        if not found:
+            return None
+
+        # 轨道最长的一组中取中间一列（滑块的中心）
+        longest = max(item[0] for item in found)
+        best = [item for item in found if item[0] >= longest - 2]
+        _, x, above, thumb, below = best[len(best) // 2]
+        state = ScrollbarState(offset + x, above[0], below[1], thumb[0], thumb[1])
+        return state, (above[2] + below[2]) / 2, thumb[2]
+
+    def _track(self, strip, offset):
+        """在锁定的列中按颜色找出滑块：最长的一段更接近滑块颜色的行"""
+        column, track_top, track_bottom, track_level, thumb_level = self.locked
+        x = column - offset
+        if not 0 <= x < strip.shape[1] or track_bottom > len(strip):
+            return None
+        values = strip[track_top:track_bottom, x]
+        is_thumb = np.abs(values - thumb_level) < np.abs(values - track_level)
+        # 既不像轨道也不像滑块的行太多时，认为滚动条已经不在这里
+        unrelated = np.minimum(np.abs(values - thumb_level), np.abs(values - track_level)) > self.tolerance * 2
+        if unrelated.mean() > 0.1:
+            return None
+
+        # 最长的连续滑块行
+        padded = np.concatenate([[0], is_thumb.astype(np.int8), [0]])
+        changes = np.flatnonzero(np.diff(padded))
+        starts, ends = changes[::2], changes[1::2]
+        if len(starts) == 0:
+            return None
+        longest = int(np.argmax(ends - starts))
+        if ends[longest] - starts[longest] < self.min_segment:
+            return None
+        return ScrollbarState(column, track_top, track_bottom,
+                              track_top + int(starts[longest]), track_top + int(ends[longest]))
@@ -0,0 +1,237 @@
+"""
+长截图会话的录制与回放
+
+线上拼接出错时，帧只在一次捕获的内存中存在，事后无法复现。开启录制后，捕获过程中抓取到的
+每一帧原样（连同时间、滚动格数和帧的类型）写入一个会话文件：压缩的 npz，每帧一个 .npy，
+另有一个 JSON 元数据，可以直接用 np.load 打开。帧在后台线程中逐帧压缩写入，
+不占用捕获循环的时间，也不需要在内存中保留全部帧。
+
+回放时 ReplayFrameSource / ReplayScrollDriver 按录制的顺序把帧交给 LongScreenshotCapture，
+在没有显示器和 Windows API 的Linux上重新运行匹配、拼接和到底检测，
+这些会话因此也是真实截图的回归和基准测试语料。
+"""
+import json
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .capture_backend import FrameSource, ScrollDriver, make_probe
+
+# 会话文件格式版本
+SESSION_VERSION = 1
+
+# 帧的类型：第一帧、滚动后抓取的帧、内容加载后在同一位置重新抓取的帧、确认到底时重新抓取的帧
+FRAME_INITIAL = 'initial'
+FRAME_SCROLL = 'scroll'
+FRAME_REFRESH = 'refresh'
+FRAME_CONFIRM = 'confirm'
+
+# 回放时沿用的捕获设置
+SESSION_SETTINGS = ['stabilize_frames', 'incremental_stitching', 'compact_frames', 'compress_frames',
+                    'use_row_signatures', 'scrollbar_width', 'detect_sticky', 'detect_scrollbar']
+
+
+def _frame_name(index):
+    return f'frame_{index:05d}'
+
+
+class SessionRecorder:
+    """把捕获的原始帧和元数据逐帧写入会话文件"""
+
+    def __init__(self, path, compresslevel=1):
+        """
+        Args:
+            path: 会话文件路径（.npz）
+            compresslevel: zlib 压缩级别，默认优先速度
+        """
+        self.path = path
+        self.frames = []  # 每帧的元数据
+        self.temp_path = path + '.part'
+        self._archive = zipfile.ZipFile(self.temp_path, 'w', zipfile.ZIP_DEFLATED, compresslevel=compresslevel)
+        # 单个工作线程：按顺序压缩写入，捕获线程只提交任务
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._errors = []
+
+    def add_frame(self, frame, kind, **info):
+        """
+        录制一帧
+
+        Args:
+            frame: 抓取到的原始帧（不会被修改）。写入完成前保留数组本身的引用，
+                它可能是直接引用QImage像素内存的视图，内存由数组保持有效
+            kind: 帧的类型（FRAME_INITIAL 等）
+            info: 其他元数据（时间、滚动格数等），需要能保存为JSON
+        """
+        index = len(self.frames)
+        self.frames.append(dict(kind=kind, **info))
+        self._executor.submit(self._write, _frame_name(index) + '.npy', frame)
+
+    def _write(self, name, frame):
+        """在工作线程中压缩写入一帧"""
+        try:
+            with self._archive.open(name, 'w') as f:
+                np.lib.format.write_array(f, frame, allow_pickle=False)
+        except Exception as e:
+            self._errors.append(e)
+
+    def close(self, **metadata):
+        """
+        等待所有帧写入完成，写入元数据并生成会话文件
+
+        Args:
+            metadata: 会话级的元数据（捕获设置、拼接结果等），需要能保存为JSON
+
+        Returns:
+            会话文件路径
+        """
+        self._executor.shutdown(wait=True)
+        try:
+            if self._errors:
+                raise self._errors[0]
+            info = dict(metadata, version=SESSION_VERSION, frames=self.frames)
+            with self._archive.open('metadata.npy', 'w') as f:
+                np.lib.format.write_array(f, np.array(json.dumps(info, ensure_ascii=False)))
+            self._archive.close()
+            os.replace(self.temp_path, self.path)
+        except BaseException:
+            self.abort()
+            raise
+        return self.path
+
+    def abort(self):
+        """放弃录制并删除临时文件"""
+        self._executor.shutdown(wait=True)
+        self._archive.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+
+class CaptureSession:
+    """已录制的会话：帧按需从文件中读取"""
+
+    def __init__(self, path):
+        self.path = path
+        self._archive = np.load(path)
+        self.metadata = json.loads(str(self._archive['metadata']))
+        if self.metadata.get('version', 0) > SESSION_VERSION:
+            raise ValueError(f"不支持的会话文件版本: {self.metadata.get('version')}")
+        self.frame_info = self.metadata['frames']
+
+    def __len__(self):
+        return len(self.frame_info)
+
+    def frame(self, index):
+        """读取第 index 帧（每次返回新的数组）"""
+        return self._archive[_frame_name(index)]
+
+    def kind(self, index):
+        return self.frame_info[index]['kind']
+
+    def apply_settings(self, capture):
+        """把录制时的捕获设置恢复到 LongScreenshotCapture 实例上"""
+        for name, value in self.metadata.get('settings', {}).items():
+            if name in SESSION_SETTINGS:
+                setattr(capture, name, value)
+
+    def close(self):
+        self._archive.close()
+
+
+class ReplayFrameSource(FrameSource):
+    """
+    按录制顺序回放会话中的帧
+
+    模拟录制时的屏幕：滚轮事件显示下一帧滚动后录制的帧；录制中的重新抓取
+    （内容加载后或确认到底时）只在捕获流程同样重新抓取时出现，否则随下一次滚动跳过。
+    没有更多滚动帧时画面保持不变，就像已经滚动到底。
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self.shown = 0  # 当前“屏幕上”显示的帧
+        self.grabbed = -1  # 最近一次 grab 返回的帧
+        self.probes_since_grab = 0
+        self.scrolled = False  # 本次滚动是否已经切换到下一帧（一次滚动可能分成多个滚轮事件）
+        self.probes = {}  # 每帧的探测图，避免反复从文件解压
+        self.grab_history = []  # 每次 grab 返回的帧下标
+
+    def _pending(self, kind):
+        """屏幕还停留在最近抓取的帧上、且录制中的下一帧是该类型时，返回它的下标"""
+        index = self.shown + 1
+        if self.shown == self.grabbed and index < len(self.session) and self.session.kind(index) == kind:
+            return index
+        return None
+
+    def scroll(self):
+        """滚轮事件：显示下一帧滚动后录制的帧"""
+        if self.scrolled:
+            return
+        self.scrolled = True
+        for index in range(self.shown + 1, len(self.session)):
+            if self.session.kind(index) == FRAME_SCROLL:
+                self.shown = index
+                return
+
+    def grab(self):
+        pending = self._pending(FRAME_CONFIRM)
+        if pending is not None:
+            self.shown = pending
+        self.grabbed = self.shown
+        self.grab_history.append(self.shown)
+        self.probes_since_grab = 0
+        self.scrolled = False
+        return self.session.frame(self.shown)
+
+    def grab_probe(self):
+        # 内容延迟加载：第一次探测仍是原画面（作为参考），之后显示重新抓取的帧
+        pending = self._pending(FRAME_REFRESH)
+        if pending is not None and self.probes_since_grab > 0:
+            self.shown = pending
+        self.probes_since_grab += 1
+        self.scrolled = False
+        if self.shown not in self.probes:
+            self.probes[self.shown] = make_probe(self.session.frame(self.shown))
+        return self.probes[self.shown]
+
+
+class ReplayScrollDriver(ScrollDriver):
+    """回放时的滚动驱动：滚轮事件切换回放的帧"""
+
+    def __init__(self, source):
+        self.source = source
+
+    def is_remote_desktop(self):
+        return self.source.session.metadata.get('remote_desktop', False)
+
+    def target_application(self):
+        application = self.source.session.metadata.get('application')
+        return tuple(application) if application else None
+
+    def wheel(self, delta):
+        self.source.scroll()
+
+
+def replay_session(capture, session):
+    """
+    在当前线程中用会话中的帧重新运行捕获、拼接和到底检测
+
+    回放的画面不随时间变化，稳定性探测和确认到底的等待时间设为0。
+    需要与录制时一致的设置时，先调用 session.apply_settings(capture)，再按需修改匹配器等设置。
+
+    Args:
+        capture: LongScreenshotCapture 实例
+        session: CaptureSession
+
+    Returns:
+        拼接后的图像
+    """
+    source = ReplayFrameSource(session)
+    capture.frame_source = source
+    capture.scroll_driver = ReplayScrollDriver(source)
+    capture.probe_interval = 0
+    capture.settle_timeout = 0.01
+    capture.end_confirm_delay = 0
+    capture.scroll_delay = 0
+    return capture.run_headless()
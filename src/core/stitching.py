@@ -0,0 +1,688 @@
+"""
+长截图的增量拼接
+
+每捕获一帧就计算它相对上一帧的偏移，并把它写入不断增长的画布，
+只保留上一帧用于下一次匹配。峰值内存与输出图像大小成正比，与帧数无关，
+滚动停止时结果已经拼接完成。超长截图的画布超过内存预算时改用磁盘上的内存映射文件。
+不使用增量拼接时，FrameStore 只保存每帧新出现的条带，而不是全部完整帧。
+"""
+import logging
+import tempfile
+from collections import deque
+import numpy as np
+import cv2
+
+logger = logging.getLogger(__name__)
+
+
+def allocate_canvas(shape, memory_budget=None, temp_dir=None):
+    """
+    分配全零的输出画布
+
+    画布超过内存预算时使用临时文件上的 np.memmap：写入直接落到文件映射中，
+    由操作系统按需换入换出页面，超长截图不需要占用等量的内存。
+    临时文件在关闭后（以及进程退出时）自动删除，已建立的映射仍然有效。
+
+    Args:
+        shape: 画布形状
+        memory_budget: 内存预算（字节），None 表示不限制
+        temp_dir: 临时文件目录，None 表示使用系统临时目录
+
+    Returns:
+        (画布, 临时文件对象)，画布在内存中时临时文件对象为 None
+    """
+    nbytes = int(np.prod(shape))
+    if memory_budget is None or nbytes <= memory_budget:
+        return np.zeros(shape, dtype=np.uint8), None
+
+    canvas_file = tempfile.TemporaryFile(prefix='snapcode_canvas_', dir=temp_dir)
+    canvas_file.truncate(nbytes)  # 扩展的部分由文件系统填零
+    canvas = np.memmap(canvas_file, dtype=np.uint8, mode='r+', shape=shape)
+    logger.info(f"画布大小 {nbytes / 1024 / 1024:.0f} MB 超过内存预算，使用磁盘映射文件")
+    return canvas, canvas_file
+
+
+def to_bgr(frame):
+    """把BGRA帧（或其中若干行）转换为BGR，BGR帧原样返回"""
+    if frame.ndim == 3 and frame.shape[2] == 4:
+        return cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
+    return frame
+
+
+def to_gray(frame):
+    """把BGR或BGRA帧直接转换为灰度，灰度帧原样返回"""
+    if frame.ndim == 2:
+        return frame
+    return cv2.cvtColor(frame, cv2.COLOR_BGRA2GRAY if frame.shape[2] == 4 else cv2.COLOR_BGR2GRAY)
+
+
+def new_rows(frame, y_offset, height):
+    """
+    帧中尚未出现在结果里的行
+
+    Args:
+        frame: 帧
+        y_offset: 帧在结果图像中的纵向位置
+        height: 结果图像当前已有的高度
+
+    Returns:
+        (这些行在结果图像中的起始位置, 帧中的这些行)
+    """
+    top = max(y_offset, height)
+    return top, frame[top - y_offset:]
+
+
+def detect_sticky_rows(prev_gray, curr_gray, scrollbar_width=0, tolerance=2.0, max_fraction=0.35):
+    """
+    找出两帧中位置固定不变的顶部和底部行（固定的标题栏、工具栏、页脚）
+
+    从两端向中间查找两帧逐行相同的连续行。先在水平方向做均值滤波，
+    画面噪声和有损压缩不会破坏逐行比较，而内容滚动后的行差异仍然很大。
+
+    纯色的内容行在滚动后也可能恰好相同而被计入固定区域，这不会丢失内容：
+    页眉取自第一帧、页脚取自最后一帧，其间滚过这些行的内容都会经过中间的内容区域。
+
+    Args:
+        prev_gray: 滚动前的灰度帧
+        curr_gray: 滚动后的灰度帧
+        scrollbar_width: 右侧忽略的列宽（滚动条滑块每次滚动都会移动）
+        tolerance: 逐行平均灰度差不超过该值时认为相同
+        max_fraction: 固定区域最多占帧高度的比例，超过时认为不是固定区域
+
+    Returns:
+        (顶部固定行数, 底部固定行数)；两帧完全相同（还没有滚动）时返回 None
+    """
+    height, width = curr_gray.shape[:2]
+    if 0 < scrollbar_width < width:
+        prev_gray = prev_gray[:, :width - scrollbar_width]
+        curr_gray = curr_gray[:, :width - scrollbar_width]
+
+    kernel = (16, 1)
+    difference = cv2.absdiff(cv2.blur(prev_gray, kernel), cv2.blur(curr_gray, kernel))
+    same = difference.mean(axis=1) <= tolerance
+    if same.all():
+        return None
+
+    top = int(np.argmin(same))
+    bottom = int(np.argmin(same[::-1]))
+    limit = int(height * max_fraction)
+    return (top if top <= limit else 0), (bottom if bottom <= limit else 0)
+
+
+class IncrementalStitcher:
+    """增量拼接器：逐帧计算偏移并写入画布"""
+
+    def __init__(self, match_func, growth=1.5, memory_budget=None, temp_dir=None):
+        """
+        Args:
+            match_func: 匹配函数 match_func(prev_frame, curr_frame)，返回当前帧相对上一帧
+                向下滚动的像素数
+            growth: 画布容量不足时的扩容倍数，按倍数扩容使复制的总开销与输出大小成正比
+            memory_budget: 画布的内存预算（字节），扩容后的画布超过预算时改用磁盘映射文件
+            temp_dir: 磁盘映射文件所在目录
+        """
+        self.match_func = match_func
+        self.growth = growth
+        self.memory_budget = memory_budget
+        self.temp_dir = temp_dir
+        self.canvas_file = None
+        self.preview = None  # 实时预览（ThumbnailPyramid），写入画布的行同时写入预览
+        self.reset()
+
+    def reset(self):
+        """清空画布，开始新的拼接"""
+        if self.canvas_file is not None:
+            # 已返回的结果仍然引用原来的映射，关闭文件不影响它
+            self.canvas_file.close()
+            self.canvas_file = None
+        self.canvas = None
+        self.height = 0  # 画布中已使用的高度
+        self.prev_frame = None
+        self.offsets = []  # 每帧（内容区域）相对第一帧滚动的距离
+        self.top = 0  # 固定页眉的行数，内容区域写在页眉下方
+        self.footer = None  # 固定页脚（取自最近一帧），只在结果末尾出现一次
+
+    def set_sticky(self, top, bottom, footer, prev_frame):
+        """
+        确定了固定的页眉/页脚：页眉保留在第一帧写入的位置，页脚只在结果末尾出现一次
+        （之后由调用方更新为最近一帧的页脚），此后 add 只接收帧中间的内容区域。
+        调用时画布中应只有第一帧的内容（还没有发生滚动）。
+
+        Args:
+            top: 页眉行数
+            bottom: 页脚行数
+            footer: BGR格式的页脚
+            prev_frame: 上一帧的内容区域，用于下一次匹配
+        """
+        self.top = top
+        self.footer = footer
+        self.height -= bottom
+        self.prev_frame = prev_frame
+
+    def _ensure_capacity(self, needed):
+        """保证画布至少有 needed 行"""
+        if needed <= len(self.canvas):
+            return
+        capacity = max(needed, int(len(self.canvas) * self.growth))
+        shape = (capacity,) + self.canvas.shape[1:]
+
+        if self.canvas_file is not None:
+            # 已经在磁盘上：直接扩展文件并重新映射，不复制已有内容。
+            # 先释放旧映射，Windows 不允许扩展仍被映射的文件
+            self.canvas.flush()
+            self.canvas = None
+            self.canvas_file.truncate(int(np.prod(shape)))
+            self.canvas = np.memmap(self.canvas_file, dtype=np.uint8, mode='r+', shape=shape)
+            return
+
+        canvas, self.canvas_file = allocate_canvas(shape, self.memory_budget, self.temp_dir)
+        canvas[:self.height] = self.canvas[:self.height]
+        self.canvas = canvas
+
+    def add(self, frame):
+        """
+        拼接一帧
+
+        Args:
+            frame: BGR或BGRA格式的帧，尺寸需与第一帧一致
+
+        Returns:
+            该帧在结果图像中的纵向位置
+        """
+        frame_height = frame.shape[0]
+
+        if self.prev_frame is None:
+            y_offset = 0
+            self.canvas = np.empty(frame.shape[:2] + (3,), dtype=np.uint8)
+        else:
+            y_offset = self.offsets[-1] + self.match_func(self.prev_frame, frame)
+            self._ensure_capacity(self.top + y_offset + frame_height)
+
+        # 重叠区域保留已经写入的内容，只把新出现的行转换为BGR写入画布
+        top, rows = new_rows(frame, self.top + y_offset, self.height)
+        if len(rows):
+            self._write(top, to_bgr(rows))
+        self.height = max(self.height, self.top + y_offset + frame_height)
+        self.offsets.append(y_offset)
+        self.prev_frame = frame
+        return y_offset
+
+    def add_refreshed(self, frame):
+        """
+        拼接在上一帧的同一位置重新抓取的帧（例如延迟加载的内容显示出来之后），覆盖上一帧的内容
+
+        Returns:
+            该帧在结果图像中的纵向位置
+        """
+        y_offset = self.offsets[-1]
+        self._write(self.top + y_offset, to_bgr(frame))
+        self.offsets.append(y_offset)
+        self.prev_frame = frame
+        return y_offset
+
+    def _write(self, top, rows):
+        """把BGR行写入画布和预览"""
+        self.canvas[top:top + len(rows)] = rows
+        if self.preview is not None:
+            self.preview.write(top, rows)
+
+    def result(self):
+        """返回拼接结果（画布已使用部分的视图，不复制；画布在磁盘上时按需读取）"""
+        if self.canvas is None:
+            return None
+        end = self.height
+        if self.footer is not None:
+            # 页脚接在内容之后；内容继续增长时会被覆盖，重复调用结果一致
+            end += len(self.footer)
+            self._ensure_capacity(end)
+            self.canvas[self.height:end] = self.footer
+        if self.canvas_file is not None:
+            self.canvas.flush()
+        return self.canvas[:end]
+
+
+class FrameStore:
+    """
+    捕获过程中的帧存储
+
+    始终保留最近几帧的完整画面，供匹配和到底检测使用；更早的帧按 history 决定如何保存：
+    - None：不保留（增量拼接时帧已经写入画布）
+    - 'strips'：只保留每帧新出现的条带（BGR），可选在内存中以PNG无损压缩
+    - 'full'：保留全部完整帧，在捕获结束后统一匹配和拼接
+    """
+
+    def __init__(self, match_func=None, history='strips', recent_count=3, compress=False):
+        """
+        Args:
+            match_func: 匹配函数 match_func(prev_frame, curr_frame)，返回当前帧相对上一帧
+                向下滚动的像素数；history 为 'strips' 时需要
+            history: 更早帧的保存方式：None、'strips' 或 'full'
+            recent_count: 保留完整画面的最近帧数（至少2帧，用于到底检测）
+            compress: 是否以PNG压缩保存条带
+        """
+        self.match_func = match_func
+        self.history = history
+        self.recent_count = recent_count
+        self.compress = compress
+        self.preview = None  # 实时预览（ThumbnailPyramid），保存的条带同时写入预览
+        self.reset()
+
+    def reset(self):
+        """清空存储，开始新的捕获"""
+        self.recent = deque(maxlen=max(self.recent_count, 2))
+        self.frames = []  # history 为 'full' 时的全部帧
+        self.strips = []  # history 为 'strips' 时的 [(纵向位置, 条带)]，条带可能已压缩
+        self.strip_bytes = 0  # 条带占用的字节数
+        self.offsets = []  # history 为 'strips' 时每帧（内容区域）相对第一帧滚动的距离
+        self.height = 0  # history 为 'strips' 时结果图像已有的高度
+        self.top = 0  # 固定页眉的行数
+        self.header = None  # 固定页眉（BGR）
+        self.footer = None  # 固定页脚（BGR，取自最近一帧），只在结果末尾出现一次
+        self.count = 0  # 已存储的帧数
+        self.peak_nbytes = 0  # 存储占用的峰值字节数
+
+    @property
+    def result_height(self):
+        """history 为 'strips' 时拼接结果的高度"""
+        return self.height + (len(self.footer) if self.footer is not None else 0)
+
+    def set_sticky(self, top, bottom, header, footer):
+        """
+        确定了固定的页眉/页脚：已保存的帧改为只引用中间的内容区域，此后只存储内容区域。
+        调用时已保存的帧都应与第一帧相同（还没有发生滚动）。
+
+        Args:
+            top: 页眉行数
+            bottom: 页脚行数
+            header: BGR格式的页眉
+            footer: BGR格式的页脚
+        """
+        def crop(frame):
+            return frame[top:len(frame) - bottom]
+
+        self.recent = deque((crop(frame) for frame in self.recent), maxlen=self.recent.maxlen)
+        self.frames = [crop(frame) for frame in self.frames]
+        self.top = top
+        self.header = header
+        self.footer = footer
+        # 第一帧的条带中的页脚行会被之后的内容条带或末尾的页脚覆盖
+        self.height -= bottom
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        """按下标返回完整帧；只保留了最近几帧时只能用负数下标访问它们"""
+        if self.history == 'full':
+            return self.frames[index]
+        if index < 0:
+            return self.recent[index]
+        raise IndexError("只保留了最近几帧的完整画面，请使用负数下标")
+
+    @property
+    def nbytes(self):
+        """存储当前占用的字节数（不重复计算同时保存在多处的帧）"""
+        if self.history == 'full':
+            return sum(frame.nbytes for frame in self.frames)
+        return self.strip_bytes + sum(frame.nbytes for frame in self.recent)
+
+    def append(self, frame, distance=None):
+        """
+        存储一帧
+
+        Args:
+            frame: BGR或BGRA格式的帧
+            distance: 已知的相对上一帧的滚动距离；None 表示需要时调用 match_func 计算。
+                在同一位置重新抓取的帧传入0，整帧覆盖上一帧的内容
+        """
+        if self.history == 'strips':
+            if not self.recent:
+                y_offset, top, rows = 0, 0, frame
+            elif distance == 0:
+                y_offset = self.offsets[-1]
+                top, rows = self.top + y_offset, frame
+            else:
+                if distance is None:
+                    distance = self.match_func(self.recent[-1], frame)
+                y_offset = self.offsets[-1] + distance
+                top, rows = new_rows(frame, self.top + y_offset, self.height)
+            self._add_strip(top, rows)
+            self.offsets.append(y_offset)
+            self.height = max(self.height, self.top + y_offset + len(frame))
+        elif self.history == 'full':
+            if distance == 0 and self.frames:
+                # 同一位置重新抓取的帧取代上一帧
+                self.frames[-1] = frame
+            else:
+                self.frames.append(frame)
+
+        self.recent.append(frame)
+        self.count += 1
+        self.peak_nbytes = max(self.peak_nbytes, self.nbytes)
+
+    def _add_strip(self, top, rows):
+        """把新出现的行转换为BGR并保存为条带，按需压缩"""
+        if len(rows) == 0:
+            return
+        strip = to_bgr(rows)
+        if self.preview is not None:
+            self.preview.write(top, strip)
+        if self.compress:
+            success, encoded = cv2.imencode('.png', strip, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+            if success:
+                self.strips.append((top, encoded))
+                self.strip_bytes += encoded.nbytes
+                return
+        if strip is rows:
+            # 切片仍引用完整帧，复制后完整帧才能被释放
+            strip = strip.copy()
+        self.strips.append((top, strip))
+        self.strip_bytes += strip.nbytes
+
+    def iter_strips(self):
+        """按顺序返回 (纵向位置, BGR条带)，后面的条带覆盖前面的（history 为 'strips' 时可用）"""
+        for top, strip in self.strips:
+            if strip.ndim == 1:
+                strip = cv2.imdecode(strip, cv2.IMREAD_COLOR)
+            yield top, strip
+        if self.footer is not None:
+            yield self.height, self.footer
+
+
+class PyramidMatcher:
+    """
+    灰度金字塔重叠匹配器
+
+    先在降采样的金字塔层上粗略搜索上一帧底部条带在当前帧中的位置，
+    再在原分辨率上只对粗略位置附近的小窗口精确匹配，并用相关系数峰值两侧的值插值出亚像素位置。
+    搜索范围优先限制在根据上一次滚动距离预测的区间内，置信度不足时再搜索全部偏移。
+    每帧的灰度金字塔只计算一次，供拼接和到底检测共用。
+    """
+
+    def __init__(self, levels=2, min_confidence=0.9, cache_size=4, min_texture=2.0):
+        """
+        Args:
+            levels: 粗略搜索使用的金字塔层数，每层尺寸减半
+            min_confidence: 在预测区间内匹配的最低置信度，低于该值时搜索全部偏移
+            cache_size: 缓存金字塔的最近帧数
+            min_texture: 条带灰度标准差低于该值时视为没有纹理，无法匹配
+        """
+        self.levels = levels
+        self.min_confidence = min_confidence
+        self.min_texture = min_texture
+        self.cache_size = cache_size
+        self._cache = []  # [(帧, 金字塔)]，按使用顺序排列
+        self.reset()
+
+    def reset(self):
+        """开始新的捕获时清空预测和缓存"""
+        self.last_distance = None
+        self._cache = []
+
+    def pyramid(self, frame):
+        """返回帧的灰度金字塔 [原分辨率, 1/2, 1/4, ...]，结果按帧对象缓存"""
+        for cached_frame, levels in self._cache:
+            if cached_frame is frame:
+                return levels
+
+        # 灰度图直接从抓取的BGR/BGRA数据一次转换得到，匹配、到底检测和空白检测共用
+        levels = self.build_pyramid(frame)
+        self._cache.append((frame, levels))
+        if len(self._cache) > self.cache_size:
+            self._cache.pop(0)
+        return levels
+
+    def build_pyramid(self, frame):
+        """计算帧的灰度金字塔，不使用缓存（可以在多个线程中同时调用）"""
+        levels = [to_gray(frame)]
+        for _ in range(self.levels):
+            levels.append(cv2.pyrDown(levels[-1]))
+        return levels
+
+    def match(self, prev_frame, curr_frame, search_height):
+        """
+        计算当前帧相对上一帧向下滚动的像素数
+
+        Args:
+            prev_frame: 上一帧
+            curr_frame: 当前帧
+            search_height: 用于匹配的上一帧底部条带高度
+
+        Returns:
+            (滚动距离, 置信度)
+        """
+        result = self.match_levels(self.pyramid(prev_frame), self.pyramid(curr_frame),
+                                   search_height, self.last_distance)
+        if result[1] >= self.min_confidence:
+            self.last_distance = result[0]
+        return result
+
+    def match_levels(self, prev_levels, curr_levels, search_height, predicted_distance=None):
+        """
+        用已经计算的金字塔匹配两帧，不修改匹配器的状态（可以在多个线程中同时调用）
+
+        Args:
+            prev_levels: 上一帧的灰度金字塔
+            curr_levels: 当前帧的灰度金字塔
+            search_height: 用于匹配的上一帧底部条带高度
+            predicted_distance: 预测的滚动距离，None 表示直接搜索全部偏移
+
+        Returns:
+            (滚动距离（亚像素精度的小数）, 置信度)，条带没有纹理时为 (predicted_distance, 0.0)
+        """
+        max_distance = len(prev_levels[0]) - search_height
+        # 空白条带在任何位置的相关系数都相同，匹配结果没有意义
+        if float(prev_levels[0][-search_height:].std()) < self.min_texture:
+            return predicted_distance, 0.0
+
+        result = None
+        if predicted_distance is not None:
+            # 滚动距离通常与上一次接近，先在预测区间内搜索
+            predicted = int(round(predicted_distance))
+            window = max(48, predicted // 2)
+            low = max(0, predicted - window)
+            high = min(max_distance, predicted + window)
+            result = self._search(prev_levels, curr_levels, search_height, low, high)
+
+        if result is None or result[1] < self.min_confidence:
+            result = self._search(prev_levels, curr_levels, search_height, 0, max_distance)
+        return result
+
+    def _search(self, prev_levels, curr_levels, search_height, low, high):
+        """在滚动距离 [low, high] 内由粗到细搜索"""
+        prev_gray, curr_gray = prev_levels[0], curr_levels[0]
+        height = len(prev_gray)
+        # 滚动距离 d 对应条带在当前帧中的位置 y = height - search_height - d
+        y_low = height - search_height - high
+        y_high = height - search_height - low
+
+        # 粗略搜索：在最高层金字塔上匹配
+        scale = 2 ** self.levels
+        coarse_prev, coarse_curr = prev_levels[-1], curr_levels[-1]
+        band_height = search_height // scale
+        if band_height >= 4:
+            band_top = len(coarse_prev) - band_height
+            band = coarse_prev[band_top:]
+            # 粗略条带的顶部（换算到原分辨率）比原条带顶部低 shift 行
+            shift = band_top * scale - (height - search_height)
+            start = max(0, (y_low + shift) // scale)
+            end = min(-(-(y_high + shift) // scale), len(coarse_curr) - band_height)
+            scores = cv2.matchTemplate(coarse_curr[start:end + band_height], band, cv2.TM_CCOEFF_NORMED)
+            coarse_y = (int(np.argmax(np.nan_to_num(scores[:, 0]))) + start) * scale - shift
+            coarse_y = min(max(coarse_y, y_low), y_high)
+            radius = scale * 2
+            y_low, y_high = max(y_low, coarse_y - radius), min(y_high, coarse_y + radius)
+
+        # 精确搜索：在原分辨率上只匹配粗略位置附近的窗口
+        band = prev_gray[height - search_height:]
+        scores = np.nan_to_num(cv2.matchTemplate(
+            curr_gray[y_low:y_high + search_height], band, cv2.TM_CCOEFF_NORMED
+        )[:, 0])
+        best = int(np.argmax(scores))
+        # 平滑滚动的距离不是整数：用峰值和两侧的相关系数拟合抛物线，取顶点位置
+        fraction = 0.0
+        if 0 < best < len(scores) - 1:
+            left, peak, right = scores[best - 1], scores[best], scores[best + 1]
+            curvature = left - 2 * peak + right
+            if curvature < 0:
+                fraction = float((left - right) / (2 * curvature))
+        return height - search_height - (y_low + best + fraction), float(scores[best])
+
+
+# 行签名的哈希系数（随机奇数），按每行的64位字数缓存
+_HASH_COEFFICIENTS = {}
+# 忽略滚动条后的行签名权重，按 (每行字数, 保留字数) 缓存
+_SIGNATURE_WEIGHTS = {}
+
+
+def _hash_coefficients(count):
+    """返回 count 个固定的64位随机奇数系数"""
+    coefficients = _HASH_COEFFICIENTS.get(count)
+    if coefficients is None:
+        rng = np.random.default_rng(0x5EED)
+        coefficients = rng.integers(0, 2 ** 63, size=count, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        _HASH_COEFFICIENTS[count] = coefficients
+    return coefficients
+
+
+def _signature_weights(word_count, kept_words):
+    """前 kept_words 个字使用哈希系数、其余为0的权重"""
+    key = (word_count, kept_words)
+    weights = _SIGNATURE_WEIGHTS.get(key)
+    if weights is None:
+        weights = _hash_coefficients(word_count).copy()
+        weights[kept_words:] = 0
+        _SIGNATURE_WEIGHTS[key] = weights
+    return weights
+
+
+def row_signatures(frame, scrollbar_width=0):
+    """
+    计算帧中每一行像素的64位签名
+
+    每行的字节按64位字读取，与固定的奇数系数做点积（按2^64取模）。
+    系数为奇数，任意单个字节的变化都会改变签名。
+    连续存储的帧直接按原数据读取，不复制；滚动条所在的字权重为0。
+
+    Args:
+        frame: BGR、BGRA或灰度帧
+        scrollbar_width: 右侧忽略的列宽（滚动条滑块每次滚动都会移动）
+
+    Returns:
+        长度为帧高度的 uint64 数组
+    """
+    rows = np.ascontiguousarray(frame).reshape(len(frame), -1)
+    padding = (-rows.shape[1]) % 8
+    if padding:
+        rows = np.pad(rows, ((0, 0), (0, padding)))
+    words = rows.view(np.uint64)
+
+    kept_words = words.shape[1]
+    if 0 < scrollbar_width < frame.shape[1]:
+        # 只保留完全位于滚动条左侧的字
+        kept_words = (frame.shape[1] - scrollbar_width) * frame[0, :1].nbytes // 8
+    return np.dot(words, _signature_weights(words.shape[1], kept_words))
+
+
+def _longest_run(mask):
+    """返回布尔数组中最长的连续 True 的长度"""
+    if not mask.any():
+        return 0
+    # 在首尾补 False，取每段 True 的起止位置
+    edges = np.diff(np.concatenate(([False], mask, [False])).astype(np.int8))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    return int((ends - starts).max())
+
+
+class RowSignatureMatcher:
+    """
+    行签名匹配器
+
+    滚动的界面内容中，重叠部分的像素行是上一帧对应行的精确副本。
+    每帧只计算一次行签名，用在两帧中都只出现一次的行作为锚点投票得到候选偏移，
+    再选择重叠区域中连续相同行最长的候选，整个过程与帧高度成线性关系（排序除外）。
+    画面有损压缩（如远程桌面）时行签名无法精确相同，应回退到模板匹配。
+    """
+
+    def __init__(self, scrollbar_width=0, min_confidence=0.6, min_run=8, max_candidates=3, cache_size=4):
+        """
+        Args:
+            scrollbar_width: 计算签名时忽略的右侧列宽
+            min_confidence: 可信匹配的最低置信度（重叠区域中相同行的比例）
+            min_run: 可信匹配至少需要的连续相同行数
+            max_candidates: 投票后参与验证的候选偏移数
+            cache_size: 缓存签名的最近帧数
+        """
+        self.scrollbar_width = scrollbar_width
+        self.min_confidence = min_confidence
+        self.min_run = min_run
+        self.max_candidates = max_candidates
+        self.cache_size = cache_size
+        self._cache = []  # [(帧, 签名)]，按使用顺序排列
+
+    def reset(self):
+        """开始新的捕获时清空缓存"""
+        self._cache = []
+
+    def signatures(self, frame):
+        """返回帧的行签名，结果按帧对象缓存"""
+        for cached_frame, signatures in self._cache:
+            if cached_frame is frame:
+                return signatures
+
+        signatures = row_signatures(frame, self.scrollbar_width)
+        self._cache.append((frame, signatures))
+        if len(self._cache) > self.cache_size:
+            self._cache.pop(0)
+        return signatures
+
+    def match(self, prev_frame, curr_frame):
+        """
+        计算当前帧相对上一帧向下滚动的像素数
+
+        Returns:
+            (滚动距离, 置信度)，找不到可信的对齐时滚动距离为 None
+        """
+        return self.match_signatures(self.signatures(prev_frame), self.signatures(curr_frame))
+
+    def match_signatures(self, prev_sig, curr_sig):
+        """用已经计算的行签名匹配两帧（不使用缓存，可以在多个线程中同时调用）"""
+        height = len(prev_sig)
+        if len(curr_sig) != height:
+            return None, 0.0
+
+        # 完全相同的帧：偏移为0，即重复帧；几乎只有相同行的空白帧在任何偏移下都相同，无法判断
+        if np.array_equal(prev_sig, curr_sig):
+            if len(np.unique(prev_sig)) < self.min_run:
+                return None, 0.0
+            return 0, 1.0
+
+        # 用两帧中都只出现一次的行作为锚点（空行等重复行不参与投票）
+        prev_values, prev_index, prev_counts = np.unique(prev_sig, return_index=True, return_counts=True)
+        curr_values, curr_index, curr_counts = np.unique(curr_sig, return_index=True, return_counts=True)
+        prev_once, curr_once = prev_counts == 1, curr_counts == 1
+        _, prev_pos, curr_pos = np.intersect1d(
+            prev_values[prev_once], curr_values[curr_once], assume_unique=True, return_indices=True
+        )
+        distances = prev_index[prev_once][prev_pos] - curr_index[curr_once][curr_pos]
+        distances = distances[(distances >= 0) & (distances <= height - self.min_run)]
+        if len(distances) == 0:
+            return None, 0.0
+
+        # 验证得票最多的几个候选，选择重叠区域中连续相同行最长的一个
+        votes = np.bincount(distances)
+        candidates = np.argsort(votes)[::-1][:self.max_candidates]
+        best_distance, best_run, best_confidence = None, 0, 0.0
+        for distance in candidates:
+            if votes[distance] == 0:
+                break
+            distance = int(distance)
+            equal = prev_sig[distance:] == curr_sig[:height - distance]
+            run = _longest_run(equal)
+            if run > best_run:
+                best_distance, best_run, best_confidence = distance, run, float(equal.mean())
+
+        if best_run < self.min_run:
+            return None, 0.0
+        return best_distance, best_confidence
@@ -0,0 +1,170 @@
+"""
+长截图捕获的计时
+
+捕获循环的每个阶段（激活窗口、移动鼠标、滚轮、等待渲染、抓取、转换、匹配、到底检测、拼接）
+记录开始时间和耗时，保存在固定容量的环形缓冲区中，长时间捕获也不会无限增长。
+结果可以汇总为每个阶段的统计，也可以导出为 JSON 或 Chrome 跟踪事件格式
+（在 chrome://tracing 或 Perfetto 中按线程查看时间线，嵌套的阶段显示为层级）。
+
+日志使用标准库 logging（各模块的 logging.getLogger(__name__)），这里只负责计时。
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+# 捕获循环的阶段
+PHASE_FOREGROUND = 'foreground'  # 激活目标窗口
+PHASE_CURSOR = 'cursor_move'  # 把鼠标移动到滚动位置
+PHASE_WHEEL = 'wheel'  # 发送滚轮事件
+PHASE_RENDER_WAIT = 'render_wait'  # 等待目标程序渲染滚动结果
+PHASE_GRAB = 'grab'  # 抓取画面
+PHASE_CONVERT = 'convert'  # 裁剪固定区域、生成灰度金字塔
+PHASE_STITCH = 'stitch'  # 写入画布或帧存储（包含匹配）
+PHASE_MATCH = 'match'  # 帧间匹配
+PHASE_END_CHECK = 'end_check'  # 到底检测
+
+# 界面线程中选区遮罩的绘制（拖动选区和显示进度时）
+PHASE_OVERLAY_PAINT = 'overlay_paint'
+
+
+class _Phase:
+    """一个阶段的计时，离开 with 块时写入缓冲区"""
+    __slots__ = ('telemetry', 'name', 'start')
+
+    def __init__(self, telemetry, name):
+        self.telemetry = telemetry
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.telemetry.record(self.name, self.start, time.perf_counter())
+        return False
+
+
+class _NullPhase:
+    """关闭计时时使用，不做任何事"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        return False
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class CaptureTelemetry:
+    """
+    按阶段记录耗时的环形缓冲区
+
+    每条记录为 (阶段, 开始时间, 耗时, 帧序号, 线程)，时间单位为秒，开始时间相对于 reset。
+    deque 的 append 是线程安全的，捕获后并行匹配的线程也可以直接记录。
+    """
+
+    def __init__(self, capacity=8192, enabled=True):
+        """
+        Args:
+            capacity: 最多保留的记录数，更早的记录被丢弃
+            enabled: 是否记录
+        """
+        self.enabled = enabled
+        self.events = deque(maxlen=capacity)
+        self.reset()
+
+    def reset(self):
+        """清空记录，开始新的捕获"""
+        self.events.clear()
+        self.origin = time.perf_counter()
+        self.frame = 0  # 当前正在处理的帧序号，记录时一并保存
+        self.dropped = 0  # 缓冲区已满后被丢弃的记录数
+
+    def phase(self, name):
+        """
+        返回计时用的上下文管理器
+
+            with telemetry.phase(PHASE_GRAB):
+                frame = source.grab()
+        """
+        if not self.enabled:
+            return _NULL_PHASE
+        return _Phase(self, name)
+
+    def record(self, name, start, end):
+        """记录一个阶段（perf_counter 时间）"""
+        if not self.enabled:
+            return
+        if len(self.events) == self.events.maxlen:
+            self.dropped += 1
+        self.events.append((name, start - self.origin, end - start, self.frame, threading.get_ident()))
+
+    def summary(self):
+        """
+        每个阶段的统计（毫秒）：次数、总计、平均、中位数、95分位和最大值
+
+        嵌套的阶段（如拼接中的匹配）分别统计，总计之间有重叠。
+        """
+        durations = {}
+        for name, _, duration, _, _ in list(self.events):
+            durations.setdefault(name, []).append(duration * 1000)
+        result = {}
+        for name, values in durations.items():
+            values = np.array(values)
+            result[name] = {
+                'count': len(values),
+                'total_ms': round(float(values.sum()), 3),
+                'mean_ms': round(float(values.mean()), 3),
+                'p50_ms': round(float(np.percentile(values, 50)), 3),
+                'p95_ms': round(float(np.percentile(values, 95)), 3),
+                'max_ms': round(float(values.max()), 3),
+            }
+        return result
+
+    def to_json(self):
+        """统计和全部记录，可以直接保存为JSON"""
+        return {
+            'phases': self.summary(),
+            'dropped': self.dropped,
+            'events': [
+                {'phase': name, 'start_ms': round(start * 1000, 3), 'duration_ms': round(duration * 1000, 3),
+                 'frame': frame, 'thread': thread}
+                for name, start, duration, frame, thread in list(self.events)
+            ],
+        }
+
+    def to_chrome_trace(self):
+        """Chrome 跟踪事件格式（完整事件 'X'，时间单位为微秒）"""
+        pid = os.getpid()
+        threads = {}
+        trace_events = []
+        for name, start, duration, frame, thread in list(self.events):
+            # 线程号较大，按出现顺序编号便于查看
+            tid = threads.setdefault(thread, len(threads))
+            trace_events.append({
+                'name': name, 'cat': 'capture', 'ph': 'X', 'pid': pid, 'tid': tid,
+                'ts': round(start * 1e6, 1), 'dur': round(duration * 1e6, 1), 'args': {'frame': frame},
+            })
+        for thread, tid in threads.items():
+            label = '捕获线程' if tid == 0 else f'工作线程 {tid}'
+            trace_events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': label}})
+        return {'traceEvents': trace_events, 'displayTimeUnit': 'ms'}
+
+    def export_json(self, path):
+        """保存为JSON"""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_json(), f, ensure_ascii=False, indent=1)
+        return path
+
+    def export_chrome_trace(self, path):
+        """保存为 Chrome 跟踪事件格式，可在 chrome://tracing 或 Perfetto 中打开"""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_chrome_trace(), f, ensure_ascii=False)
+        return path
+
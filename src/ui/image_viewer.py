@@ -0,0 +1,308 @@
+from PyQt6.QtCore import Qt, QPoint, QRect, pyqtSignal
+from PyQt6.QtGui import QPainter, QColor, QImage, QPen
+from PyQt6.QtWidgets import (QAbstractScrollArea, QDialog, QVBoxLayout, QHBoxLayout, QLabel,
+                             QPushButton)
+
+from ..core.preview import TilePyramid
+
+
+class TiledImageViewer(QAbstractScrollArea):
+    """
+    分块显示超长截图的查看控件
+
+    图像不整体转换为QPixmap，而是交给 TilePyramid 按当前缩放比例选择层级，
+    每次绘制只取可见区域的块，内存只与块缓存大小有关。
+    滚轮滚动，Ctrl+滚轮缩放，中键拖动平移；左键拖动框选裁剪区域，
+    按住Shift单击可以把选区延伸到点击位置（先滚动再选，适合截掉很长截图的首尾），右键清除选区。
+    """
+    selection_changed = pyqtSignal()
+    scale_changed = pyqtSignal(float)
+
+    MIN_SCALE = 1 / 256
+    MAX_SCALE = 8.0
+    BACKGROUND = QColor(48, 48, 48)
+
+    def __init__(self, image, parent=None):
+        super().__init__(parent)
+        self.image = image
+        self.pyramid = TilePyramid(image)
+        self.scale = 1.0
+        self.selection = None  # 原图坐标中的裁剪区域 (x0, y0, x1, y1)
+        self.drag_anchor = None  # 正在框选时的起点（原图坐标）
+        self.pan_origin = None  # 正在平移时的 (鼠标位置, 滚动条位置)
+        self.fitted = True  # 是否跟随窗口宽度缩放
+
+        self.viewport().setMouseTracking(True)
+        self.setFocusPolicy(Qt.FocusPolicy.StrongFocus)
+        self.horizontalScrollBar().valueChanged.connect(self.viewport().update)
+        self.verticalScrollBar().valueChanged.connect(self.viewport().update)
+
+    # ---------- 坐标与缩放 ----------
+
+    def content_offset(self):
+        """原图左上角在视口中的位置（内容比视口窄时居中）"""
+        width = self.pyramid.width * self.scale
+        height = self.pyramid.height * self.scale
+        viewport = self.viewport()
+        x = (viewport.width() - width) / 2 if width < viewport.width() else -self.horizontalScrollBar().value()
+        y = (viewport.height() - height) / 2 if height < viewport.height() else -self.verticalScrollBar().value()
+        return x, y
+
+    def to_image(self, pos):
+        """视口坐标转换为原图坐标（限制在图像范围内）"""
+        offset_x, offset_y = self.content_offset()
+        x = (pos.x() - offset_x) / self.scale
+        y = (pos.y() - offset_y) / self.scale
+        return (int(round(min(max(x, 0), self.pyramid.width))),
+                int(round(min(max(y, 0), self.pyramid.height))))
+
+    def to_view(self, x, y):
+        """原图坐标转换为视口坐标（取整，相邻块的边缘不会出现缝隙）"""
+        offset_x, offset_y = self.content_offset()
+        return int(round(x * self.scale + offset_x)), int(round(y * self.scale + offset_y))
+
+    def update_scroll_ranges(self):
+        viewport = self.viewport()
+        horizontal = self.horizontalScrollBar()
+        vertical = self.verticalScrollBar()
+        horizontal.setRange(0, max(0, int(self.pyramid.width * self.scale) - viewport.width()))
+        vertical.setRange(0, max(0, int(self.pyramid.height * self.scale) - viewport.height()))
+        horizontal.setPageStep(viewport.width())
+        vertical.setPageStep(viewport.height())
+        horizontal.setSingleStep(40)
+        vertical.setSingleStep(40)
+
+    def set_scale(self, scale, anchor=None):
+        """
+        设置缩放比例，anchor（视口坐标）下的图像位置保持不动
+
+        Args:
+            scale: 屏幕像素/原图像素
+            anchor: 缩放中心，默认为视口中心
+        """
+        scale = min(max(scale, self.MIN_SCALE), self.MAX_SCALE)
+        if anchor is None:
+            anchor = self.viewport().rect().center()
+        offset_x, offset_y = self.content_offset()
+        image_x = (anchor.x() - offset_x) / self.scale
+        image_y = (anchor.y() - offset_y) / self.scale
+
+        self.scale = scale
+        self.update_scroll_ranges()
+        self.horizontalScrollBar().setValue(int(round(image_x * scale - anchor.x())))
+        self.verticalScrollBar().setValue(int(round(image_y * scale - anchor.y())))
+        self.viewport().update()
+        self.scale_changed.emit(scale)
+
+    def fit_width(self):
+        """缩放到图像宽度与视口一致（不放大）"""
+        self.fitted = True
+        width = max(1, self.viewport().width())
+        self.set_scale(min(1.0, width / self.pyramid.width))
+
+    def actual_size(self):
+        self.fitted = False
+        self.set_scale(1.0)
+
+    def zoom(self, factor, anchor=None):
+        self.fitted = False
+        self.set_scale(self.scale * factor, anchor)
+
+    # ---------- 选区 ----------
+
+    def set_selection(self, selection):
+        if selection is not None:
+            x0, y0, x1, y1 = selection
+            selection = (min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1))
+            if selection[2] - selection[0] < 1 or selection[3] - selection[1] < 1:
+                selection = None
+        self.selection = selection
+        self.viewport().update()
+        self.selection_changed.emit()
+
+    def cropped_image(self):
+        """返回选区对应的图像（原图的视图，不复制）；没有选区时返回原图"""
+        if self.selection is None:
+            return self.image
+        x0, y0, x1, y1 = self.selection
+        return self.image[y0:y1, x0:x1]
+
+    # ---------- 事件 ----------
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        if self.fitted:
+            self.fit_width()
+        else:
+            self.update_scroll_ranges()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        if self.fitted:
+            self.fit_width()
+
+    def wheelEvent(self, event):
+        if event.modifiers() & Qt.KeyboardModifier.ControlModifier:
+            steps = event.angleDelta().y() / 120
+            if steps:
+                self.zoom(1.25 ** steps, event.position().toPoint())
+            event.accept()
+            return
+        super().wheelEvent(event)
+
+    def keyPressEvent(self, event):
+        key = event.key()
+        if key in (Qt.Key.Key_Plus, Qt.Key.Key_Equal):
+            self.zoom(1.25)
+        elif key == Qt.Key.Key_Minus:
+            self.zoom(0.8)
+        elif key == Qt.Key.Key_0:
+            self.fit_width()
+        elif key == Qt.Key.Key_Home:
+            self.verticalScrollBar().setValue(0)
+        elif key == Qt.Key.Key_End:
+            self.verticalScrollBar().setValue(self.verticalScrollBar().maximum())
+        else:
+            super().keyPressEvent(event)
+
+    def mousePressEvent(self, event):
+        pos = event.position().toPoint()
+        button = event.button()
+        if button == Qt.MouseButton.MiddleButton:
+            self.pan_origin = (pos, self.horizontalScrollBar().value(), self.verticalScrollBar().value())
+            self.viewport().setCursor(Qt.CursorShape.ClosedHandCursor)
+        elif button == Qt.MouseButton.RightButton:
+            self.set_selection(None)
+        elif button == Qt.MouseButton.LeftButton:
+            point = self.to_image(pos)
+            if event.modifiers() & Qt.KeyboardModifier.ShiftModifier and self.selection is not None:
+                # 保留离点击位置较远的一角，把选区延伸到点击位置
+                x0, y0, x1, y1 = self.selection
+                anchor_x = x0 if abs(point[0] - x0) > abs(point[0] - x1) else x1
+                anchor_y = y0 if abs(point[1] - y0) > abs(point[1] - y1) else y1
+                self.drag_anchor = (anchor_x, anchor_y)
+            else:
+                self.drag_anchor = point
+            self.set_selection(self.drag_anchor + point)
+
+    def mouseMoveEvent(self, event):
+        pos = event.position().toPoint()
+        if self.pan_origin is not None:
+            origin, x, y = self.pan_origin
+            self.horizontalScrollBar().setValue(x - (pos.x() - origin.x()))
+            self.verticalScrollBar().setValue(y - (pos.y() - origin.y()))
+        elif self.drag_anchor is not None:
+            self.set_selection(self.drag_anchor + self.to_image(pos))
+
+    def mouseReleaseEvent(self, event):
+        if event.button() == Qt.MouseButton.MiddleButton:
+            self.pan_origin = None
+            self.viewport().unsetCursor()
+        elif event.button() == Qt.MouseButton.LeftButton:
+            self.drag_anchor = None
+
+    def paintEvent(self, event):
+        painter = QPainter(self.viewport())
+        painter.fillRect(event.rect(), self.BACKGROUND)
+        # 缩小显示时平滑缩放；放大时保留像素边缘，便于检查拼接处
+        painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform, self.scale < 1)
+
+        # 只取与重绘区域相交的块
+        dirty = event.rect()
+        offset_x, offset_y = self.content_offset()
+        x0 = (dirty.left() - offset_x) / self.scale
+        y0 = (dirty.top() - offset_y) / self.scale
+        x1 = (dirty.right() + 1 - offset_x) / self.scale
+        y1 = (dirty.bottom() + 1 - offset_y) / self.scale
+        level = self.pyramid.level_for_scale(self.scale)
+        span = self.pyramid.tile_size << level
+        columns, rows = self.pyramid.tile_range(level, x0, y0, x1, y1)
+        for row in rows:
+            for column in columns:
+                tile = self.pyramid.tile(level, column, row)
+                left, top = self.to_view(column * span, row * span)
+                right, bottom = self.to_view(min(self.pyramid.width, (column + 1) * span),
+                                             min(self.pyramid.height, (row + 1) * span))
+                tile_image = QImage(tile.data, tile.shape[1], tile.shape[0], tile.strides[0],
+                                    QImage.Format.Format_BGR888)
+                painter.drawImage(QRect(left, top, right - left, bottom - top), tile_image)
+
+        if self.selection is not None:
+            self.paint_selection(painter)
+        painter.end()
+
+    def paint_selection(self, painter):
+        """选区外半透明遮罩，选区边框和尺寸"""
+        x0, y0, x1, y1 = self.selection
+        left, top = self.to_view(x0, y0)
+        right, bottom = self.to_view(x1, y1)
+        selected = QRect(left, top, right - left, bottom - top)
+        viewport = self.viewport().rect()
+        shade = QColor(0, 0, 0, 140)
+        painter.fillRect(QRect(viewport.left(), viewport.top(), viewport.width(), max(0, top - viewport.top())), shade)
+        painter.fillRect(QRect(viewport.left(), bottom, viewport.width(), max(0, viewport.bottom() + 1 - bottom)), shade)
+        painter.fillRect(QRect(viewport.left(), top, max(0, left - viewport.left()), bottom - top), shade)
+        painter.fillRect(QRect(right, top, max(0, viewport.right() + 1 - right), bottom - top), shade)
+
+        painter.setPen(QPen(QColor(0, 174, 255), 2))
+        painter.drawRect(selected)
+        text = f"{x1 - x0} × {y1 - y0}"
+        label_pos = QPoint(max(left, 0) + 6, min(max(top, 0) + 18, viewport.bottom() - 6))
+        painter.setPen(QColor(0, 0, 0))
+        painter.drawText(label_pos + QPoint(1, 1), text)
+        painter.setPen(QColor(255, 255, 255))
+        painter.drawText(label_pos, text)
+
+
+class ImageViewerDialog(QDialog):
+    """保存前查看长截图并选择裁剪区域"""
+
+    def __init__(self, image, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("预览长截图")
+        self.resize(900, 700)
+
+        layout = QVBoxLayout()
+        self.viewer = TiledImageViewer(image)
+        layout.addWidget(self.viewer)
+
+        self.info_label = QLabel()
+        layout.addWidget(self.info_label)
+
+        button_layout = QHBoxLayout()
+        fit_button = QPushButton("适应宽度")
+        fit_button.clicked.connect(self.viewer.fit_width)
+        actual_button = QPushButton("原始大小")
+        actual_button.clicked.connect(self.viewer.actual_size)
+        clear_button = QPushButton("清除选区")
+        clear_button.clicked.connect(lambda: self.viewer.set_selection(None))
+        self.crop_button = QPushButton("裁剪到选区")
+        self.crop_button.clicked.connect(self.accept)
+        cancel_button = QPushButton("返回")
+        cancel_button.clicked.connect(self.reject)
+        for button in (fit_button, actual_button, clear_button):
+            button_layout.addWidget(button)
+        button_layout.addStretch()
+        button_layout.addWidget(self.crop_button)
+        button_layout.addWidget(cancel_button)
+        layout.addLayout(button_layout)
+        self.setLayout(layout)
+
+        self.viewer.selection_changed.connect(self.update_info)
+        self.viewer.scale_changed.connect(self.update_info)
+        self.update_info()
+
+    def update_info(self):
+        height, width = self.viewer.image.shape[:2]
+        text = f"{width} × {height} 像素，缩放 {self.viewer.scale * 100:.1f}%"
+        selection = self.viewer.selection
+        if selection is not None:
+            x0, y0, x1, y1 = selection
+            text += f"，选区 {x1 - x0} × {y1 - y0}（{x0}, {y0}）"
+        else:
+            text += "。左键拖动选择裁剪区域，Shift+单击延伸选区，Ctrl+滚轮缩放"
+        self.info_label.setText(text)
+        self.crop_button.setEnabled(selection is not None)
+
+    def cropped_image(self):
+        return self.viewer.cropped_image()
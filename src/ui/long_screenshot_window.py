@@ -1,9 +1,15 @@
-from PyQt6.QtCore import Qt, QPoint, QRect, QTimer, QEvent, QThread
-from PyQt6.QtGui import QPainter, QColor, QScreen, QCursor, QImage, QPen
-from PyQt6.QtWidgets import QWidget, QApplication, QMessageBox, QPushButton, QVBoxLayout, QLabel, QFileDialog, QDialog, QHBoxLayout
+from PyQt6.QtCore import Qt, QPoint, QRect, QTimer, QEvent, QThread, pyqtSignal
+from PyQt6.QtGui import QPainter, QColor, QScreen, QCursor, QImage
+from PyQt6.QtWidgets import QWidget, QApplication, QMessageBox, QPushButton, QVBoxLayout, QLabel, QFileDialog, QDialog, QHBoxLayout, QComboBox, QProgressDialog
 from ..utils.win32_utils import get_window_under_cursor, simulate_scroll, bring_window_to_front
+from ..utils.image_export import export_image, ExportCancelled
+from .image_viewer import ImageViewerDialog
+from .selection_overlay import SelectionOverlayPainter, selection_damage, label_rect
 from ..core.long_screenshot import LongScreenshotCapture
-import cv2
+from ..core.capture_profiles import CaptureProfileStore
+from ..core.stitching import to_bgr
+from ..core.telemetry import CaptureTelemetry, PHASE_OVERLAY_PAINT
+import numpy as np
 import time
 import os
 import win32con
@@ -11,6 +17,112 @@ import win32api
 import ctypes
 import threading
 
+# 保存时可选的压缩档位：(名称, PNG/TIFF压缩级别, JPEG/WebP质量)
+SAVE_COMPRESSION_LEVELS = [
+    ("快速保存", 1, 95),
+    ("标准", 6, 90),
+    ("最小文件", 9, 80),
+]
+
+
+class ImageSaveThread(QThread):
+    """在后台线程中逐条带编码并保存图像，通过信号报告进度和结果"""
+    progress = pyqtSignal(int)
+    saved = pyqtSignal(str)
+    error = pyqtSignal(str)
+    
+    def __init__(self, image, file_path, compression, quality):
+        super().__init__()
+        self.image = image
+        self.file_path = file_path
+        self.compression = compression
+        self.quality = quality
+        self.cancel_event = threading.Event()
+    
+    def run(self):
+        try:
+            export_image(self.image, self.file_path, self.compression, self.quality,
+                         progress_callback=self.progress.emit, cancel_event=self.cancel_event)
+            self.saved.emit(self.file_path)
+        except ExportCancelled:
+            print("用户取消保存")
+        except Exception as e:
+            print(f"保存截图出错: {str(e)}")
+            self.error.emit(str(e))
+    
+    def cancel(self):
+        """请求在下一个条带处停止保存"""
+        self.cancel_event.set()
+
+
+class CapturePreviewPanel(QWidget):
+    """
+    捕获过程中显示已拼接内容的实时预览
+    
+    独立的置顶小窗口，放在选区旁边（不遮挡选区，不会被截进画面），不接收鼠标和键盘输入。
+    每次只绘制缩略图金字塔中能放进面板的一层，绘制代价与截图总高度无关。
+    """
+    WIDTH = 220
+    MARGIN = 12
+    
+    def __init__(self):
+        super().__init__(None)
+        self.setWindowFlags(
+            Qt.WindowType.FramelessWindowHint |
+            Qt.WindowType.WindowStaysOnTopHint |
+            Qt.WindowType.Tool |
+            Qt.WindowType.WindowTransparentForInput |
+            Qt.WindowType.WindowDoesNotAcceptFocus
+        )
+        self.setAttribute(Qt.WidgetAttribute.WA_ShowWithoutActivating)
+        self.image = None  # 当前显示的预览（QImage）
+        self.output_height = 0  # 已拼接的高度
+    
+    def place_beside(self, capture_rect, screen_rect):
+        """
+        把面板放在选区右侧（放不下时放在左侧）
+        
+        Returns:
+            是否有足够的空间显示面板
+        """
+        height = min(capture_rect.height(), screen_rect.height() - 2 * self.MARGIN)
+        x = capture_rect.right() + self.MARGIN
+        if x + self.WIDTH > screen_rect.right():
+            x = capture_rect.left() - self.MARGIN - self.WIDTH
+            if x < screen_rect.left():
+                return False
+        self.setGeometry(x, capture_rect.top(), self.WIDTH, height)
+        return True
+    
+    def update_preview(self, preview):
+        """从捕获器的缩略图金字塔取出适合面板大小的一层并重绘"""
+        snapshot = preview.snapshot(self.width() - 8, self.height() - 28)
+        if snapshot is None:
+            return
+        height, width = snapshot.shape[:2]
+        # snapshot 是独立的副本，QImage 复制一份后不再引用它
+        self.image = QImage(snapshot.data, width, height, snapshot.strides[0], QImage.Format.Format_BGR888).copy()
+        self.output_height = preview.height
+        self.update()
+    
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor(40, 40, 40))
+        painter.setPen(QColor(255, 255, 255))
+        painter.drawText(QRect(6, 4, self.width() - 12, 18), Qt.AlignmentFlag.AlignLeft,
+                         f"实时预览  {self.output_height} 像素")
+        if self.image is None:
+            return
+        
+        # 按比例缩放到面板内容区域，保持宽高比
+        area = QRect(4, 24, self.width() - 8, self.height() - 28)
+        scale = min(area.width() / self.image.width(), area.height() / self.image.height())
+        width, height = int(self.image.width() * scale), int(self.image.height() * scale)
+        target = QRect(area.x() + (area.width() - width) // 2, area.y(), width, height)
+        painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform)
+        painter.drawImage(target, self.image)
+
+
 class TransparentWindow(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -28,7 +140,17 @@ class TransparentWindow(QWidget):
         self.current_pos = None
         self.is_capturing = False
         self.capture = LongScreenshotCapture()
+        self.capture.profile_store = CaptureProfileStore()  # 记住每个程序的滚动步长和渲染时间
         self.parent_window = parent
+        self.scroll_progress = (0, self.capture.max_scroll_count)  # 捕获线程上报的进度
+        self.progress_estimate = None  # 根据滚动条估计的进度
+        self.overlay = SelectionOverlayPainter()  # 只重绘变化区域的遮罩绘制，缓存描边文字
+        self.paint_telemetry = CaptureTelemetry(capacity=1024)  # 拖动选区时每帧的绘制耗时
+        
+        # 捕获在工作线程中进行，通过信号通知进度、完成和错误
+        self.capture.progress.connect(self.on_capture_progress)
+        self.capture.finished.connect(self.on_capture_finished)
+        self.capture.error.connect(self.on_capture_error)
         
         # 设置全屏
         screen = QApplication.primaryScreen()
@@ -56,6 +178,9 @@ class TransparentWindow(QWidget):
         self.cancel_button.clicked.connect(self.terminate_capture)
         self.cancel_button.hide()  # 初始隐藏
         
+        # 捕获过程中在选区旁边显示实时预览
+        self.preview_panel = CapturePreviewPanel()
+        
         # 创建一个定时器来检查ESC键状态
         self.esc_check_timer = QTimer(self)
         self.esc_check_timer.timeout.connect(self.check_esc_key)
@@ -78,9 +203,10 @@ class TransparentWindow(QWidget):
         self.esc_check_timer.start(50)  # 每50毫秒检查一次
             
     def hideEvent(self, event):
-        """窗口隐藏时，停止定时器"""
+        """窗口隐藏时，停止定时器并隐藏预览"""
         if hasattr(self, 'esc_check_timer') and self.esc_check_timer.isActive():
             self.esc_check_timer.stop()
+        self.preview_panel.hide()
             
     def check_esc_key(self):
         """检查ESC键是否被按下"""
@@ -94,106 +220,64 @@ class TransparentWindow(QWidget):
             print(f"检查ESC键状态出错: {str(e)}")
             
     def paintEvent(self, event):
-        """绘制半透明遮罩和选区"""
-        painter = QPainter(self)
-        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
-        
-        # 如果正在截图，只绘制选区边框
-        if self.is_capturing and hasattr(self, 'capture_rect'):
-            # 清除背景
-            painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_Clear)
-            painter.fillRect(self.rect(), Qt.GlobalColor.transparent)
-            
-            # 绘制选区边框 - 使用虚线框
-            painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_SourceOver)
-            pen = QPen()
-            pen.setColor(QColor(0, 255, 0))  # 绿色
-            pen.setWidth(2)  # 线宽
-            pen.setStyle(Qt.PenStyle.DashLine)  # 虚线样式
-            painter.setPen(pen)
-            painter.drawRect(self.capture_rect)
-            
-            # 绘制截图进度信息
-            if hasattr(self.capture, 'current_scroll_count'):
-                progress_text = f"截图进度: {self.capture.current_scroll_count}/{self.capture.max_scroll_count}"
-                font = painter.font()
-                font.setPointSize(10)
-                painter.setFont(font)
+        """绘制半透明遮罩和选区，只重绘 event.region() 内变化的部分"""
+        with self.paint_telemetry.phase(PHASE_OVERLAY_PAINT):
+            painter = QPainter(self)
+            
+            # 如果正在截图，只绘制选区边框和进度
+            if self.is_capturing and hasattr(self, 'capture_rect'):
+                progress_text = percent = None
+                # 识别到滚动条时显示估计的完成百分比、剩余帧数和进度条
+                if self.scroll_progress:
+                    estimate = self.progress_estimate
+                    if estimate is not None:
+                        progress_text = f"截图进度: {estimate['percent']:.0f}%"
+                        if estimate['remaining_frames'] is not None:
+                            progress_text += f"（约剩 {estimate['remaining_frames']} 帧）"
+                        percent = estimate['percent']
+                    else:
+                        progress_text = f"截图进度: {self.scroll_progress[0]}/{self.scroll_progress[1]}"
+                self.overlay.paint_capturing(painter, event.region(), self.capture_rect, progress_text, percent)
+                painter.end()
                 
-                # 设置文本颜色为白色，带黑色描边以增强可读性
-                text_rect = QRect(self.capture_rect.x(), self.capture_rect.y() - 25, 200, 20)
-                painter.setPen(QColor(0, 0, 0))
-                for dx in [-1, 1]:
-                    for dy in [-1, 1]:
-                        painter.drawText(text_rect.adjusted(dx, dy, dx, dy), Qt.AlignmentFlag.AlignLeft, progress_text)
-                painter.setPen(QColor(255, 255, 255))
-                painter.drawText(text_rect, Qt.AlignmentFlag.AlignLeft, progress_text)
-            
-            # 显示取消按钮
-            if not self.cancel_button.isVisible():
-                # 计算按钮位置 - 放在选区的右上角
-                button_x = self.capture_rect.right() - self.cancel_button.width() - 10
-                button_y = self.capture_rect.top() - self.cancel_button.height() - 10
-                if button_y < 10:  # 如果太靠上，放在选区下方
-                    button_y = self.capture_rect.bottom() + 10
-                self.cancel_button.move(button_x, button_y)
-                self.cancel_button.show()
-                self.cancel_button.raise_()  # 确保按钮在最上层
+                # 显示取消按钮
+                if not self.cancel_button.isVisible():
+                    # 计算按钮位置 - 放在选区的右上角
+                    button_x = self.capture_rect.right() - self.cancel_button.width() - 10
+                    button_y = self.capture_rect.top() - self.cancel_button.height() - 10
+                    if button_y < 10:  # 如果太靠上，放在选区下方
+                        button_y = self.capture_rect.bottom() + 10
+                    self.cancel_button.move(button_x, button_y)
+                    self.cancel_button.show()
+                    self.cancel_button.raise_()  # 确保按钮在最上层
+                return
             
-            return
-        
-        # 绘制半透明背景
-        painter.fillRect(self.rect(), QColor(0, 0, 0, 100))
-        
-        # 如果正在选择区域，绘制选区
-        if self.start_pos and self.current_pos:
-            select_rect = self.get_select_rect()
-            # 绘制选区（清除遮罩）
-            painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_Clear)
-            painter.fillRect(select_rect, Qt.GlobalColor.transparent)
-            
-            # 绘制选区边框 - 使用虚线框
-            painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_SourceOver)
-            pen = QPen()
-            pen.setColor(QColor(0, 255, 0))  # 绿色
-            pen.setWidth(2)  # 线宽
-            pen.setStyle(Qt.PenStyle.DashLine)  # 虚线样式
-            painter.setPen(pen)
-            painter.drawRect(select_rect)
-            
-            # 绘制选区尺寸信息
-            size_text = f"{select_rect.width()} × {select_rect.height()}"
-            font = painter.font()
-            font.setPointSize(10)
-            painter.setFont(font)
-            
-            # 设置文本颜色为白色，带黑色描边以增强可读性
-            text_rect = QRect(select_rect.x(), select_rect.y() - 25, 150, 20)
-            painter.setPen(QColor(0, 0, 0))
-            for dx in [-1, 1]:
-                for dy in [-1, 1]:
-                    painter.drawText(text_rect.adjusted(dx, dy, dx, dy), Qt.AlignmentFlag.AlignLeft, size_text)
-            painter.setPen(QColor(255, 255, 255))
-            painter.drawText(text_rect, Qt.AlignmentFlag.AlignLeft, size_text)
+            # 绘制半透明遮罩，正在选择区域时清除选区内的遮罩并绘制边框和尺寸
+            self.overlay.paint_selecting(painter, event.region(), self.current_selection())
+            painter.end()
             
     def mousePressEvent(self, event):
         """鼠标按下时开始选择区域"""
         if event.button() == Qt.MouseButton.LeftButton:
             print("鼠标按下，开始选择区域")
+            previous = self.current_selection()
             self.start_pos = event.pos()
             self.current_pos = self.start_pos
-            self.update()
+            self.paint_telemetry.reset()
+            self.update(selection_damage(previous, self.current_selection()))
             
     def mouseMoveEvent(self, event):
-        """鼠标移动时更新选区"""
+        """鼠标移动时更新选区，只重绘新旧选区之间变化的区域"""
         if event.buttons() & Qt.MouseButton.LeftButton:
+            previous = self.current_selection()
             self.current_pos = event.pos()
-            self.update()
+            self.update(selection_damage(previous, self.current_selection()))
             
     def mouseReleaseEvent(self, event):
         """鼠标释放时开始截图"""
         if event.button() == Qt.MouseButton.LeftButton and self.start_pos:
             print("鼠标释放，准备开始截图")
+            self.report_paint_times()
             # 获取选区
             select_rect = self.get_select_rect()
             if select_rect.width() > 10 and select_rect.height() > 10:
@@ -203,6 +287,24 @@ class TransparentWindow(QWidget):
                 print("选区太小，取消截图")
                 self.cancel_capture()
                 
+    def current_selection(self):
+        """正在选择的区域，还没有开始选择时返回 None"""
+        if not self.start_pos or not self.current_pos:
+            return None
+        return self.get_select_rect()
+        
+    def report_paint_times(self):
+        """打印拖动选区期间每帧的绘制耗时，并与屏幕刷新间隔比较"""
+        stats = self.paint_telemetry.summary().get(PHASE_OVERLAY_PAINT)
+        if not stats:
+            return
+        screen = self.screen() or QApplication.primaryScreen()
+        refresh_ms = 1000 / screen.refreshRate() if screen and screen.refreshRate() > 0 else 1000 / 60
+        print(f"拖动选区绘制 {stats['count']} 帧: 中位数 {stats['p50_ms']:.2f} ms, "
+              f"95分位 {stats['p95_ms']:.2f} ms, 最长 {stats['max_ms']:.2f} ms（刷新间隔 {refresh_ms:.1f} ms）")
+        if stats['p95_ms'] > refresh_ms:
+            print("警告: 选区绘制耗时超过屏幕刷新间隔，拖动可能不流畅")
+        
     def get_select_rect(self):
         """获取选择区域"""
         if not self.start_pos or not self.current_pos:
@@ -264,19 +366,17 @@ class TransparentWindow(QWidget):
             
             print(f"全局选区: {global_select_rect.x()}, {global_select_rect.y()}, {global_select_rect.width()}, {global_select_rect.height()}")
             
-            # 使用ShareX风格的捕获方法
+            # 使用ShareX风格的捕获方法，滚动和捕获在工作线程中进行，界面保持响应
+            self.scroll_progress = (0, self.capture.max_scroll_count)
+            self.progress_estimate = None
             self.capture.start_capture(target_window, global_select_rect)
             
-            # 创建一个定时器来更新截图进度
-            self.progress_timer = QTimer(self)
-            self.progress_timer.timeout.connect(self.update_capture_progress)
-            self.progress_timer.start(500)  # 每500毫秒更新一次
-            
-            # 使用简单的事件循环，确保能够响应ESC键
-            # 创建一个单独的定时器来检查截图状态
-            self.check_capture_timer = QTimer(self)
-            self.check_capture_timer.timeout.connect(self.check_capture_status)
-            self.check_capture_timer.start(100)  # 每100毫秒检查一次
+            # 选区旁边有空间时显示实时预览
+            screen = QApplication.primaryScreen()
+            if screen and self.preview_panel.place_beside(global_select_rect, screen.geometry()):
+                self.preview_panel.image = None
+                self.preview_panel.output_height = 0
+                self.preview_panel.show()
             
         except Exception as e:
             print(f"截图过程出错: {str(e)}")
@@ -285,57 +385,60 @@ class TransparentWindow(QWidget):
             self.show_error(f"截图过程出错: {str(e)}")
             self.restore_parent_window()
         
-    def update_capture_progress(self):
-        """更新截图进度显示"""
+    def on_capture_progress(self, current, maximum):
+        """捕获线程上报进度时更新显示"""
+        self.scroll_progress = (current, maximum)
+        self.progress_estimate = self.capture.progress_estimate
         if self.is_capturing and hasattr(self, 'capture_rect'):
-            # 更新窗口以显示最新的截图进度
-            self.update()
+            # 只重绘进度文字和进度条，选区边框没有变化
+            self.update(label_rect(self.capture_rect))
+            if self.preview_panel.isVisible():
+                self.preview_panel.update_preview(self.capture.preview)
+            
+    def on_capture_finished(self, result):
+        """捕获线程完成后处理结果"""
+        # 用户已经终止截图时，结果由 terminate_capture 处理
+        if not self.is_capturing:
+            return
+        
+        # 隐藏窗口
+        self.hide()
+        
+        if result is not None and result.size > 0:
+            print(f"截图完成，图像大小: {result.shape}")
             
-    def check_capture_status(self):
-        """检查截图状态"""
-        # 如果截图已经停止，处理结果
-        if not self.capture.is_capturing:
-            # 停止检查定时器
-            self.check_capture_timer.stop()
+            # 先恢复主窗口，再保存截图
+            self.restore_parent_window()
+            time.sleep(0.5)  # 等待主窗口完全显示
             
-            # 停止进度更新定时器
-            if hasattr(self, 'progress_timer') and self.progress_timer.isActive():
-                self.progress_timer.stop()
+            # 保存截图
+            self.save_screenshot(result)
+        else:
+            print("截图失败，未获取到有效图像")
             
-            # 隐藏窗口
-            self.hide()
+            # 先恢复主窗口
+            self.restore_parent_window()
+            time.sleep(0.5)  # 等待主窗口完全显示
             
-            # 获取结果并保存
-            result = self.capture.result_image
-            if result is not None and result.size > 0:
-                print(f"截图完成，图像大小: {result.shape}")
-                
-                # 先恢复主窗口，再保存截图
-                self.restore_parent_window()
-                time.sleep(0.5)  # 等待主窗口完全显示
-                
+            # 如果有任何帧，尝试使用保留的最近一帧
+            if len(self.capture.screenshots) > 0:
+                print(f"尝试使用已捕获的帧，大小: {self.capture.screenshots[-1].shape}")
                 # 保存截图
-                self.save_screenshot(result)
+                self.save_screenshot(to_bgr(self.capture.screenshots[-1]))
             else:
-                print("截图失败，未获取到有效图像")
-                
-                # 先恢复主窗口
-                self.restore_parent_window()
-                time.sleep(0.5)  # 等待主窗口完全显示
-                
-                # 如果有任何帧，尝试使用第一帧
-                if len(self.capture.screenshots) > 0:
-                    print(f"尝试使用第一帧，大小: {self.capture.screenshots[0].shape}")
-                    # 保存截图
-                    self.save_screenshot(self.capture.screenshots[0])
-                else:
-                    self.show_error("截图失败，未能获取图像")
-            
-            # 确保恢复主窗口状态
-            self.is_capturing = False
-        else:
-            # 如果截图仍在进行，继续检查
-            self.check_capture_timer.start(100)  # 继续检查
+                self.show_error("截图失败，未能获取图像")
+        
+        # 确保恢复主窗口状态
+        self.is_capturing = False
+        
+    def on_capture_error(self, message):
+        """捕获线程出错时恢复界面"""
+        if not self.is_capturing:
+            return
+        self.is_capturing = False
+        self.hide()
+        self.show_error(f"截图过程出错: {message}")
+        self.restore_parent_window()
             
     def restore_parent_window(self):
         """恢复主窗口"""
@@ -387,15 +490,10 @@ class TransparentWindow(QWidget):
             self.esc_check_timer.stop()
             print("停止ESC检查定时器")
         
-        if hasattr(self, 'check_capture_timer') and self.check_capture_timer.isActive():
-            self.check_capture_timer.stop()
-            print("停止截图状态检查定时器")
-        
-        if hasattr(self, 'progress_timer') and self.progress_timer.isActive():
-            self.progress_timer.stop()
-            print("停止进度更新定时器")
+        # 先标记为已停止，捕获线程随后发出的完成信号不再重复处理结果
+        self.is_capturing = False
         
-        # 强制停止截图过程
+        # 强制停止截图过程，等待捕获线程结束
         if hasattr(self, 'capture'):
             print("调用截图捕获器的force_stop方法")
             result = self.capture.force_stop()
@@ -446,11 +544,6 @@ class TransparentWindow(QWidget):
     def save_screenshot(self, image):
         """保存截图或复制到剪贴板"""
         try:
-            # 创建QImage用于复制到剪贴板
-            height, width, channel = image.shape
-            bytes_per_line = 3 * width
-            q_img = QImage(image.data, width, height, bytes_per_line, QImage.Format.Format_RGB888)
-            
             # 获取用户桌面路径作为默认保存位置
             desktop_path = os.path.join(os.path.expanduser("~"), "Desktop")
             default_path = os.path.join(desktop_path, "长截图.png")
@@ -471,21 +564,45 @@ class TransparentWindow(QWidget):
             label = QLabel("长截图已完成，您可以保存或复制到剪贴板")
             layout.addWidget(label)
             
+            # 保存和复制使用当前（可能已裁剪的）图像
+            current = {'image': image, 'selection': None}
+            size_label = QLabel(f"尺寸: {image.shape[1]} × {image.shape[0]} 像素")
+            layout.addWidget(size_label)
+            
+            # 压缩档位
+            compression_layout = QHBoxLayout()
+            compression_layout.addWidget(QLabel("压缩:"))
+            compression_box = QComboBox()
+            for name, _, _ in SAVE_COMPRESSION_LEVELS:
+                compression_box.addItem(name)
+            compression_box.setCurrentIndex(1)
+            compression_layout.addWidget(compression_box)
+            layout.addLayout(compression_layout)
+            
             # 按钮布局
             button_layout = QHBoxLayout()
             
+            # 预览按钮：分块查看完整截图，可以裁剪后再保存
+            preview_button = QPushButton("预览/裁剪")
+            preview_button.clicked.connect(
+                lambda: self._preview_and_crop(image, current, size_label, dialog)
+            )
+            
             # 保存按钮
             save_button = QPushButton("保存图片")
-            save_button.clicked.connect(lambda: self._save_image_to_file(image, dialog))
+            save_button.clicked.connect(
+                lambda: self._save_image_to_file(current['image'], dialog, compression_box.currentIndex())
+            )
             
-            # 复制按钮
+            # 复制按钮（点击时才创建QImage）
             copy_button = QPushButton("复制到剪贴板")
-            copy_button.clicked.connect(lambda: self._copy_image_to_clipboard(q_img, dialog))
+            copy_button.clicked.connect(lambda: self._copy_image_to_clipboard(current['image'], dialog))
             
             # 取消按钮
             cancel_button = QPushButton("取消")
             cancel_button.clicked.connect(dialog.reject)
             
+            button_layout.addWidget(preview_button)
             button_layout.addWidget(save_button)
             button_layout.addWidget(copy_button)
             button_layout.addWidget(cancel_button)
@@ -501,8 +618,27 @@ class TransparentWindow(QWidget):
             traceback.print_exc()
             self.show_error(f"处理截图出错: {str(e)}")
 
-    def _save_image_to_file(self, image, parent_dialog=None):
-        """保存图像到文件"""
+    def _preview_and_crop(self, image, current, size_label, parent_dialog=None):
+        """打开分块预览，确认裁剪后保存和复制都使用选区（原图的视图，不复制数据）"""
+        try:
+            viewer_dialog = ImageViewerDialog(image, parent_dialog or self.parent_window)
+            # 再次打开时显示上次的选区
+            viewer_dialog.viewer.set_selection(current['selection'])
+            if viewer_dialog.exec() != QDialog.DialogCode.Accepted:
+                return
+            current['selection'] = viewer_dialog.viewer.selection
+            current['image'] = viewer_dialog.cropped_image()
+            height, width = current['image'].shape[:2]
+            size_label.setText(f"尺寸: {width} × {height} 像素（已裁剪）")
+            print(f"裁剪长截图为 {width} × {height}")
+        except Exception as e:
+            print(f"预览截图出错: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            self.show_error(f"预览截图出错: {str(e)}")
+
+    def _save_image_to_file(self, image, parent_dialog=None, compression_index=1):
+        """选择保存路径后在后台线程中保存图像，界面显示进度"""
         try:
             # 获取用户桌面路径作为默认保存位置
             desktop_path = os.path.join(os.path.expanduser("~"), "Desktop")
@@ -514,60 +650,68 @@ class TransparentWindow(QWidget):
                 default_path = os.path.join(desktop_path, "长截图.png")
             
             # 使用模态对话框，确保不会导致主程序退出
-            dialog = QFileDialog(self.parent_window, "保存长截图", default_path, "PNG图像 (*.png);;JPEG图像 (*.jpg *.jpeg)")
+            dialog = QFileDialog(
+                self.parent_window, "保存长截图", default_path,
+                "PNG图像 (*.png);;TIFF图像 (*.tif *.tiff);;JPEG图像 (*.jpg *.jpeg);;WebP图像 (*.webp)"
+            )
             dialog.setAcceptMode(QFileDialog.AcceptMode.AcceptSave)
             dialog.setDefaultSuffix("png")
             
-            if dialog.exec() == QFileDialog.DialogCode.Accepted:
-                file_path = dialog.selectedFiles()[0]
-                print(f"保存截图到: {file_path}")
-                
-                # 确保文件扩展名正确
-                if not file_path.lower().endswith(('.png', '.jpg', '.jpeg')):
-                    file_path += '.png'
-                
-                # 确保目录存在
-                save_dir = os.path.dirname(file_path)
-                if not os.path.exists(save_dir):
-                    os.makedirs(save_dir)
-                
-                # 保存图像
-                success = cv2.imwrite(file_path, image)
-                
-                if success:
-                    print("截图保存成功")
-                    QMessageBox.information(self.parent_window, "保存成功", f"长截图已保存到:\n{file_path}")
-                    if parent_dialog:
-                        parent_dialog.accept()
-                else:
-                    print("截图保存失败")
-                    # 尝试使用备用方法保存
-                    try:
-                        # 转换为QImage并保存
-                        height, width, channel = image.shape
-                        bytes_per_line = 3 * width
-                        q_img = QImage(image.data, width, height, bytes_per_line, QImage.Format.Format_RGB888)
-                        if q_img.save(file_path):
-                            print("使用备用方法保存成功")
-                            QMessageBox.information(self.parent_window, "保存成功", f"长截图已保存到:\n{file_path}")
-                            if parent_dialog:
-                                parent_dialog.accept()
-                        else:
-                            raise Exception("备用保存方法也失败了")
-                    except Exception as e:
-                        print(f"备用保存方法失败: {str(e)}")
-                        self.show_error(f"保存截图失败，请检查文件路径和权限\n错误: {str(e)}")
-            else:
+            if dialog.exec() != QFileDialog.DialogCode.Accepted:
                 print("用户取消保存")
+                return
+            
+            file_path = dialog.selectedFiles()[0]
+            print(f"保存截图到: {file_path}")
+            
+            # 确保文件扩展名正确
+            if not file_path.lower().endswith(('.png', '.tif', '.tiff', '.jpg', '.jpeg', '.webp')):
+                file_path += '.png'
+            
+            # 确保目录存在
+            save_dir = os.path.dirname(file_path)
+            if not os.path.exists(save_dir):
+                os.makedirs(save_dir)
+            
+            # 在后台线程中逐条带编码，直接读取拼接结果（或磁盘映射画布），界面保持响应
+            _, compression, quality = SAVE_COMPRESSION_LEVELS[compression_index]
+            progress_dialog = QProgressDialog("正在保存长截图...", "取消", 0, 100, self.parent_window)
+            progress_dialog.setWindowTitle("保存长截图")
+            progress_dialog.setWindowModality(Qt.WindowModality.WindowModal)
+            progress_dialog.setMinimumDuration(300)
+            
+            self.save_thread = ImageSaveThread(image, file_path, compression, quality)
+            self.save_thread.progress.connect(progress_dialog.setValue)
+            progress_dialog.canceled.connect(self.save_thread.cancel)
+            self.save_thread.saved.connect(lambda path: self._on_image_saved(path, parent_dialog))
+            self.save_thread.error.connect(
+                lambda message: self.show_error(f"保存截图失败，请检查文件路径和权限\n错误: {message}")
+            )
+            self.save_thread.finished.connect(progress_dialog.reset)
+            self.save_thread.start()
         except Exception as e:
             print(f"保存截图出错: {str(e)}")
             import traceback
             traceback.print_exc()
             self.show_error(f"保存截图出错: {str(e)}")
+    
+    def _on_image_saved(self, file_path, parent_dialog=None):
+        """后台保存完成"""
+        print("截图保存成功")
+        QMessageBox.information(self.parent_window, "保存成功", f"长截图已保存到:\n{file_path}")
+        if parent_dialog:
+            parent_dialog.accept()
 
-    def _copy_image_to_clipboard(self, q_img, parent_dialog=None):
+    def _copy_image_to_clipboard(self, image, parent_dialog=None):
         """复制图像到剪贴板"""
         try:
+            # 点击复制时才创建QImage，数据为BGR顺序
+            # 裁剪后的图像是原图的视图，行之间不连续
+            image = np.ascontiguousarray(image)
+            height, width, channel = image.shape
+            bytes_per_line = 3 * width
+            q_img = QImage(image.data, width, height, bytes_per_line, QImage.Format.Format_BGR888)
+            
             # 获取剪贴板
             clipboard = QApplication.clipboard()
             
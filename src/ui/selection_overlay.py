@@ -0,0 +1,212 @@
+"""
+选区遮罩的局部重绘
+
+透明窗口覆盖整个屏幕，如果每次鼠标移动或进度更新都重绘整个窗口，
+在4K或多显示器上每帧要填充几千万像素，并把文字按四个方向各描一遍边，
+拖动选区会卡顿，还会和捕获争用同一个线程。
+这里计算两次状态之间真正变化的区域：新旧选区的差异、两个选区的边框和尺寸/进度标签，
+窗口只把这些区域交给 update()，绘制时 QPainter 被裁剪到变化的区域内。
+带描边的文字渲染一次后缓存为 QPixmap，之后每次绘制只需贴一张小图。
+遮罩是纯色，直接在变化区域内填充比贴一张全屏大小的缓存图更快，也不占用内存，因此不缓存。
+"""
+from collections import OrderedDict
+
+from PyQt6.QtCore import Qt, QPoint, QRect
+from PyQt6.QtGui import QPainter, QColor, QPen, QPixmap, QRegion, QFont, QFontMetrics
+
+MASK_COLOR = QColor(0, 0, 0, 100)  # 选区外的半透明遮罩
+BORDER_COLOR = QColor(0, 255, 0)  # 选区虚线边框
+BORDER_WIDTH = 2
+# 边框在选区矩形两侧覆盖的像素（半个线宽加上抗锯齿）
+BORDER_MARGIN = 2
+
+# 标签（尺寸或进度文字、进度条）画在选区左上角上方
+LABEL_OFFSET = 25
+LABEL_WIDTH = 240
+LABEL_HEIGHT = 20
+PROGRESS_BAR_WIDTH = 200
+
+
+def label_rect(rect):
+    """选区的标签占用的区域：文字、描边和进度条，宽度固定，更长的文字被截断"""
+    return QRect(rect.x() - 2, rect.y() - LABEL_OFFSET - 2, LABEL_WIDTH + 4, LABEL_OFFSET + 1)
+
+
+def border_region(rect):
+    """选区边框占用的区域：选区矩形边缘内外各 BORDER_MARGIN 像素的一圈"""
+    # QPainter.drawRect 的右/下边在 x + width、y + height 处，比 QRect.right()/bottom() 多一个像素
+    outer = rect.adjusted(-BORDER_MARGIN, -BORDER_MARGIN, BORDER_MARGIN + 1, BORDER_MARGIN + 1)
+    inner = rect.adjusted(BORDER_MARGIN + 1, BORDER_MARGIN + 1, -BORDER_MARGIN, -BORDER_MARGIN)
+    region = QRegion(outer)
+    if inner.isValid():
+        region = region.subtracted(QRegion(inner))
+    return region
+
+
+def selection_damage(old_rect, new_rect):
+    """
+    选区从 old_rect 变为 new_rect 时需要重绘的区域
+
+    两个选区内部都是清除遮罩后的透明区域，只有属于其中一个的部分会变化；
+    再加上两个选区的边框和标签。
+
+    Args:
+        old_rect, new_rect: 选区矩形，没有选区时为 None
+
+    Returns:
+        QRegion
+    """
+    region = QRegion()
+    for rect in (old_rect, new_rect):
+        if rect is not None:
+            region = region.united(border_region(rect)).united(QRegion(label_rect(rect)))
+    if old_rect is not None and new_rect is not None:
+        region = region.united(QRegion(old_rect).xored(QRegion(new_rect)))
+    elif old_rect is not None or new_rect is not None:
+        region = region.united(QRegion(old_rect if old_rect is not None else new_rect))
+    return region
+
+
+class OutlinedTextCache:
+    """
+    带黑色描边的白色文字，渲染为透明背景的 QPixmap 后缓存
+
+    同一段文字（例如两次进度更新之间的其他重绘）直接复用缓存的图像，
+    最近使用的若干条保留，更早的被丢弃。
+    """
+
+    def __init__(self, point_size=10, capacity=32):
+        self.font = QFont()
+        self.font.setPointSize(point_size)
+        self.metrics = QFontMetrics(self.font)
+        self.capacity = capacity
+        self.pixmaps = OrderedDict()
+
+    def pixmap(self, text, device_pixel_ratio=1.0):
+        """返回文字的图像，文字原点在图像的 (1, 1) 处，四周留出1像素的描边"""
+        key = (text, device_pixel_ratio)
+        pixmap = self.pixmaps.get(key)
+        if pixmap is not None:
+            self.pixmaps.move_to_end(key)
+            return pixmap
+        pixmap = self._render(text, device_pixel_ratio)
+        self.pixmaps[key] = pixmap
+        while len(self.pixmaps) > self.capacity:
+            self.pixmaps.popitem(last=False)
+        return pixmap
+
+    def _render(self, text, device_pixel_ratio):
+        width = min(self.metrics.horizontalAdvance(text), LABEL_WIDTH) + 2
+        height = min(self.metrics.height(), LABEL_HEIGHT) + 2
+        pixmap = QPixmap(round(width * device_pixel_ratio), round(height * device_pixel_ratio))
+        pixmap.setDevicePixelRatio(device_pixel_ratio)
+        pixmap.fill(Qt.GlobalColor.transparent)
+
+        painter = QPainter(pixmap)
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        painter.setFont(self.font)
+        text_rect = QRect(1, 1, width - 2, height - 2)
+        # 黑色描边增强在任意背景上的可读性
+        painter.setPen(QColor(0, 0, 0))
+        for dx in [-1, 1]:
+            for dy in [-1, 1]:
+                painter.drawText(text_rect.adjusted(dx, dy, dx, dy), Qt.AlignmentFlag.AlignLeft, text)
+        painter.setPen(QColor(255, 255, 255))
+        painter.drawText(text_rect, Qt.AlignmentFlag.AlignLeft, text)
+        painter.end()
+        return pixmap
+
+
+class SelectionOverlayPainter:
+    """绘制选区遮罩、边框和标签，只填充传入的重绘区域"""
+
+    def __init__(self):
+        self.text_cache = OutlinedTextCache()
+        self.pen = QPen()
+        self.pen.setColor(BORDER_COLOR)
+        self.pen.setWidth(BORDER_WIDTH)
+        self.pen.setStyle(Qt.PenStyle.DashLine)
+
+    def paint_selecting(self, painter, dirty, select_rect):
+        """
+        选择区域时：选区外是半透明遮罩，选区内透明，画边框和尺寸
+
+        Args:
+            dirty: 需要重绘的区域（paintEvent 的 event.region()），painter 已被裁剪到该区域
+            select_rect: 当前选区，没有选区时为 None
+        """
+        bounds = dirty.boundingRect()
+        painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_Source)
+        painter.fillRect(bounds, MASK_COLOR)
+        if select_rect is None:
+            return
+        painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_Clear)
+        painter.fillRect(select_rect.intersected(bounds), Qt.GlobalColor.transparent)
+        painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_SourceOver)
+        self._paint_border(painter, dirty, select_rect)
+        self._paint_label(painter, dirty, select_rect, f"{select_rect.width()} × {select_rect.height()}")
+
+    def paint_capturing(self, painter, dirty, capture_rect, progress_text=None, percent=None):
+        """
+        捕获时：整个窗口透明，只画选区边框和进度
+
+        Args:
+            progress_text: 进度文字，None 时不画
+            percent: 估计的完成百分比，不为 None 时在文字下方画进度条
+        """
+        painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_Clear)
+        painter.fillRect(dirty.boundingRect(), Qt.GlobalColor.transparent)
+        painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_SourceOver)
+        self._paint_border(painter, dirty, capture_rect)
+        if percent is not None:
+            bar_rect = QRect(capture_rect.x(), capture_rect.y() - 5, PROGRESS_BAR_WIDTH, 4)
+            painter.fillRect(bar_rect, QColor(0, 0, 0, 160))
+            done_width = int(bar_rect.width() * percent / 100)
+            painter.fillRect(QRect(bar_rect.x(), bar_rect.y(), done_width, bar_rect.height()), BORDER_COLOR)
+        if progress_text is not None:
+            self._paint_label(painter, dirty, capture_rect, progress_text)
+
+    def _paint_border(self, painter, dirty, rect):
+        """
+        只画边框与重绘区域相交的部分
+
+        虚线矩形的绘制代价与周长成正比，整条画一次在4K选区上要几毫秒。
+        这里按 drawRect 的顺序（上、右、下、左）逐条边截取重绘区域内的一段，
+        用虚线偏移接上整圈的虚线相位，结果与整条绘制相同。
+        边框与像素网格对齐，不需要抗锯齿。
+        """
+        x, y, w, h = rect.x(), rect.y(), rect.width(), rect.height()
+        corners = [(x, y), (x + w, y), (x + w, y + h), (x, y + h), (x, y)]
+        travelled = 0
+        for (x0, y0), (x1, y1) in zip(corners, corners[1:]):
+            length = abs(x1 - x0) + abs(y1 - y0)
+            step_x, step_y = (x1 > x0) - (x1 < x0), (y1 > y0) - (y1 < y0)
+            # 重绘区域中与这条边相交的范围（拖动一角时，相邻两条边只有末端变化）
+            strip = QRect(min(x0, x1), min(y0, y1), abs(x1 - x0) + 1, abs(y1 - y0) + 1).adjusted(
+                -BORDER_MARGIN, -BORDER_MARGIN, BORDER_MARGIN, BORDER_MARGIN)
+            area = dirty.intersected(QRegion(strip)).boundingRect().adjusted(
+                -BORDER_MARGIN, -BORDER_MARGIN, BORDER_MARGIN + 1, BORDER_MARGIN + 1)
+            # 这条边上位于该范围内的参数范围 [t0, t1]
+            t0, t1 = (0, length) if area.isValid() else (1, 0)
+            for start, step, low, high in ((x0, step_x, area.left(), area.right() + 1),
+                                           (y0, step_y, area.top(), area.bottom() + 1)):
+                if step == 0:
+                    if not low <= start <= high:
+                        t0, t1 = 1, 0
+                elif step > 0:
+                    t0, t1 = max(t0, low - start), min(t1, high - start)
+                else:
+                    t0, t1 = max(t0, start - high), min(t1, start - low)
+            if length > 0 and t0 < t1:
+                pen = QPen(self.pen)
+                pen.setDashOffset((travelled + t0) / BORDER_WIDTH)
+                painter.setPen(pen)
+                painter.drawLine(x0 + step_x * t0, y0 + step_y * t0, x0 + step_x * t1, y0 + step_y * t1)
+            travelled += length
+
+    def _paint_label(self, painter, dirty, rect, text):
+        if not dirty.intersects(label_rect(rect)):
+            return
+        pixmap = self.text_cache.pixmap(text, painter.device().devicePixelRatioF())
+        # 文字原点在图像的 (1, 1) 处，与原来在 (x, y - 25) 处直接绘制的位置一致
+        painter.drawPixmap(QPoint(rect.x() - 1, rect.y() - LABEL_OFFSET - 1), pixmap)
@@ -0,0 +1,234 @@
+"""
+图像导出工具 - 按行条带流式编码超长截图
+
+PNG 和分块 TIFF 由本模块逐条带编码写入文件，每次只读取源图像的一个条带，
+源图像可以是内存数组，也可以是磁盘映射的 np.memmap，不需要第二份完整大小的缓冲区。
+JPEG 和 WebP 交给 OpenCV 一次编码（格式本身有尺寸上限，只适合中等高度的截图）。
+"""
+import os
+import struct
+import zlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+import cv2
+import numpy as np
+
+# 文件扩展名到导出格式的映射
+EXPORT_FORMATS = {
+    '.png': 'png',
+    '.tif': 'tiff',
+    '.tiff': 'tiff',
+    '.jpg': 'jpeg',
+    '.jpeg': 'jpeg',
+    '.webp': 'webp',
+}
+
+# 每次编码的条带高度
+DEFAULT_STRIP_HEIGHT = 256
+# TIFF 分块边长（规范要求为16的倍数）
+TIFF_TILE_SIZE = 256
+# 各格式的尺寸上限
+JPEG_MAX_SIDE = 65535
+WEBP_MAX_SIDE = 16383
+
+
+class ExportCancelled(Exception):
+    """导出被取消"""
+    pass
+
+
+def export_image(image: np.ndarray, file_path: str, compression: int = 6, quality: int = 95,
+                 strip_height: int = DEFAULT_STRIP_HEIGHT,
+                 progress_callback: Optional[Callable[[int], None]] = None,
+                 cancel_event: Optional[threading.Event] = None) -> str:
+    """
+    按文件扩展名导出BGR图像
+
+    先写入同目录下的临时文件，完成后再替换目标文件；出错或取消时删除临时文件。
+    文件由Python打开，路径可以包含中文。
+
+    Args:
+        image: BGR格式的图像（可以是 np.memmap）
+        file_path: 目标文件路径，扩展名决定格式（png、tif/tiff、jpg/jpeg、webp）
+        compression: PNG/TIFF 的 zlib 压缩级别（0-9）
+        quality: JPEG/WebP 的质量（1-100）
+        strip_height: 每次编码的条带高度
+        progress_callback: 进度回调，参数为 0-100 的整数
+        cancel_event: 设置后导出在下一个条带处中止，并抛出 ExportCancelled
+
+    Returns:
+        导出的文件路径
+    """
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext not in EXPORT_FORMATS:
+        raise ValueError(f"不支持的图像格式: {ext}")
+    export_format = EXPORT_FORMATS[ext]
+
+    def report(done, total):
+        if cancel_event is not None and cancel_event.is_set():
+            raise ExportCancelled("导出已取消")
+        if progress_callback:
+            progress_callback(int(done * 100 / max(total, 1)))
+
+    temp_path = file_path + '.part'
+    try:
+        with open(temp_path, 'wb') as f:
+            if export_format == 'png':
+                _write_png(f, image, compression, strip_height, report)
+            elif export_format == 'tiff':
+                _write_tiff(f, image, compression, report)
+            else:
+                _write_encoded(f, image, export_format, quality, report)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    return file_path
+
+
+def _bgr_to_rgb(strip):
+    """将BGR条带转换为RGB（新数组）"""
+    return np.ascontiguousarray(strip[..., ::-1])
+
+
+def _png_chunk(f, chunk_type, data):
+    """写入一个PNG数据块"""
+    f.write(struct.pack('>I', len(data)))
+    f.write(chunk_type)
+    f.write(data)
+    f.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(chunk_type)) & 0xFFFFFFFF))
+
+
+def _write_png(f, image, level, strip_height, report):
+    """
+    逐条带写入PNG
+
+    每行使用 Up 过滤（与上一行逐字节相减），截图中大量重复的行和背景因此变成0，
+    压缩率明显高于不过滤；过滤只依赖上一行，条带之间只需保留一行。
+    """
+    height, width = image.shape[:2]
+    f.write(b'\x89PNG\r\n\x1a\n')
+    # 8位RGB，标准压缩/过滤方式，无隔行扫描
+    _png_chunk(f, b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+
+    compressor = zlib.compressobj(level)
+    previous_row = np.zeros((1, width * 3), dtype=np.uint8)
+    for y in range(0, height, strip_height):
+        report(y, height)
+        rows = _bgr_to_rgb(image[y:y + strip_height]).reshape(-1, width * 3)
+
+        filtered = np.empty((len(rows), width * 3 + 1), dtype=np.uint8)
+        filtered[:, 0] = 2  # 过滤类型 Up
+        np.subtract(rows[1:], rows[:-1], out=filtered[1:, 1:])
+        np.subtract(rows[:1], previous_row, out=filtered[:1, 1:])
+        previous_row = rows[-1:]
+
+        data = compressor.compress(filtered.tobytes())
+        if data:
+            _png_chunk(f, b'IDAT', data)
+
+    _png_chunk(f, b'IDAT', compressor.flush())
+    _png_chunk(f, b'IEND', b'')
+    report(height, height)
+
+
+def _write_tiff(f, image, level, report):
+    """
+    逐行分块写入分块（tiled）TIFF，Deflate压缩
+
+    每次读取一行分块（TIFF_TILE_SIZE 行），横向切成分块后在线程池中并行压缩
+    （zlib 在压缩期间释放 GIL），分块数据按顺序写入，最后写入IFD并回填偏移。
+    """
+    height, width = image.shape[:2]
+    tile = TIFF_TILE_SIZE
+    tiles_across = -(-width // tile)
+
+    # 文件头：小端序，IFD偏移稍后回填
+    f.write(b'II*\x00\x00\x00\x00\x00')
+    offsets, byte_counts = [], []
+
+    def compress_tile(x):
+        block = np.zeros((tile, tile, 3), dtype=np.uint8)  # 边缘分块按规范补齐
+        part = band[:, x:x + tile]
+        block[:part.shape[0], :part.shape[1]] = part
+        return zlib.compress(block.tobytes(), level)
+
+    with ThreadPoolExecutor(max_workers=min(os.cpu_count() or 1, tiles_across)) as executor:
+        for y in range(0, height, tile):
+            report(y, height)
+            band = _bgr_to_rgb(image[y:y + tile])
+            for data in executor.map(compress_tile, range(0, width, tile)):
+                offsets.append(f.tell())
+                byte_counts.append(len(data))
+                f.write(data)
+
+    if f.tell() >= 2 ** 32:
+        raise ValueError("图像过大，超过了TIFF文件4GB的限制，请保存为PNG")
+
+    # 分块偏移、字节数和每样本位数放在IFD之前的数组中
+    if f.tell() % 2:
+        f.write(b'\x00')
+    offsets_pos = f.tell()
+    f.write(struct.pack(f'<{len(offsets)}I', *offsets))
+    counts_pos = f.tell()
+    f.write(struct.pack(f'<{len(byte_counts)}I', *byte_counts))
+    bits_pos = f.tell()
+    f.write(struct.pack('<3H', 8, 8, 8))
+
+    # 标签需按编号升序排列：(标签, 类型, 数量, 值或偏移)，类型 3=SHORT 4=LONG
+    entries = [
+        (256, 4, 1, width),                 # ImageWidth
+        (257, 4, 1, height),                # ImageLength
+        (258, 3, 3, bits_pos),              # BitsPerSample
+        (259, 3, 1, 8),                     # Compression = Deflate
+        (262, 3, 1, 2),                     # PhotometricInterpretation = RGB
+        (277, 3, 1, 3),                     # SamplesPerPixel
+        (284, 3, 1, 1),                     # PlanarConfiguration = 交错存储
+        (322, 3, 1, tile),                  # TileWidth
+        (323, 3, 1, tile),                  # TileLength
+        (324, 4, len(offsets), offsets_pos),      # TileOffsets
+        (325, 4, len(byte_counts), counts_pos),   # TileByteCounts
+    ]
+    # 只有一个分块时，偏移和字节数直接存放在标签中
+    if len(offsets) == 1:
+        entries[-2] = (324, 4, 1, offsets[0])
+        entries[-1] = (325, 4, 1, byte_counts[0])
+
+    ifd_pos = f.tell()
+    f.write(struct.pack('<H', len(entries)))
+    for tag, field_type, count, value in entries:
+        if field_type == 3 and count == 1:
+            f.write(struct.pack('<HHIHH', tag, field_type, count, value, 0))
+        else:
+            f.write(struct.pack('<HHII', tag, field_type, count, value))
+    f.write(struct.pack('<I', 0))  # 没有下一个IFD
+
+    f.seek(4)
+    f.write(struct.pack('<I', ifd_pos))
+    report(height, height)
+
+
+def _write_encoded(f, image, export_format, quality, report):
+    """用OpenCV编码JPEG/WebP并写入文件（格式不支持逐条带写入）"""
+    height, width = image.shape[:2]
+    max_side = WEBP_MAX_SIDE if export_format == 'webp' else JPEG_MAX_SIDE
+    if max(height, width) > max_side:
+        raise ValueError(f"{export_format.upper()} 最大支持 {max_side} 像素，"
+                         f"当前图像为 {width}×{height}，请保存为PNG或TIFF")
+
+    report(0, 1)
+    if export_format == 'webp':
+        params = [cv2.IMWRITE_WEBP_QUALITY, quality]
+        ext = '.webp'
+    else:
+        params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+        ext = '.jpg'
+    success, encoded = cv2.imencode(ext, image, params)
+    if not success:
+        raise ValueError(f"{export_format.upper()} 编码失败")
+    f.write(encoded.tobytes())
+    report(1, 1)
@@ -1,50 +1,213 @@
 """
 图像预处理工具 - 用于提高OCR识别效果
 """
+import os
+import time
+import logging
 import cv2
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from typing import Tuple, Optional, List
+from .text_postprocess import TextPostProcessor
 
-def preprocess_image(image, enhance_text=True):
+logger = logging.getLogger(__name__)
+
+# 图像高度超过该值时自动启用分块并行处理
+TILED_MIN_HEIGHT = 4096
+# 分块并行处理时每个分块的默认高度（不含重叠边）
+DEFAULT_TILE_HEIGHT = 1024
+
+# 去噪质量档位：fast 为中值滤波（或不处理），balanced 为双边滤波，best 为非局部均值去噪
+QUALITY_TIERS = ('fast', 'balanced', 'best')
+# 噪声水平低于该值时认为图像干净，fast 档位直接跳过去噪
+NOISE_CLEAN_THRESHOLD = 1.0
+# 自动选择档位的噪声阈值：低于 BALANCED 用 fast，低于 BEST 用 balanced，否则用 best
+NOISE_BALANCED_THRESHOLD = 2.5
+NOISE_BEST_THRESHOLD = 6.0
+
+def run_tiled(func, image, halo, tile_height=DEFAULT_TILE_HEIGHT, max_workers=None):
+    """
+    将图像按水平条带分块，在线程池中并行执行处理函数
+
+    每个分块上下各多取 halo 行作为重叠边，处理后裁掉重叠部分再写回结果。
+    只要 halo 不小于滤波器的半径，分块结果与整图处理完全一致，不会出现接缝。
+    OpenCV 在计算期间会释放 GIL，因此线程池可以真正利用多个CPU核心。
+
+    Args:
+        func: 处理函数，接收一个图像分块，返回同样高度的处理结果
+        image: 输入图像
+        halo: 每个分块上下重叠的行数
+        tile_height: 每个分块的高度，小于等于0时不分块
+        max_workers: 线程数，默认使用CPU核心数
+
+    Returns:
+        处理后的图像
+    """
+    height = image.shape[0]
+    if tile_height <= 0 or height <= tile_height:
+        return func(image)
+
+    bounds = [(y, min(y + tile_height, height)) for y in range(0, height, tile_height)]
+
+    def process_tile(bound):
+        y_start, y_end = bound
+        # 带重叠边的分块范围
+        top = max(0, y_start - halo)
+        bottom = min(height, y_end + halo)
+        tile = func(image[top:bottom])
+        # 裁掉重叠边，只保留分块本身
+        return y_start, tile[y_start - top:y_end - top]
+
+    result = None
+    workers = max_workers or os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=min(workers, len(bounds))) as executor:
+        for y_start, part in executor.map(process_tile, bounds):
+            if result is None:
+                result = np.empty((height,) + part.shape[1:], dtype=part.dtype)
+            result[y_start:y_start + part.shape[0]] = part
+
+    return result
+
+def _resolve_tile_height(image, tile_height):
+    """确定分块高度：None 表示按图像高度自动决定，0 表示不分块"""
+    if tile_height is None:
+        return DEFAULT_TILE_HEIGHT if image.shape[0] > TILED_MIN_HEIGHT else 0
+    return tile_height
+
+def estimate_noise_level(gray, max_side=512):
+    """
+    快速估计图像的噪声水平
+
+    在按步长抽样缩小的图像上计算拉普拉斯响应，只统计平坦区域（梯度较小处）的像素，
+    返回换算后的噪声标准差。抽样而非插值缩放，避免缩放本身把噪声平均掉。
+
+    Args:
+        gray: 灰度图像
+        max_side: 抽样后图像的最大边长
+
+    Returns:
+        float: 估计的噪声标准差（灰度级）
+    """
+    step = max(1, int(np.ceil(max(gray.shape[:2]) / max_side)))
+    sample = gray[::step, ::step].astype(np.float32)
+    if sample.shape[0] < 3 or sample.shape[1] < 3:
+        return 0.0
+
+    # 用平滑后的梯度区分平坦区域和文字边缘
+    smoothed = cv2.GaussianBlur(sample, (5, 5), 0)
+    gradient = np.abs(cv2.Sobel(smoothed, cv2.CV_32F, 1, 0)) + np.abs(cv2.Sobel(smoothed, cv2.CV_32F, 0, 1))
+    flat = gradient < 20
+
+    laplacian = cv2.Laplacian(sample, cv2.CV_32F)
+    values = laplacian[flat]
+    if values.size < 16:
+        values = laplacian.ravel()
+
+    # 用中位数绝对偏差估计标准差，避免残留的文字边缘拉高估计值；
+    # 4邻域拉普拉斯核作用于独立噪声时，方差放大为 20 倍
+    mad = np.median(np.abs(values - np.median(values)))
+    return float(1.4826 * mad / np.sqrt(20.0))
+
+def select_quality_tier(noise_level):
+    """
+    根据噪声水平自动选择去噪质量档位
+
+    Args:
+        noise_level: estimate_noise_level 返回的噪声标准差
+
+    Returns:
+        str: 'fast'、'balanced' 或 'best'
+    """
+    if noise_level < NOISE_BALANCED_THRESHOLD:
+        return 'fast'
+    if noise_level < NOISE_BEST_THRESHOLD:
+        return 'balanced'
+    return 'best'
+
+def denoise_image(gray, tier, noise_level=None, tile_height=0, max_workers=None):
+    """
+    按质量档位对灰度图像去噪
+
+    Args:
+        gray: 灰度图像
+        tier: 质量档位，'fast'、'balanced' 或 'best'
+        noise_level: 已估计的噪声水平，fast 档位据此决定是否跳过去噪
+        tile_height: 分块并行处理的分块高度，0 表示不分块
+        max_workers: 分块并行处理的线程数
+
+    Returns:
+        去噪后的灰度图像
+    """
+    if tier == 'fast':
+        if noise_level is not None and noise_level < NOISE_CLEAN_THRESHOLD:
+            return gray
+        return run_tiled(lambda tile: cv2.medianBlur(tile, 3), gray, halo=1,
+                         tile_height=tile_height, max_workers=max_workers)
+    if tier == 'balanced':
+        return run_tiled(lambda tile: cv2.bilateralFilter(tile, 5, 40, 5), gray, halo=2,
+                         tile_height=tile_height, max_workers=max_workers)
+    if tier == 'best':
+        # 重叠边取搜索窗口与模板窗口的半径之和
+        return run_tiled(lambda tile: cv2.fastNlMeansDenoising(tile, None, 10, 7, 21), gray,
+                         halo=21 // 2 + 7 // 2, tile_height=tile_height, max_workers=max_workers)
+    raise ValueError(f"未知的质量档位: {tier}")
+
+def preprocess_image(image, enhance_text=True, tile_height=None, max_workers=None,
+                     quality='auto', report=None):
     """
     图像预处理以提高OCR识别效果
     
     Args:
         image: 输入图像 (OpenCV格式，BGR)
         enhance_text: 是否增强文本
-        
+        tile_height: 分块并行处理的分块高度，None 表示超长图像自动分块，0 表示不分块
+        max_workers: 分块并行处理的线程数，默认使用CPU核心数
+        quality: 不增强文本时的去噪质量档位，'auto' 表示根据噪声水平自动选择
+        report: 可选的字典，用于返回本张图像的处理信息
+            （quality_tier、noise_level、time_taken），便于与OCR置信度和耗时对照
+
     Returns:
         预处理后的图像
     """
+    start_time = time.time()
+    tier = None
+    noise_level = None
+
     # 如果是彩色图像，转换为灰度图像
     if len(image.shape) == 3:
         gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
     else:
         gray = image.copy()
-        
+
     # 检查图像是否为浅色背景深色文字
     is_dark_text = is_dark_text_on_light_background(gray)
-    
+
+    # 超长图像（如长截图）按条带分块并行处理
+    tile_height = _resolve_tile_height(gray, tile_height)
+
     # 如果需要增强文本
     if enhance_text:
         # 应用自适应阈值二值化
         if is_dark_text:
             # 深色文字浅色背景
-            binary = cv2.adaptiveThreshold(
-                gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
-                cv2.THRESH_BINARY, 11, 2
-            )
+            threshold_type = cv2.THRESH_BINARY
         else:
             # 浅色文字深色背景 (反转)
+            threshold_type = cv2.THRESH_BINARY_INV
+
+        def binarize(tile):
             binary = cv2.adaptiveThreshold(
-                gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
-                cv2.THRESH_BINARY_INV, 11, 2
+                tile, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                threshold_type, 11, 2
             )
-        
-        # 应用形态学操作增强文本
-        kernel = np.ones((1, 1), np.uint8)
-        binary = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
-        
+            # 应用形态学操作增强文本
+            kernel = np.ones((1, 1), np.uint8)
+            return cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
+
+        # 重叠边取自适应阈值窗口的半径
+        binary = run_tiled(binarize, gray, halo=11 // 2,
+                           tile_height=tile_height, max_workers=max_workers)
+
         # 如果是代码文本，尝试移除背景噪声
         if detect_code_content(gray):
             binary = remove_background_noise(binary)
@@ -53,14 +216,26 @@ def preprocess_image(image, enhance_text=True):
         processed = cv2.cvtColor(binary, cv2.COLOR_GRAY2BGR)
     else:
         # 如果不需要增强，只应用基本处理
-        # 去噪
-        denoised = cv2.fastNlMeansDenoising(gray, None, 10, 7, 21)
+        # 按质量档位去噪
+        noise_level = estimate_noise_level(gray)
+        tier = select_quality_tier(noise_level) if quality == 'auto' else quality
+        denoised = denoise_image(gray, tier, noise_level, tile_height, max_workers)
         
         # 增强对比度
         enhanced = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8)).apply(denoised)
         
         # 转换回RGB
         processed = cv2.cvtColor(enhanced, cv2.COLOR_GRAY2BGR)
+
+    time_taken = time.time() - start_time
+    if tier is not None:
+        logger.info(f"图像预处理: 质量档位={tier}, 噪声水平={noise_level:.2f}, 耗时={time_taken:.3f}秒")
+    if report is not None:
+        report.update({
+            'quality_tier': tier,
+            'noise_level': noise_level,
+            'time_taken': time_taken
+        })
     
     return processed
 
@@ -239,12 +414,14 @@ def crop_to_content(image):
     
     return cropped
 
-def enhance_for_reading(image):
+def enhance_for_reading(image, tile_height=None, max_workers=None):
     """
     增强图像可读性，适用于阅读而非OCR
     
     Args:
         image: 输入图像
+        tile_height: 分块并行处理的分块高度，None 表示超长图像自动分块，0 表示不分块
+        max_workers: 分块并行处理的线程数，默认使用CPU核心数
         
     Returns:
         增强后的图像
@@ -261,7 +438,10 @@ def enhance_for_reading(image):
     
     # 锐化图像
     kernel = np.array([[-1,-1,-1], [-1,9,-1], [-1,-1,-1]])
-    sharpened = cv2.filter2D(enhanced, -1, kernel)
+    sharpened = run_tiled(
+        lambda tile: cv2.filter2D(tile, -1, kernel), enhanced, halo=1,
+        tile_height=_resolve_tile_height(enhanced, tile_height), max_workers=max_workers
+    )
     
     # 转换回彩色
     result = cv2.cvtColor(sharpened, cv2.COLOR_GRAY2BGR)
@@ -270,46 +450,21 @@ def enhance_for_reading(image):
 
 # 下面的函数用于改进OCR结果
 
-def clean_ocr_text(text):
+_OCR_TEXT_CLEANER = TextPostProcessor()
+_OCR_TEXT_FIXER = TextPostProcessor(fix_confusables=True)
+
+def clean_ocr_text(text, fix_confusables=False):
     """
     清理OCR识别文本
     
     Args:
         text: OCR识别的文本
+        fix_confusables: 是否按上下文修正数字与字母的混淆（如 2O24、wh1le），需要额外扫描全文，速度慢数倍
         
     Returns:
         清理后的文本
     """
-    # 替换常见的OCR错误
-    replacements = {
-        # 中文标点替换为英文标点
-        '；': ';',
-        '：': ':',
-        '，': ',',
-        '"': '"',
-        '"': '"',
-        ''': "'",
-        ''': "'",
-        '（': '(',
-        '）': ')',
-        '【': '[',
-        '】': ']',
-        '《': '<',
-        '》': '>',
-        
-        # 常见OCR错误
-        'l': 'I',  # 小写l容易被识别为大写I
-        '0': 'O',  # 数字0容易被识别为大写O
-        '1': 'l',  # 数字1容易被识别为小写l
-    }
-    
-    # 执行替换
-    for old, new in replacements.items():
-        text = text.replace(old, new)
-    
-    # 删除多余的空行
-    lines = text.split('\n')
-    non_empty_lines = [line for line in lines if line.strip()]
-    cleaned_text = '\n'.join(non_empty_lines)
-    
-    return cleaned_text 
\ No newline at end of file
+    # 规则已预先编译：中文标点逐条用 str.replace 替换（纯ASCII文本跳过），再用一个正则删除空行；
+    # 修正混淆时在两者之间对全文做一次正则扫描
+    cleaner = _OCR_TEXT_FIXER if fix_confusables else _OCR_TEXT_CLEANER
+    return cleaner.process(text) 
\ No newline at end of file
@@ -0,0 +1,212 @@
+"""
+OCR文本后处理引擎 - 规则只编译一次，多处共用
+"""
+import builtins
+import keyword
+import re
+from functools import lru_cache
+from itertools import product
+from typing import Dict, Optional
+
+# 中文标点替换为英文标点
+PUNCTUATION_MAP = {
+    '；': ';',
+    '：': ':',
+    '，': ',',
+    '“': '"',  # 中文左双引号
+    '”': '"',  # 中文右双引号
+    '‘': "'",  # 中文左单引号
+    '’': "'",  # 中文右单引号
+    '（': '(',
+    '）': ')',
+    '【': '[',
+    '】': ']',
+    '《': '<',
+    '》': '>',
+}
+
+# OCRProcessor 使用的替换：中文逗号和书名号在中文正文中是正常的标点，保持不变
+OCR_PUNCTUATION_MAP = {old: new for old, new in PUNCTUATION_MAP.items() if old not in '，《》'}
+
+# 中间的一行或连续多行空行（只含空白字符），替换为一个换行符
+_BLANK_LINES = re.compile(r'\n\s*\n')
+# 开头的空行
+_LEADING_BLANK_LINES = re.compile(r'\s*\n')
+
+# 数字与字母混淆的上下文规则，合并为一个正则，每处候选只在命中时回调一次：
+# 1. 标识符中夹在两个字母之间、被误识别为数字的字母，如 wh1le、c0nst。
+#    代码中有大量本来就带数字的标识符（v1beta1、sha1sum、x1y），
+#    只有把数字换成字母后得到已知的关键字或常用名称时才修正（pr1nt → print）
+# 2. 数字字面量中被误识别为字母的数字，如 2O24、1l0
+# 两条规则的候选都以数字开头，统一用 [0-9] 作为首字符，
+# 使正则引擎可以在C层快速跳过不相关的字符
+_CONFUSABLE_PATTERN = re.compile(
+    r'[0-9](?:'
+    r'(?P<identifier>(?<=[A-Za-z][01])(?=[A-Za-z]))'
+    r'|(?P<number>[OoIl][OoIl0-9]*(?!\w))'
+    r')'
+)
+
+# 数字字面量中的字母到数字的映射
+_NUMBER_FIXES = str.maketrans({'O': '0', 'o': '0', 'I': '1', 'l': '1'})
+
+# 带进制前缀的字面量（0o755、0b1010、0xF1F），其中的字母不是误识别
+_RADIX_PREFIXES = ('0o', '0O', '0b', '0B', '0x', '0X')
+
+# 标识符中的数字可能对应的字母
+_IDENTIFIER_LETTERS = {'0': 'oO', '1': 'liI'}
+
+# 一个标识符中最多尝试修正的数字个数，更多时组合太多，也很可能本来就是数字
+_MAX_IDENTIFIER_FIXES = 3
+
+# 修正标识符时使用的词表：Python 关键字和内置名称，以及其他常见语言的关键字和常用名称
+_KNOWN_WORDS = frozenset(keyword.kwlist) | frozenset(name for name in dir(builtins) if not name.startswith('_')) | frozenset((
+    # C/C++/Java/C#/JavaScript
+    'auto', 'bool', 'boolean', 'break', 'case', 'catch', 'char', 'class', 'const', 'continue', 'default',
+    'define', 'delete', 'do', 'double', 'else', 'endif', 'enum', 'export', 'extends', 'extern', 'final',
+    'finally', 'float', 'for', 'function', 'goto', 'if', 'ifdef', 'ifndef', 'implements', 'import',
+    'include', 'inline', 'instanceof', 'int', 'interface', 'let', 'long', 'namespace', 'new', 'null',
+    'nullptr', 'override', 'package', 'private', 'protected', 'public', 'return', 'short', 'signed',
+    'sizeof', 'static', 'string', 'String', 'struct', 'super', 'switch', 'template', 'this', 'throw',
+    'throws', 'try', 'typedef', 'typename', 'typeof', 'undefined', 'union', 'unsigned', 'using', 'var',
+    'virtual', 'void', 'volatile', 'while', 'console', 'println', 'printf', 'self',
+    # SQL
+    'SELECT', 'FROM', 'WHERE', 'INSERT', 'INTO', 'VALUES', 'UPDATE', 'DELETE', 'CREATE', 'TABLE',
+    'JOIN', 'LEFT', 'INNER', 'ORDER', 'GROUP', 'LIMIT', 'NULL', 'select', 'from', 'where', 'limit',
+    # 常用名称
+    'result', 'value', 'values', 'file', 'line', 'lines', 'list', 'item', 'items', 'index', 'length',
+    'count', 'total', 'name', 'data', 'error', 'info', 'init', 'main', 'args', 'kwargs', 'log', 'config',
+    'model', 'node', 'path', 'text', 'time', 'true', 'false', 'True', 'False', 'None',
+))
+
+
+def _token_start(text: str, pos: int) -> int:
+    """返回 pos 所在单词（字母、数字、下划线）的起始位置"""
+    while pos > 0 and (text[pos - 1].isalnum() or text[pos - 1] == '_'):
+        pos -= 1
+    return pos
+
+
+def _token_end(text: str, pos: int) -> int:
+    """返回 pos 所在单词的结束位置（不含）"""
+    while pos < len(text) and (text[pos].isalnum() or text[pos] == '_'):
+        pos += 1
+    return pos
+
+
+@lru_cache(maxsize=4096)
+def _correct_identifier(token: str) -> str:
+    """
+    把标识符中夹在两个字母之间的 0/1 换成字母，结果是已知的词时返回修正后的标识符，否则原样返回
+
+    本身就是已知的词、或者任何一种替换都得不到已知的词时保持不变。
+    """
+    if token in _KNOWN_WORDS:
+        return token
+    positions = [i for i in range(1, len(token) - 1)
+                 if token[i] in _IDENTIFIER_LETTERS
+                 and token[i - 1].isascii() and token[i - 1].isalpha()
+                 and token[i + 1].isascii() and token[i + 1].isalpha()]
+    if not positions or len(positions) > _MAX_IDENTIFIER_FIXES:
+        return token
+    for letters in product(*(_IDENTIFIER_LETTERS[token[i]] for i in positions)):
+        chars = list(token)
+        for i, letter in zip(positions, letters):
+            chars[i] = letter
+        candidate = ''.join(chars)
+        if candidate in _KNOWN_WORDS:
+            return candidate
+    return token
+
+
+class TextPostProcessor:
+    """
+    OCR文本后处理引擎
+
+    规则在构造时编译一次，OCRProcessor 和 clean_ocr_text 共用同一套实现：
+    - 单字符替换编译为 (旧字符, 新字符) 序列，用 str.replace 执行。实测在 CPython 上，
+      对非ASCII文本 str.translate 需要逐字符查表，比十几次C层 str.replace 慢数倍；
+      而 str.replace 在没有命中时直接返回原字符串，不产生额外拷贝。
+      规则都是非ASCII字符时，纯ASCII文本（常见的英文代码）可以整体跳过。
+    - 数字与字母混淆的修正合并为一个正则，只在真正需要修改的位置回调；
+      标识符是否修正按整个词查表决定，结果按标识符缓存。
+    - 删除空行用一个正则合并中间的空行，只在开头和结尾单独处理，不拆分和重新拼接所有行。
+
+    修正混淆需要对全文做一次正则扫描并在每处修正回调，比其他规则慢得多，因此默认关闭。
+    """
+
+    def __init__(self, char_map: Optional[Dict[str, str]] = None,
+                 fix_confusables: bool = False, remove_empty_lines: bool = True):
+        """
+        Args:
+            char_map: 单字符替换规则，默认使用中文标点映射
+            fix_confusables: 是否根据上下文修正数字与字母的混淆（0/O、1/l）
+            remove_empty_lines: 是否删除空行
+        """
+        char_map = PUNCTUATION_MAP if char_map is None else char_map
+        self.char_rules = tuple((old, new) for old, new in char_map.items() if old != new)
+        # 所有规则都只替换非ASCII字符时，纯ASCII文本无需处理
+        self.skip_ascii = all(not old.isascii() for old, _ in self.char_rules)
+        self.fix_confusables = fix_confusables
+        self.remove_empty_lines = remove_empty_lines
+
+    @staticmethod
+    def _fix_confusable(match: re.Match) -> str:
+        """根据上下文修正数字与字母的混淆"""
+        text = match.group()
+        string = match.string
+        start = match.start()
+        token_start = _token_start(string, start)
+
+        if match.lastgroup == 'number':
+            # 只处理纯数字开头的字面量，标识符中的 x1O 之类保持不变
+            prefix = string[token_start:start]
+            if prefix and not prefix.isdigit():
+                return text
+            # 0o755、0b1l 之类带进制前缀的字面量保持不变
+            if string.startswith(_RADIX_PREFIXES, token_start):
+                return text
+            # 末尾的 l/L 可能是 C/Java 的长整型后缀（100l、100ll），整段保持不变
+            digits = text.rstrip('lL')
+            return digits.translate(_NUMBER_FIXES) + text[len(digits):]
+
+        # 标识符中的 0/1：只有整个标识符修正后是已知的词时才替换
+        token = string[token_start:_token_end(string, start)]
+        return _correct_identifier(token)[start - token_start]
+
+    def process(self, text: str) -> str:
+        """
+        对OCR文本执行全部后处理规则
+
+        Args:
+            text: OCR识别的文本
+
+        Returns:
+            处理后的文本
+        """
+        if not (self.skip_ascii and text.isascii()):
+            for old, new in self.char_rules:
+                text = text.replace(old, new)
+
+        if self.fix_confusables:
+            text = _CONFUSABLE_PATTERN.sub(self._fix_confusable, text)
+
+        if self.remove_empty_lines:
+            text = _remove_empty_lines(text)
+
+        return text
+
+
+def _remove_empty_lines(text: str) -> str:
+    """删除空行和只含空白字符的行，结果与按行（\\n、\\r\\n 或 \\r）拆分、过滤后用换行符拼接相同"""
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    text = _BLANK_LINES.sub('\n', text)
+    leading = _LEADING_BLANK_LINES.match(text)
+    if leading:
+        text = text[leading.end():]
+    # 中间的空行已经合并，结尾最多还剩一行空行（或者末尾的换行符）
+    last = text.rfind('\n') + 1
+    if not text[last:].strip():
+        text = text[:max(last - 1, 0)]
+    return text
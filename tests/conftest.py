@@ -0,0 +1,8 @@
+import os
+import sys
+
+# 测试在没有显示器的环境中运行
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
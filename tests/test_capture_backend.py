@@ -0,0 +1,54 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+import numpy as np
+import pytest
+from PyQt6.QtGui import QImage
+
+from src.core.capture_backend import qimage_to_array
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize('make_view', [
+    'np.asarray(frame)',
+    'frame.view(np.ndarray)',
+    'np.asarray(frame[100:900, 50:1500])',
+    'np.asarray(frame)[:, :10]',
+])
+def test_view_keeps_image_alive_after_qimage_is_deleted(make_view):
+    # 悬空的视图读取时会得到被覆盖的数据或直接崩溃，因此在子进程中检查；
+    # 每种视图单独检查，避免其他视图保留了原数组
+    script = textwrap.dedent("""
+        import gc
+        import numpy as np
+        from PyQt6.QtGui import QImage
+        from src.core.capture_backend import qimage_to_array
+
+        def make_frame():
+            image = QImage(1920, 1080, QImage.Format.Format_RGB32)
+            image.fill(0xFF112233)
+            return qimage_to_array(image)
+
+        frame = make_frame()
+        view = %s
+        del frame
+        gc.collect()
+        # 重新分配内存，QImage 的像素内存若已被释放会被覆盖
+        garbage = [np.ones(3000000) for _ in range(5)]
+        assert (view[..., 0] == 0x33).all()
+        assert (view[..., 2] == 0x11).all()
+    """) % make_view
+    result = subprocess.run([sys.executable, '-c', script], cwd=ROOT, capture_output=True, text=True,
+                            env=dict(os.environ, QT_QPA_PLATFORM='offscreen'))
+    assert result.returncode == 0, result.stderr
+
+
+def test_array_shape_excludes_row_padding():
+    image = QImage(13, 5, QImage.Format.Format_RGB32)
+    image.fill(0xFF010203)
+    frame = qimage_to_array(image)
+    assert frame.shape == (5, 13, 4)
+    assert (frame[..., 0] == 3).all()
@@ -0,0 +1,45 @@
+import time
+
+import numpy as np
+
+from src.core.capture_backend import FrameSource
+from src.core.long_screenshot import LongScreenshotCapture
+
+
+class StaticFrameSource(FrameSource):
+    """画面一直不变，例如已经滚动到底"""
+
+    def grab_probe(self):
+        return np.zeros((8, 8), np.uint8)
+
+
+def make_capture():
+    capture = LongScreenshotCapture(frame_source=StaticFrameSource())
+    capture.is_capturing = True
+    capture.probe_interval = 0.01
+    capture.settle_timeout = 1.0
+    return capture
+
+
+def test_unchanged_frame_is_stable_after_learned_settle_time():
+    capture = make_capture()
+    capture.settle_times = [0.02, 0.03]
+    reference = capture.frame_source.grab_probe()
+
+    start = time.monotonic()
+    assert capture.wait_for_stable_frame(reference)
+    # 没有变化时只等待几次探测，不等到 settle_timeout
+    assert time.monotonic() - start < 0.5
+    # 没有变化的等待不计入稳定时间
+    assert capture.settle_times == [0.02, 0.03]
+
+
+def test_unchanged_frame_waits_for_timeout_before_anything_is_learned():
+    capture = make_capture()
+    capture.settle_timeout = 0.1
+    reference = capture.frame_source.grab_probe()
+
+    start = time.monotonic()
+    assert capture.wait_for_stable_frame(reference)
+    assert time.monotonic() - start >= 0.1
+    assert capture.settle_times == []
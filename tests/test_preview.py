@@ -0,0 +1,25 @@
+import numpy as np
+
+from src.core.preview import ThumbnailPyramid
+
+
+def test_snapshot_of_long_capture_fits_panel():
+    preview = ThumbnailPyramid(width=256)
+    rows = np.random.default_rng(0).integers(0, 256, (20000, 512, 3), dtype=np.uint8)
+    for top in range(0, len(rows), 500):
+        preview.write(top, rows[top:top + 500])
+
+    # 最小的一层也比面板高，缩小到面板内并保持宽高比
+    snapshot = preview.snapshot(200, 300)
+    assert snapshot.shape[0] <= 300 and snapshot.shape[1] <= 200
+    assert snapshot.shape[0] == 300
+    smallest = preview.levels[-1][:preview.heights[-1]]
+    assert abs(snapshot.shape[1] / snapshot.shape[0] - smallest.shape[1] / smallest.shape[0]) < 0.05
+
+
+def test_snapshot_returns_finest_level_that_fits():
+    preview = ThumbnailPyramid(width=256)
+    preview.write(0, np.zeros((400, 512, 3), np.uint8))
+
+    snapshot = preview.snapshot(300, 300)
+    assert snapshot.shape == (200, 256, 3)
@@ -0,0 +1,50 @@
+import gc
+import threading
+
+import numpy as np
+from PyQt6.QtGui import QImage
+
+from src.core.capture_backend import qimage_to_array
+from src.core.session_recording import FRAME_INITIAL, FRAME_SCROLL, CaptureSession, SessionRecorder
+
+
+def grab_frame(value):
+    """模拟屏幕抓取：返回的数组是唯一引用 QImage 的对象"""
+    image = QImage(1920, 1080, QImage.Format.Format_RGB32)
+    image.fill(0xFF000000 | value * 0x010101)
+    return qimage_to_array(image)
+
+
+def test_recording_survives_slow_writer(tmp_path, monkeypatch):
+    write = SessionRecorder._write
+    released = threading.Event()
+
+    def slow_write(self, name, frame):
+        # 写入线程落后于捕获：所有帧都提交并被捕获循环丢弃后才开始写入
+        released.wait(10)
+        write(self, name, frame)
+
+    monkeypatch.setattr(SessionRecorder, '_write', slow_write)
+    path = str(tmp_path / 'session.npz')
+    recorder = SessionRecorder(path)
+    for index in range(6):
+        recorder.add_frame(grab_frame(10 + index), FRAME_INITIAL if index == 0 else FRAME_SCROLL, notches=index)
+    # 捕获循环不再引用帧，已经释放的像素内存会被新的分配覆盖
+    gc.collect()
+    garbage = [np.full(8000000, 7, np.uint8) for _ in range(8)]
+    released.set()
+    recorder.close(settings={})
+    del garbage
+
+    session = CaptureSession(path)
+    try:
+        assert len(session) == 6
+        for index in range(6):
+            frame = session.frame(index)
+            assert frame.shape == (1080, 1920, 4)
+            assert (frame[..., :3] == 10 + index).all()
+            assert (frame[..., 3] == 255).all()
+        assert session.kind(0) == FRAME_INITIAL
+        assert session.frame_info[3]['notches'] == 3
+    finally:
+        session.close()